@@ -0,0 +1,46 @@
+"""user_states.data: JSON -> JSONB (PostgreSQL)
+
+Revision ID: 3b1f0c9d2e47
+Revises: 76442257a804
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b1f0c9d2e47'
+down_revision: Union[str, None] = '76442257a804'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Только PostgreSQL: в JSONB ключи дописываются оператором || без чтения записи (в SQLite — json_set)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column(
+        'user_states',
+        'data',
+        existing_type=sa.JSON(),
+        type_=postgresql.JSONB(),
+        existing_nullable=False,
+        postgresql_using='data::jsonb',
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column(
+        'user_states',
+        'data',
+        existing_type=postgresql.JSONB(),
+        type_=sa.JSON(),
+        existing_nullable=False,
+        postgresql_using='data::json',
+    )
@@ -0,0 +1,27 @@
+"""user_states.agent_blob: сжатое состояние AI-агента
+
+Revision ID: 76442257a804
+Revises: 995f72f71ce0
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '76442257a804'
+down_revision: Union[str, None] = '995f72f71ce0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Старые записи продолжают читаться: ai_agent_state в data переносится в agent_blob при следующем сохранении
+    op.add_column('user_states', sa.Column('agent_blob', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_states', 'agent_blob')
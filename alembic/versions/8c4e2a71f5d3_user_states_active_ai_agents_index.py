@@ -0,0 +1,35 @@
+"""user_states: частичный индекс активных AI-диалогов
+
+Revision ID: 8c4e2a71f5d3
+Revises: 3b1f0c9d2e47
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2a71f5d3'
+down_revision: Union[str, None] = '3b1f0c9d2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_AI_AGENTS = sa.text("conversation_type = 'ai_agent' AND state = 'AI_CONVERSATION'")
+
+
+def upgrade() -> None:
+    # Восстановление агентов при старте читает только активные AI-диалоги — индекс содержит лишь их
+    op.create_index(
+        'ix_user_states_active_ai_agents',
+        'user_states',
+        ['user_id'],
+        postgresql_where=ACTIVE_AI_AGENTS,
+        sqlite_where=ACTIVE_AI_AGENTS,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_states_active_ai_agents', table_name='user_states')
@@ -0,0 +1,41 @@
+"""user_states.user_id: String(50) -> BigInteger
+
+Revision ID: 995f72f71ce0
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '995f72f71ce0'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Telegram ID хранились строкой; индекс по BIGINT меньше и сравнение дешевле
+    with op.batch_alter_table('user_states') as batch_op:
+        batch_op.alter_column(
+            'user_id',
+            existing_type=sa.String(length=50),
+            type_=sa.BigInteger(),
+            existing_nullable=False,
+            postgresql_using='user_id::bigint',
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('user_states') as batch_op:
+        batch_op.alter_column(
+            'user_id',
+            existing_type=sa.BigInteger(),
+            type_=sa.String(length=50),
+            existing_nullable=False,
+            postgresql_using='user_id::varchar(50)',
+        )
@@ -2,13 +2,32 @@
 AI-ассистент для сбора данных через диалог
 """
 import os
+import asyncio
+import json
 import logging
+import re
+from copy import deepcopy
+from itertools import islice
 from typing import Dict, Any, List, Optional, Tuple
 from backend.generator.llm_client import LLMClient
 from backend.config import Config
+from backend.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Результаты LLM-извлечения: (mode, stage, нормализованное сообщение, сводка) -> данные.
+# Промпт извлечения зависит только от этих значений, поэтому повторное сообщение
+# (например, то же описание с Wildberries) не требует нового запроса к LLM.
+_EXTRACTION_CACHE = LRUCache(max_size=Config.AI_EXTRACTION_CACHE_SIZE)
+
+# Первое число в строке цены («1 290 руб» -> 1)
+_PRICE_NUMBER_RE = re.compile(r'(\d+)')
+# Разбор сообщений без LLM (резервное извлечение) и JSON в ответе LLM
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
+_DISCOUNT_RE = re.compile(r'скидк[аи]\s*[:\s]*(\d+)\s*%?|(\d+)\s*%\s*скидк')
+_PRICE_WITH_CURRENCY_RE = re.compile(r'(\d+)\s*(?:BYN|руб|₽|\$|€)', re.IGNORECASE)
+_JSON_OBJECT_RE = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.DOTALL)
+
 
 class LandingAIAgent:
     """ИИ агент для сбора данных через диалог"""
@@ -67,9 +86,37 @@ class LandingAIAgent:
         }
         self.stage = 'general_info'  # general_info -> products -> verification -> generation
         self.max_history_length = 20  # Максимальная длина истории диалога
+        # Кэш hero-файла: (список files, сколько его элементов просмотрено) и найденный файл
+        self._hero_scan: Tuple[Optional[List[Dict]], int] = (None, 0)
+        self._hero_file: Optional[Dict[str, Any]] = None
+        # Одноразовые UI-события бота для этого диалога ('summary_sent', 'missing_data_sent')
+        self.ui_flags: set = set()
+        # Разметка ответов бота в этом диалоге: None — Telegram не разобрал HTML, дальше шлём plain-текст
+        self.parse_mode: Optional[str] = 'HTML'
+        # Состояние изменилось с последнего сохранения в БД (сбрасывает бот при записи)
+        self.dirty = True
         
         logger.info(f"AI Agent initialized with mode: {mode}")
     
+    @property
+    def hero_file(self) -> Optional[Dict[str, Any]]:
+        """
+        Главный файл (первый файл блока hero) или None.
+        
+        Файлы только дописываются в collected_data['files'] и блок у них не меняется,
+        поэтому при каждом обращении просматриваются лишь файлы, добавленные с прошлого раза.
+        """
+        files = self.collected_data.get('files') or []
+        scanned_list, scanned = self._hero_scan
+        if files is not scanned_list or len(files) < scanned:
+            # collected_data заменили (восстановление состояния) — просматриваем заново
+            self._hero_file = None
+            scanned = 0
+        if self._hero_file is None:
+            self._hero_file = next((f for f in islice(files, scanned, None) if f.get('block') == 'hero'), None)
+        self._hero_scan = (files, len(files))
+        return self._hero_file
+    
     async def start_conversation(self) -> str:
         """
         Начать диалог: сначала главное фото + описание, потом остальные фото, затем мини-опрос.
@@ -83,6 +130,7 @@ class LandingAIAgent:
             "💡 /cancel_ai — отменить"
         )
         self.conversation_history.append({'role': 'assistant', 'content': greeting})
+        self.dirty = True
         return greeting
     
     async def process_message(self, message: str, user_id: int, files: List[Dict] = None) -> str:
@@ -104,27 +152,33 @@ class LandingAIAgent:
                 message = f"{message}\n\n[Пользователь отправил файл: {file_info}]"
         
         # Добавляем сообщение пользователя в историю
-        self.conversation_history.append({
-            'role': 'user',
-            'content': message
-        })
-        
-        # Извлекаем данные из сообщения
-        extracted_data = await self._extract_data(message, self.stage)
-        if extracted_data:
-            self._update_collected_data(extracted_data)
-        
-        # Генерируем ответ через LLM
-        response = await self._generate_response()
-        
-        # Добавляем ответ в историю
-        self.conversation_history.append({
-            'role': 'assistant',
-            'content': response
-        })
-        
-        # Проверяем, нужно ли перейти к следующему этапу
-        await self._check_stage_transition()
+        self.dirty = True
+        try:
+            self.conversation_history.append({
+                'role': 'user',
+                'content': message
+            })
+            
+            # Извлекаем данные из сообщения
+            extracted_data = await self._extract_data(message, self.stage)
+            if extracted_data:
+                self._update_collected_data(extracted_data)
+            
+            # Генерируем ответ через LLM
+            response = await self._generate_response()
+            
+            # Добавляем ответ в историю
+            self.conversation_history.append({
+                'role': 'assistant',
+                'content': response
+            })
+            
+            # Проверяем, нужно ли перейти к следующему этапу
+            await self._check_stage_transition()
+        finally:
+            # Фоновое сохранение во время await могло сбросить флаг и записать незавершённый ход —
+            # помечаем снова уже после всех изменений
+            self.dirty = True
         
         return response
     
@@ -137,8 +191,13 @@ class LandingAIAgent:
         """
         if not files:
             return len(self.collected_data.get('files', []))
-        await self._process_files(files)
-        await self._check_stage_transition()
+        self.dirty = True
+        try:
+            await self._process_files(files)
+            await self._check_stage_transition()
+        finally:
+            # См. process_message: флаг мог сбросить фоновый save во время await
+            self.dirty = True
         return len(self.collected_data.get('files', []))
 
     async def _process_files(self, files: List[Dict]) -> Optional[str]:
@@ -181,7 +240,7 @@ class LandingAIAgent:
     def _determine_file_block(self, file_type: str) -> str:
         """Определить, для какого блока предназначен файл"""
         files = self.collected_data.get('files', [])
-        hero_files = [f for f in files if f.get('block') == 'hero']
+        has_hero = self.hero_file is not None
 
         # Первый файл всегда hero (минимальный сценарий: фото + описание)
         if len(files) == 0:
@@ -190,15 +249,15 @@ class LandingAIAgent:
         description_files = [f for f in files if f.get('block') == 'description']
         
         # Если нет hero - это hero
-        if not hero_files:
+        if not has_hero:
             return 'hero'
         
         # Если есть hero и это видео - может быть middle_video
-        if file_type == 'video' and hero_files:
+        if file_type == 'video':
             return 'middle_video'
         
         # Если есть hero и это фото - может быть gallery или description
-        if file_type == 'photo' and hero_files:
+        if file_type == 'photo':
             # Если мало файлов - скорее всего gallery
             if len(gallery_files) < 3:
                 return 'gallery'
@@ -295,8 +354,7 @@ class LandingAIAgent:
             elif 'telegram' in message_lower or 'телеграм' in message_lower or ' тг ' in message_lower or 'тг,' in message_lower:
                 extracted['notification_type'] = 'telegram'
             # Email для заявок (если указан в сообщении)
-            import re
-            email_match = re.search(r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+', message)
+            email_match = _EMAIL_RE.search(message)
             if email_match:
                 extracted['notification_email'] = email_match.group(0)
                 extracted['email'] = email_match.group(0)
@@ -315,8 +373,7 @@ class LandingAIAgent:
                 extracted['notification_telegram_chat_id'] = chat_match.group(1).strip()
 
             # Скидка в hero (процент или текст)
-            import re
-            discount_match = re.search(r'скидк[аи]\s*[:\s]*(\d+)\s*%?|(\d+)\s*%\s*скидк', message_lower)
+            discount_match = _DISCOUNT_RE.search(message_lower)
             if discount_match:
                 pct = discount_match.group(1) or discount_match.group(2)
                 if pct:
@@ -337,8 +394,7 @@ class LandingAIAgent:
                 extracted['product_name'] = (lines[0][:100] if lines else 'Товар')
                 extracted['product_description'] = message.strip()
             # Цена (ищем числа с валютой)
-            import re
-            price_match = re.search(r'(\d+)\s*(?:BYN|руб|₽|\$|€)', message, re.IGNORECASE)
+            price_match = _PRICE_WITH_CURRENCY_RE.search(message)
             if price_match:
                 extracted['new_price'] = f"{price_match.group(1)} BYN"
             old_price_match = re.search(r'(?:было|старая|ранее|раньше)[:\s]+(\d+)\s*(?:BYN|руб|₽)', message, re.IGNORECASE)
@@ -377,6 +433,12 @@ class LandingAIAgent:
     
     async def _llm_extract_data(self, message: str, stage: str) -> Dict[str, Any]:
         """Извлечение данных через LLM (только если простой парсинг не помог)"""
+        cache_key = (self.mode, stage, ' '.join(message.split()), self._get_collected_summary())
+        cached = _EXTRACTION_CACHE.get(cache_key)
+        if cached is not None:
+            # Кэш общий для всех пользователей: вложенные списки/словари попадают в collected_data по ссылке
+            return deepcopy(cached)
+        
         extraction_prompt = f"""Извлеки структурированные данные из следующего сообщения пользователя.
 
 Текущий этап: {stage}
@@ -411,9 +473,6 @@ class LandingAIAgent:
 Верни только JSON, без дополнительного текста."""
         
         try:
-            import json
-            import re
-            
             extraction_messages = [
                 {"role": "system", "content": "Ты помощник для извлечения структурированных данных из текста. Верни только валидный JSON."},
                 {"role": "user", "content": extraction_prompt}
@@ -422,9 +481,12 @@ class LandingAIAgent:
             response_text = await self._call_llm_for_dialogue(extraction_messages, "Верни только JSON с извлеченными данными.")
             
             # Парсим JSON из ответа
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response_text, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(response_text)
             if json_match:
                 extracted = json.loads(json_match.group())
+                if extracted:
+                    _EXTRACTION_CACHE.set(cache_key, extracted)
+                    return deepcopy(extracted)
                 return extracted
         except Exception as e:
             logger.error(f"Error extracting data via LLM: {e}")
@@ -559,8 +621,6 @@ class LandingAIAgent:
     
     async def _call_llm_for_dialogue(self, messages: List[Dict], system_prompt: str) -> str:
         """Вызов LLM для диалога (не для генерации кода) с таймаутом"""
-        import asyncio
-        
         # Таймаут для диалога (меньше, чем для генерации кода)
         timeout = min(Config.LLM_TIMEOUT, 60)  # Максимум 60 секунд для диалога
         
@@ -646,7 +706,6 @@ class LandingAIAgent:
         general = self.collected_data.get('general_info', {})
         if general.get('notification_telegram_token') and general.get('notification_telegram_chat_id'):
             return
-        import re
         for msg in reversed(self.conversation_history[-15:]):
             if msg.get('role') != 'user':
                 continue
@@ -660,6 +719,7 @@ class LandingAIAgent:
                 if m:
                     general['notification_telegram_chat_id'] = m.group(1).strip()
             if general.get('notification_telegram_token') and general.get('notification_telegram_chat_id'):
+                self.dirty = True
                 logger.info("Recovered notification_telegram_token and notification_telegram_chat_id from conversation history")
                 break
 
@@ -871,8 +931,6 @@ class LandingAIAgent:
                     user_data['description_is_wildberries'] = False
             else:
                 # Если товар не собран, используем значения по умолчанию
-                import logging
-                logger = logging.getLogger(__name__)
                 logger.warning("Products not collected, using default values")
                 user_data['product_name'] = 'Товар'
                 user_data['description_text'] = 'Описание товара'
@@ -974,19 +1032,19 @@ class LandingAIAgent:
             if products:
                 product = products[0]
                 
-                # Проверка цены
+                # Проверка цены (каждая строка цены разбирается один раз)
                 new_price = product.get('new_price', '')
                 if new_price:
-                    import re
-                    price_match = re.search(r'(\d+)', str(new_price))
-                    if not price_match or int(price_match.group(1)) <= 0:
+                    price_match = _PRICE_NUMBER_RE.search(str(new_price))
+                    new_price_num = int(price_match.group(1)) if price_match else 0
+                    if new_price_num <= 0:
                         errors.append("Цена должна быть положительным числом")
                 
                 # Проверка старой цены (если указана)
                 old_price = product.get('old_price', '')
                 if old_price and new_price:
-                    new_price_num = int(re.search(r'(\d+)', str(new_price)).group(1)) if re.search(r'(\d+)', str(new_price)) else 0
-                    old_price_num = int(re.search(r'(\d+)', str(old_price)).group(1)) if re.search(r'(\d+)', str(old_price)) else 0
+                    old_match = _PRICE_NUMBER_RE.search(str(old_price))
+                    old_price_num = int(old_match.group(1)) if old_match else 0
                     if old_price_num <= new_price_num:
                         errors.append("Старая цена должна быть больше новой")
         else:  # MULTI
@@ -1008,7 +1066,8 @@ class LandingAIAgent:
             'mode': self.mode,
             'stage': self.stage,
             'collected_data': self.collected_data,
-            'conversation_history': self.conversation_history[-self.max_history_length:]  # Сохраняем только последние N сообщений
+            'conversation_history': self.conversation_history[-self.max_history_length:],  # Сохраняем только последние N сообщений
+            'parse_mode': self.parse_mode
         }
     
     @classmethod
@@ -1033,6 +1092,9 @@ class LandingAIAgent:
             'files': []
         })
         agent.conversation_history = state.get('conversation_history', [])
+        agent.parse_mode = state.get('parse_mode', 'HTML')
+        # Только что прочитан из БД — сохранять нечего
+        agent.dirty = False
         
         logger.info(f"AI Agent restored from state: mode={agent.mode}, stage={agent.stage}")
         return agent
@@ -10,6 +10,7 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from template_selector import TemplateSelector
 from backend.generator.template_loader import TemplateLoader
+from backend.utils.helpers import parse_price
 
 class DataCollector:
     """Класс для сбора данных от пользователя"""
@@ -148,8 +149,8 @@ class DataCollector:
         # Преобразование скидки в процент
         if 'old_price' in formatted and 'new_price' in formatted:
             try:
-                old = float(str(formatted['old_price']).replace('BYN', '').strip())
-                new = float(str(formatted['new_price']).replace('BYN', '').strip())
+                old = parse_price(formatted['old_price'])
+                new = parse_price(formatted['new_price'])
                 discount = int(((old - new) / old) * 100)
                 formatted['discount_percent'] = discount
             except Exception:
@@ -33,9 +33,10 @@ class BaseHandler(ABC):
             user_id: ID пользователя в Telegram
             
         Returns:
-            Словарь с данными пользователя
+            Словарь с данными пользователя (копия: обработчики дописывают вложенные списки
+            до записи, а кэш бота должен совпадать с БД, если запись не удастся)
         """
-        return self.bot._get_user_data(user_id)
+        return self.bot._get_user_data(user_id, copy=True)
     
     def update_user_data(self, user_id: int, **kwargs):
         """
@@ -2,15 +2,24 @@
 Telegram бот для генерации лендингов
 """
 import asyncio
+import heapq
 import logging
 import os
 import warnings
 import re
 import shutil
-from typing import Dict, Any, Optional
-from datetime import datetime
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Tuple
 from telegram import (
     Update,
+    InputFile,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     ReplyKeyboardRemove,
@@ -30,6 +39,7 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
+from telegram.error import BadRequest, RetryAfter
 
 from backend.config import Config
 from backend.generator.code_generator import CodeGenerator
@@ -41,9 +51,18 @@ except ImportError:
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from template_selector import TemplateSelector
+from sqlalchemy import select, update, bindparam, cast, func, literal, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from backend.database.database import SessionLocal, init_db
 from backend.database.models import User, Project, Generation, UserState
+from backend.database.redis_store import RedisUserStateStore
 from backend.utils.rate_limiter import rate_limiter
+from backend.utils.cache import LRUCache
+from backend.utils.metrics import MetricsCollector
+from backend.utils.helpers import json_loads, json_dumps, pack_json, compress_json, unpack_json, parse_price
+from backend.bot.ai_agent import LandingAIAgent
 
 # Импорт обработчиков (используются только для notification_handler в _handle_notification_data)
 from backend.bot.handlers import (
@@ -68,11 +87,123 @@ logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('httpcore').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Подавляем предупреждение PTB: при per_message=False CallbackQueryHandler не привязан к сообщению (приемлемо для нашего flow)
+warnings.filterwarnings("ignore", message=".*per_message.*CallbackQueryHandler.*", category=UserWarning)
+
 # Состояния для AI-агента
 AI_MODE_SELECTION = 1
 AI_CONVERSATION = 2
 AI_GENERATING = 3
 
+# Поля новой структуры (17 пунктов) для генерации: (ключ, значение по умолчанию)
+_GEN_FIELDS = (
+    # Пункт 1: Тип лендинга
+    ('landing_type', None),
+    # Пункт 2: Название товара
+    ('product_name', 'Товар'),
+    # Пункт 1: Hero блок
+    ('hero_media', None),
+    ('hero_media_type', 'photo'),
+    ('hero_media_format', 'jpeg'),
+    ('hero_aspect_ratio', '3:4'),
+    ('hero_discount', None),
+    ('hero_discount_position', None),
+    # Пункт 3: 3 яркие характеристики
+    ('characteristics', []),
+    # Пункт 4: Таймер
+    ('timer_enabled', False),
+    ('timer_type', None),
+    ('timer_date', None),
+    # Пункт 5: Цены
+    ('old_price', '152 BYN'),
+    ('new_price', '99 BYN'),
+    # Пункт 6: Опции формы
+    ('sizes', []),
+    ('colors', []),
+    ('characteristics_list', []),
+    ('form_has_sizes', False),
+    ('form_has_colors', False),
+    ('form_has_characteristics', False),
+    ('form_has_quantity', False),
+    # Пункт 7: Средний блок
+    ('middle_block_type', None),
+    ('middle_video', None),
+    ('middle_video_format', None),
+    ('middle_video_aspect_ratio', None),
+    ('middle_gallery', []),  # Могут быть словари с filename
+    # Пункт 8: Описание
+    ('description_text', ''),
+    ('description_photos', []),  # Могут быть словари с filename
+    ('description_is_wildberries', False),
+    # Пункт 12: Отзывы
+    ('reviews', []),
+    ('reviews_type', None),
+    ('reviews_aspect_ratio', '3:4'),
+    ('reviews_photo_format', 'jpeg'),
+    # Пункт 17: Подвал
+    ('footer_info', {}),
+    # Уведомления
+    ('notification_type', 'telegram'),
+    ('notification_email', ''),
+    ('notification_telegram_token', ''),
+    ('notification_telegram_chat_id', ''),
+    # Дополнительные данные
+    ('photos_dir', ''),
+    ('videos_dir', ''),
+)
+
+# Реквизиты для подвала, если footer_info не заполнен (берутся из data или data['extra_fields'])
+_FOOTER_FIELDS = frozenset(('company_name', 'ip_name', 'unp', 'ogrn', 'inn', 'address', 'phone', 'email'))
+
+# Общий пустой неизменяемый словарь для .get(...) or _EMPTY_MAPPING (без нового {} на каждый промах)
+_EMPTY_MAPPING = MappingProxyType({})
+
+# Разобранные JSON-файлы конфигурации (путь -> данные): читаются один раз на процесс
+_LOAD_JSON_CACHE: Dict[str, Dict] = {}
+
+# Выборка UserState по user_id: один объект запроса на процесс, чтобы срабатывал кэш
+# скомпилированных запросов SQLAlchemy (user_id передаётся через параметр uid)
+_STMT_GET_USER_STATE = select(UserState).where(UserState.user_id == bindparam('uid'))
+
+# Сколько уведомлений о восстановлении диалога отправлять одновременно (лимит Telegram ~30 сообщений/сек)
+RESTORE_NOTIFY_CONCURRENCY = 30
+
+# Рассылка: пачка сообщений, отправляемых параллельно, и пауза между пачками (не выше лимита Telegram ~30 сообщений/сек)
+BROADCAST_BATCH_SIZE = 25
+BROADCAST_BATCH_INTERVAL = 1.0
+
+# Допустимые расширения медиа AI-режима и порядковые числительные для ответа «N-е фото получил»
+MEDIA_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mov', 'webm'})
+_PHOTO_ORDINALS = ('Первое', 'Второе', 'Третье', 'Четвёртое', 'Пятое', 'Шестое', 'Седьмое', 'Восьмое', 'Девятое', 'Десятое')
+
+# Сколько файлов пользователей скачивать из Telegram одновременно (пачки фото не забивают канал и event loop)
+MEDIA_DOWNLOAD_CONCURRENCY = 8
+
+# Отложенная запись состояния AI-агента: за это время сохранения одного хода (после ответа
+# и после смены этапа) сливаются в одну запись, которая выполняется уже после ответа пользователю
+AI_AGENT_SAVE_DELAY = 1.0
+
+# AI-агент выгружается после этой неактивности (сек); last_activity пишется в БД пакетом с этим интервалом
+AI_AGENT_INACTIVE_TIMEOUT = 1800
+AI_ACTIVITY_FLUSH_INTERVAL = 300
+
+# Поля данных пользователя, относящиеся к диалогу с AI-агентом (удаляются при его завершении)
+AI_AGENT_STATE_KEYS = ('ai_agent_state', 'ai_agent_active', 'last_activity')
+
+AI_GENERATION_BUSY_TEXT = "⏳ Генерация уже идёт…"
+# Сколько секунд клиент Telegram кэширует ответ на callback (повторные клики не доходят до бота)
+CALLBACK_ANSWER_CACHE_TIME = 2
+
+
+@dataclass(slots=True)
+class AgentEntry:
+    """Запись реестра AI-агентов: агент, время последней активности и чат пользователя"""
+    agent: Any
+    last_activity: float
+    chat_id: Optional[int] = None
+    # last_activity, уже записанное в БД (сбрасывается пакетно в _flush_ai_activity)
+    saved_activity: Optional[float] = None
+
 
 # Форматы файлов с вариациями для надежности
 FILE_FORMATS = {
@@ -97,12 +228,220 @@ ASPECT_RATIOS = {
 }
 
 
+# Теги <b>/<i> текстов бота; вместе с символами Markdown — для plain-text fallback ответов AI
+_HTML_STRIP_RE = re.compile(r'</?[bi]>')
+_MARKUP_STRIP_RE = re.compile(r'</?[bi]>|[*_`]')
+# Подтверждение генерации текстом в стадии generation: сообщение целиком — одна из коротких команд
+# или содержит корень «генерир»/«создай»/«готов»/«давай» (один проход вместо lower() и поиска по списку)
+_GENERATION_COMMAND_RE = re.compile(
+    r'генерир|создай|готов|давай'
+    r'|^\s*(?:да|начинай|начни|создавай|начинай генерацию|начни генерацию)\s*$',
+    re.IGNORECASE
+)
+# Экранирование спецсимволов Markdown (parse_mode='Markdown') за один проход str.translate
+_MD_ESCAPE_TABLE = str.maketrans({c: '\\' + c for c in '_*[`'})
+
+
+def _strip_html_tags(text: str) -> str:
+    """Убирает теги <b>/<i>, которые используются в текстах бота (за один проход)"""
+    return _HTML_STRIP_RE.sub('', text)
+
+
+def _md_escape(text: str) -> str:
+    """Экранирует _ * [ ` для Markdown-разметки Telegram"""
+    return text.translate(_MD_ESCAPE_TABLE)
+
+
+# Буфер копирования для случаев, когда sendfile/copy_file_range недоступны (по умолчанию 64 KiB)
+shutil.COPY_BUFSIZE = max(shutil.COPY_BUFSIZE, 256 * 1024)
+
+
+def _copy_photo(src: str, dest: str) -> bool:
+    """Копирует фото; False, если исходного файла нет (без отдельного stat перед копированием)"""
+    try:
+        shutil.copy2(src, dest)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _media_downloaded(file_path: str) -> bool:
+    """Файл уже скачан (создаёт каталог для скачивания, если его нет)"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    return os.path.isfile(file_path) and os.path.getsize(file_path) > 0
+
+
+def _remove_file(path: str) -> None:
+    """Удаляет файл, если он есть"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_files(directory: str, prefix: str) -> None:
+    """
+    Удаляет файлы каталога с именем, начинающимся с prefix; ошибка одного файла не мешает удалить остальные.
+    
+    Один проход os.scandir: тип файла берётся из записи каталога, без fnmatch и stat на каждый файл.
+    """
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if not (entry.name.startswith(prefix) and entry.is_file(follow_symlinks=False)):
+                continue
+            try:
+                _remove_file(entry.path)
+                logger.debug(f"Removed temp file: {entry.path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove temp file {entry.path}: {e}")
+
+
+# Тексты /start и /help: HTML и plain-вариант (для fallback при ошибке разметки) собираются один раз
+WELCOME_TEXT_TEMPLATE = """👋 Привет, {name}!
+
+Я помогу тебе создать лендинг для продажи товаров.
+
+🤖 <b>Создание лендинга:</b>
+/ai - Создать лендинг с AI-ассистентом
+
+📚 <b>Помощь:</b>
+/help - Показать помощь"""
+WELCOME_TEXT_PLAIN_TEMPLATE = _strip_html_tags(WELCOME_TEXT_TEMPLATE)
+
+HELP_TEXT = """📚 <b>Команды бота:</b>
+
+/start - Начать работу
+/ai - Создать лендинг с AI-ассистентом
+/myid - Узнать свой Telegram ID
+/help - Эта помощь
+/cancel_ai - Отменить AI-режим
+
+🤖 <b>Как работает AI-ассистент:</b>
+
+1. Выберите режим: один товар или несколько товаров
+2. AI-ассистент задаст вопросы в формате диалога
+3. Отвечайте на вопросы и отправляйте фото/видео
+4. После сбора всех данных AI создаст лендинг
+
+📋 <b>Что собирает AI-ассистент:</b>
+
+• Общая информация (цель сайта, аудитория, стиль)
+• Данные о товарах (название, описание, цена, фото)
+• Настройки уведомлений (email или Telegram)
+• Дополнительные материалы (видео, галереи, отзывы)
+
+⏱ <b>Время генерации:</b> 30-60 секунд
+
+💡 <b>Совет:</b> Отвечайте подробно - это поможет создать более качественный лендинг!"""
+HELP_TEXT_PLAIN = _strip_html_tags(HELP_TEXT)
+
+# Сообщения об ошибках генерации: (ключевые слова в тексте ошибки, сообщение пользователю).
+# Порядок важен — берётся первая категория, ключевое слово которой встретилось
+ERROR_MESSAGES = (
+    (('timeout', 'таймаут'), (
+        "⏱️ **Превышено время ожидания**\n\n"
+        "Генерация заняла слишком много времени.\n\n"
+        "💡 **Что делать:**\n"
+        "• Попробуйте снова через /create\n"
+        "• Уменьшите количество данных (меньше фото, короче описание)\n"
+        "• Проверьте интернет-соединение"
+    )),
+    (('rate limit', '429', 'лимит'), (
+        "⏸️ **Превышен лимит запросов**\n\n"
+        "Слишком много запросов к сервису генерации.\n\n"
+        "💡 **Что делать:**\n"
+        "• Подождите несколько минут\n"
+        "• Попробуйте снова через /create"
+    )),
+    (('network', 'connection', 'сеть'), (
+        "🌐 **Проблема с подключением**\n\n"
+        "Не удалось подключиться к сервису генерации.\n\n"
+        "💡 **Что делать:**\n"
+        "• Проверьте интернет-соединение\n"
+        "• Подождите минуту и попробуйте снова\n"
+        "• Используйте /create для повторной попытки"
+    )),
+    (('api key', 'ключ', 'unauthorized'), (
+        "🔑 **Проблема с настройками**\n\n"
+        "Ошибка конфигурации сервиса генерации.\n\n"
+        "💡 **Что делать:**\n"
+        "• Обратитесь к администратору бота\n"
+        "• Попробуйте позже"
+    )),
+    # Исчерпаны попытки / сервис временно недоступен
+    (('попыток', 'attempts', 'retries'), (
+        "⏳ **Сервис временно перегружен**\n\n"
+        "Не удалось сгенерировать лендинг после нескольких попыток.\n\n"
+        "💡 **Что делать:**\n"
+        "• Подождите 1–2 минуты и нажмите «Да, генерировать» снова\n"
+        "• Или начните заново: /ai"
+    )),
+)
+
+GENERIC_ERROR_MESSAGE = (
+    "❌ **Ошибка при генерации**\n\n"
+    "Не удалось создать лендинг.\n\n"
+    "💡 **Что делать:**\n"
+    "• Попробуйте снова через /create\n"
+    "• Убедитесь, что все данные введены корректно\n"
+    "• Если проблема повторяется, обратитесь к администратору"
+)
+
+# Подпись к архиву с готовым лендингом (parse_mode='Markdown'; template уже экранирован)
+LANDING_READY_CAPTION_TEMPLATE = (
+    "✅ *Лендинг успешно создан!*\n\n"
+    "📁 Шаблон: {template}\n"
+    "⏱ Время генерации: {secs} сек\n\n"
+    "📦 В архиве:\n"
+    "• index.html - главная страница\n"
+    "• css/styles.css - стили\n"
+    "• js/script.js - скрипты\n"
+    "• sendCPA.php - обработчик формы\n\n"
+    "Выберите действие из меню:"
+)
+# Подпись к архиву лендинга, собранного AI-ассистентом
+# Подпись к архиву — итоговое сообщение генерации (отдельное «Готово» после отправки не шлём)
+AI_LANDING_CAPTION = "✅ Лендинг успешно сгенерирован!\n\nЧтобы создать новый — отправьте /ai"
+
+# Все ключевые слова ERROR_MESSAGES в одном регулярном выражении: группа i+1 — категория i.
+# Текст ошибки просматривается один раз вместо отдельного поиска каждого слова
+_ERROR_KEYWORDS_RE = re.compile(
+    '|'.join(f"({'|'.join(map(re.escape, keywords))})" for keywords, _ in ERROR_MESSAGES),
+    re.IGNORECASE
+)
+
+
 class LandingBot:
     """Telegram бот для генерации лендингов"""
     
     def __init__(self):
         """Инициализация бота"""
         self.config = Config
+        # Write-through кэш UserState.data (user_id -> data): снимает SELECT на каждое сообщение
+        self._user_data_cache = LRUCache(max_size=Config.USER_DATA_CACHE_SIZE)
+        # telegram_id -> users.id: повторным пользователям не нужен SELECT/INSERT в users
+        self._user_pk_cache = LRUCache(max_size=Config.USER_DATA_CACHE_SIZE)
+        # Последнее сохранённое состояние AI-агента (user_id -> JSON bytes): повторно одно и то же не пишем.
+        # Любая другая запись данных пользователя сбрасывает снимок
+        self._ai_agent_snapshots = LRUCache(max_size=Config.USER_DATA_CACHE_SIZE)
+        # Отложенные сохранения AI-агентов: user_id -> агент и user_id -> фоновая задача записи
+        self._pending_agent_saves: Dict[int, Any] = {}
+        self._agent_save_tasks: Dict[int, asyncio.Task] = {}
+        # Пользователи, для которых сейчас идёт AI-генерация (повторный запуск отклоняется)
+        self._ai_generating: set = set()
+        # Фоновые задачи (ответы на callback-запросы, удаление файлов, прогрев LLM и т.п.):
+        # ссылки держим до завершения, чтобы задачи не собрал GC
+        self._background_tasks: set = set()
+        # Ограничение параллельных скачиваний медиа (handle_ai_media)
+        self._download_semaphore = asyncio.Semaphore(MEDIA_DOWNLOAD_CONCURRENCY)
+        # Состояние диалога в Redis (если задан REDIS_URL), иначе — таблица user_states
+        self._state_store = RedisUserStateStore.from_config()
+        # ID администраторов (строки): разбираются один раз, проверка — поиск в frozenset
+        self.refresh_admin_ids()
         self.app = Application.builder().token(self.config.TELEGRAM_BOT_TOKEN).build()
         
         # Компоненты
@@ -111,6 +450,8 @@ class LandingBot:
         
         self.template_selector = TemplateSelector(templates, logic)
         self.code_generator = CodeGenerator()
+        # Один LLM-клиент на процесс: vision-анализ hero-фото использует клиент генератора
+        self.llm_client = self.code_generator.llm_client
         self.template_loader = TemplateLoader()
         
         # Инициализация обработчиков
@@ -125,10 +466,27 @@ class LandingBot:
         self.footer_handler = FooterHandler(self)
         self.notification_handler = NotificationHandler(self)
         
-        # AI-агенты для пользователей (user_id -> agent)
-        self.ai_agents = {}
-        # Время последней активности для каждого агента (user_id -> timestamp)
-        self.ai_agents_last_activity = {}
+        # AI-агенты пользователей (user_id -> AgentEntry: агент + время последней активности).
+        # Порядок — от давно неактивных к недавним (LRU): при переполнении выгружается первый
+        self.ai_agents: 'OrderedDict[int, AgentEntry]' = OrderedDict()
+        # Сроки простоя агентов: min-куча (срок, user_id), по одному элементу на пользователя.
+        # Срок проверяется по entry.last_activity при извлечении, поэтому активность кучу не трогает
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self._expiry_tracked: set = set()
+        # Агенты, выгруженные из реестра при переполнении: user_id -> last_activity.
+        # Их срок простоя продолжает отслеживаться, чтобы по истечении удалить файлы и состояние
+        self._unloaded_activity: Dict[int, float] = {}
+        
+        # Кнопки главного меню и кнопки AI-агента: текст/callback_data -> обработчик
+        self._menu_dispatch = {
+            "🤖 Создать лендинг": self.create_mode_selection_command,
+            "📚 Помощь": self.help_command,
+            "❌ Отмена": self.cancel_ai_command,
+        }
+        self._ai_button_dispatch = {
+            "ai_generate": self.handle_ai_generate,
+            "ai_edit": self.handle_ai_edit,
+        }
         
         # Регистрация handlers
         self._register_handlers()
@@ -141,90 +499,311 @@ class LandingBot:
         
         # Главное меню клавиатуры
         self.main_keyboard = self._create_main_keyboard()
+        # Inline-клавиатуры с неизменными кнопками: создаются один раз и переиспользуются
+        self.admin_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
+            [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
+            [InlineKeyboardButton("❌ Закрыть", callback_data="admin_close")],
+        ])
+        self.mode_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📄 Лендинг (1 товар)", callback_data="mode_single")],
+            [InlineKeyboardButton("🌐 Сайт (несколько товаров)", callback_data="mode_multi")]
+        ])
+        self.resume_create_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔄 Продолжить создание", callback_data="resume_create")],
+            [InlineKeyboardButton("🆕 Начать сначала", callback_data="restart_create")],
+            [InlineKeyboardButton("❌ Отмена", callback_data="cancel_create")]
+        ])
+        self.ai_confirm_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Да, генерировать", callback_data="ai_generate")],
+            [InlineKeyboardButton("❌ Нет, исправить", callback_data="ai_edit")]
+        ])
     
     def _load_json(self, path: str) -> Dict:
-        """Загрузка JSON файла"""
-        import json
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        """Загрузка JSON файла (разбирается один раз, повторные вызовы берут из кэша)"""
+        data = _LOAD_JSON_CACHE.get(path)
+        if data is None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = json_loads(f.read())
+            _LOAD_JSON_CACHE[path] = data
+        return data or {}
     
     # ==================== Работа с UserState в БД ====================
     
-    def _save_user_data(self, user_id: int, data: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None):
-        """Сохранение данных пользователя в БД"""
+    @contextmanager
+    def _session(self):
+        """
+        Сессия БД на время блока: rollback при ошибке, возврат соединения в пул в конце.
+        Позволяет выполнить чтение и запись UserState за одно получение соединения.
+        """
         db = SessionLocal()
         try:
-            user_id_str = str(user_id)
-            user_state = db.query(UserState).filter(
-                UserState.user_id == user_id_str
-            ).first()
-            
-            if user_state:
-                user_state.data = data
-                if state is not None:
-                    user_state.state = state
-                if conversation_type is not None:
-                    user_state.conversation_type = conversation_type
-                user_state.updated_at = datetime.utcnow()
-            else:
-                user_state = UserState(
-                    user_id=user_id_str,
-                    data=data,
-                    state=state,
-                    conversation_type=conversation_type
-                )
-                db.add(user_state)
-            
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error saving user data: {e}")
+            yield db
+        except Exception:
             db.rollback()
+            raise
         finally:
             db.close()
     
-    def _get_user_data(self, user_id: int) -> Dict[str, Any]:
-        """Получение данных пользователя из БД"""
-        db = SessionLocal()
+    def _save_telegram_user(self, tg_user):
+        """Создать запись пользователя, если её ещё нет (отдельная транзакция)"""
+        with self._session() as db:
+            self._upsert_user(db, tg_user)
+            db.commit()
+    
+    def _upsert_user(self, db, tg_user) -> int:
+        """
+        id пользователя в БД по telegram_id; создаёт запись, если её нет.
+
+        INSERT ... ON CONFLICT DO NOTHING RETURNING id — один запрос для нового пользователя
+        и без гонки при параллельных генерациях. Коммит остаётся за вызывающим кодом.
+        Кэшируются только id уже существующих записей: только что вставленная строка
+        может быть откачена вместе с транзакцией вызывающего кода.
+        """
+        telegram_id = str(tg_user.id)
+        user_pk = self._user_pk_cache.get(telegram_id)
+        if user_pk is not None:
+            return user_pk
+        
+        dialect = db.get_bind().dialect.name
+        insert = {'postgresql': pg_insert, 'sqlite': sqlite_insert}.get(dialect)
+        if insert is not None:
+            stmt = insert(User).values(
+                telegram_id=telegram_id,
+                username=tg_user.username,
+                first_name=tg_user.first_name,
+                last_name=tg_user.last_name
+            ).on_conflict_do_nothing(index_elements=['telegram_id']).returning(User.id)
+            row = db.execute(stmt).first()
+            if row is not None:
+                return row[0]
+            user_pk = db.scalar(select(User.id).where(User.telegram_id == telegram_id))
+            self._user_pk_cache.set(telegram_id, user_pk)
+            return user_pk
+
+        # Прочие диалекты: обычный get-or-create
+        user_pk = db.scalar(select(User.id).where(User.telegram_id == telegram_id))
+        if user_pk is not None:
+            self._user_pk_cache.set(telegram_id, user_pk)
+        else:
+            db_user = User(
+                telegram_id=telegram_id,
+                username=tg_user.username,
+                first_name=tg_user.first_name,
+                last_name=tg_user.last_name
+            )
+            db.add(db_user)
+            db.flush()
+            user_pk = db_user.id
+        return user_pk
+    
+    @staticmethod
+    def _query_user_state(db, user_id: int) -> Optional[UserState]:
+        """Запись UserState пользователя в рамках уже открытой сессии"""
+        return db.execute(_STMT_GET_USER_STATE, {'uid': user_id}).scalar_one_or_none()
+    
+    @staticmethod
+    def _row_data(user_state: UserState, *, with_agent: bool = True) -> Dict[str, Any]:
+        """Данные записи UserState вместе с распакованным состоянием AI-агента (with_agent=False — без него)"""
+        data = dict(user_state.data or {})
+        if with_agent and user_state.agent_blob is not None:
+            data['ai_agent_state'] = unpack_json(user_state.agent_blob)
+        return data
+    
+    @staticmethod
+    def _write_user_state(db, user_state: Optional[UserState], user_id: int, data: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None, agent_json: Optional[bytes] = None):
+        """
+        Обновление найденной записи UserState или создание новой в рамках открытой сессии (без commit).
+        Состояние AI-агента (ai_agent_state) хранится отдельно, сжатым в agent_blob;
+        agent_json — уже сериализованное data['ai_agent_state'] (чтобы не сериализовать повторно).
+        """
+        agent_state = data.get('ai_agent_state')
+        if 'ai_agent_state' in data:
+            data = {key: value for key, value in data.items() if key != 'ai_agent_state'}
+        if agent_state is None:
+            agent_blob = None
+        elif agent_json is not None:
+            agent_blob = compress_json(agent_json)
+        else:
+            agent_blob = pack_json(agent_state)
+        if user_state:
+            user_state.data = data
+            user_state.agent_blob = agent_blob
+            if state is not None:
+                user_state.state = state
+            if conversation_type is not None:
+                user_state.conversation_type = conversation_type
+        else:
+            db.add(UserState(
+                user_id=user_id,
+                data=data,
+                agent_blob=agent_blob,
+                state=state,
+                conversation_type=conversation_type
+            ))
+    
+    @staticmethod
+    def _is_same_user_state(user_state: Optional[UserState], data: Dict[str, Any], state: Optional[str], conversation_type: Optional[str], cached: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Запись UserState уже содержит эти данные и состояние (повторное сохранение не нужно).
+        
+        agent_blob не распаковывается: состояние агента сравнивается с write-through кэшем (cached),
+        без него запись считается изменённой.
+        """
+        if user_state is None:
+            return False
+        if state is not None and user_state.state != state:
+            return False
+        if conversation_type is not None and user_state.conversation_type != conversation_type:
+            return False
+        agent_state = data.get('ai_agent_state')
+        if agent_state is None:
+            if user_state.agent_blob is not None:
+                return False
+        elif user_state.agent_blob is None or cached is None or cached.get('ai_agent_state') != agent_state:
+            return False
+        return (user_state.data or {}) == {key: value for key, value in data.items() if key != 'ai_agent_state'}
+    
+    def _save_user_data(self, user_id: int, data: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None):
+        """Сохранение данных пользователя в БД (без UPDATE, если ничего не изменилось)"""
+        # Кэш совпадает с сохранёнными данными, а состояние не меняется — писать нечего.
+        # Сам закэшированный словарь (copy=False) мог быть изменён на месте, его не сравниваем
+        cached = self._user_data_cache.get(user_id)
+        if state is None and conversation_type is None and cached is not data and cached == data:
+            return
+        self._ai_agent_snapshots.pop(user_id)
         try:
-            user_id_str = str(user_id)
-            user_state = db.query(UserState).filter(
-                UserState.user_id == user_id_str
-            ).first()
-            
-            if user_state:
-                return user_state.data.copy() if user_state.data else {}
-            return {}
+            if self._state_store:
+                self._state_store.save(user_id, data, state, conversation_type)
+            else:
+                with self._session() as db:
+                    user_state = self._query_user_state(db, user_id)
+                    if not self._is_same_user_state(user_state, data, state, conversation_type, None if cached is data else cached):
+                        self._write_user_state(db, user_state, user_id, data, state, conversation_type)
+                        db.commit()
+            self._user_data_cache.set(user_id, deepcopy(data))
         except Exception as e:
-            logger.error(f"Error getting user data: {e}")
-            return {}
-        finally:
-            db.close()
+            logger.error(f"Error saving user data: {e}")
+            self._user_data_cache.pop(user_id)
+    
+    def _get_user_data(self, user_id: int, *, copy: bool = True) -> Dict[str, Any]:
+        """
+        Получение данных пользователя (из кэша, при промахе — из БД)
+        
+        По умолчанию возвращается копия: изменения вызывающего кода не попадают в кэш до записи.
+        copy=False (сам закэшированный словарь, без deepcopy) — только для проверенных мест,
+        которые данные лишь читают.
+        """
+        data = self._user_data_cache.get(user_id)
+        if data is None:
+            try:
+                if self._state_store:
+                    record = self._state_store.load(user_id)
+                    data = (record.get('data') if record else None) or {}
+                else:
+                    with self._session() as db:
+                        user_state = self._query_user_state(db, user_id)
+                        data = self._row_data(user_state) if user_state else {}
+            except Exception as e:
+                logger.error(f"Error getting user data: {e}")
+                return {}
+            self._user_data_cache.set(user_id, data)
+        return deepcopy(data) if copy else data
     
     def _clear_user_data(self, user_id: int):
         """Очистка данных пользователя из БД"""
-        db = SessionLocal()
+        self._user_data_cache.pop(user_id)
+        self._ai_agent_snapshots.pop(user_id)
         try:
-            user_id_str = str(user_id)
-            user_state = db.query(UserState).filter(
-                UserState.user_id == user_id_str
-            ).first()
-            
-            if user_state:
-                db.delete(user_state)
-                db.commit()
+            if self._state_store:
+                self._state_store.delete(user_id)
+                return
+            with self._session() as db:
+                user_state = self._query_user_state(db, user_id)
+                if user_state:
+                    db.delete(user_state)
+                    db.commit()
         except Exception as e:
             logger.error(f"Error clearing user data: {e}")
-            db.rollback()
-        finally:
-            db.close()
+    
+    @staticmethod
+    def _json_patch(db, fields: Dict[str, Any]):
+        """
+        SQL-выражение «UserState.data, дополненное fields» (как dict.update) для UPDATE без чтения записи:
+        в PostgreSQL — JSONB-оператор ||, в SQLite — json_set. None, если диалект не поддерживается.
+        """
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            return UserState.data.op('||')(cast(literal(fields, JSONB), JSONB))
+        if dialect == 'sqlite':
+            args = []
+            for key, value in fields.items():
+                args += [f'$."{key}"', func.json(json_dumps(value).decode('utf-8'))]
+            return func.json_set(UserState.data, *args)
+        return None
+    
+    @staticmethod
+    def _json_remove(db, keys):
+        """
+        SQL-выражение «UserState.data без ключей keys» для UPDATE без чтения записи:
+        в PostgreSQL — JSONB-оператор -, в SQLite — json_remove. None, если диалект не поддерживается.
+        """
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            expr = UserState.data
+            for key in keys:
+                expr = expr.op('-')(literal(key))
+            return expr
+        if dialect == 'sqlite':
+            return func.json_remove(UserState.data, *[f'$."{key}"' for key in keys])
+        return None
+    
+    def _merge_user_data(self, user_id: int, fields: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None, agent_json: Optional[bytes] = None) -> Dict[str, Any]:
+        """
+        Дописать поля в сохранённые данные пользователя (чтение и запись в одной сессии); возвращает итоговые данные.
+        
+        Если данные пользователя есть в кэше и состояние агента не меняется, поля дописываются
+        одним UPDATE на стороне БД (_json_patch) — без чтения и перезаписи всего объекта.
+        agent_json — сериализованное fields['ai_agent_state'], если оно уже есть у вызывающего кода.
+        """
+        self._ai_agent_snapshots.pop(user_id)
+        cached = self._user_data_cache.get(user_id)
+        if not self._state_store and cached is not None and 'ai_agent_state' not in fields:
+            with self._session() as db:
+                patch = self._json_patch(db, fields)
+                if patch is not None:
+                    values = {'data': patch}
+                    if state is not None:
+                        values['state'] = state
+                    if conversation_type is not None:
+                        values['conversation_type'] = conversation_type
+                    result = db.execute(update(UserState).where(UserState.user_id == user_id).values(**values))
+                    if result.rowcount:
+                        db.commit()
+                        return {**cached, **fields}
+        if self._state_store:
+            record = self._state_store.load(user_id) or {}
+            data = dict(record.get('data') or {})
+            data.update(fields)
+            self._state_store.save(user_id, data, state, conversation_type, record=record)
+            return data
+        with self._session() as db:
+            user_state = self._query_user_state(db, user_id)
+            # Старое состояние агента будет перезаписано — не распаковываем его
+            data = self._row_data(user_state, with_agent='ai_agent_state' not in fields) if user_state else {}
+            data.update(fields)
+            self._write_user_state(db, user_state, user_id, data, state, conversation_type, agent_json=agent_json)
+            db.commit()
+        return data
     
     def _update_user_data(self, user_id: int, **kwargs):
         """Обновление конкретных полей данных пользователя"""
-        data = self._get_user_data(user_id)
-        data.update(kwargs)
-        self._save_user_data(user_id, data)
+        try:
+            data = self._merge_user_data(user_id, kwargs)
+            self._user_data_cache.set(user_id, deepcopy(data))
+        except Exception as e:
+            logger.error(f"Error updating user data: {e}")
+            self._user_data_cache.pop(user_id)
     
     def _save_ai_agent_state(self, user_id: int, agent):
         """
@@ -234,104 +813,250 @@ class LandingBot:
             user_id: ID пользователя
             agent: Экземпляр LandingAIAgent
         """
+        # Агент не менялся, а последняя записанная версия не перезаписана другими данными — не сериализуем заново
+        if not agent.dirty and user_id in self._ai_agent_snapshots:
+            logger.debug(f"AI agent state not modified for user {user_id}, skip save")
+            return
+        # Флаг сбрасывается до сериализации: изменения, сделанные во время записи, попадут в следующее сохранение
+        agent.dirty = False
         try:
             agent_state = agent.serialize_state()
-            # Сохраняем состояние агента в данных пользователя
-            user_data = self._get_user_data(user_id)
-            user_data['ai_agent_state'] = agent_state
-            user_data['ai_agent_active'] = True
-            
-            # Сохраняем в БД с состоянием ConversationHandler
-            self._save_user_data(
-                user_id, 
-                user_data, 
+            # Состояние не изменилось с прошлого сохранения (и данные пользователя с тех пор не перезаписывались) — пропускаем запись
+            snapshot = json_dumps(agent_state)
+            if self._ai_agent_snapshots.get(user_id) == snapshot:
+                logger.debug(f"AI agent state unchanged for user {user_id}, skip save")
+                return
+            # Сохраняем вместе с состоянием ConversationHandler
+            user_data = self._merge_user_data(
+                user_id,
+                {'ai_agent_state': agent_state, 'ai_agent_active': True},
                 state='AI_CONVERSATION',
-                conversation_type='ai_agent'
+                conversation_type='ai_agent',
+                agent_json=snapshot
             )
+            # Остальные поля прочитаны из хранилища заново; состояние агента ссылается на живой агент —
+            # в кэш кладём его копию из уже готового JSON (дешевле deepcopy)
+            user_data['ai_agent_state'] = json_loads(snapshot)
+            self._user_data_cache.set(user_id, user_data)
+            self._ai_agent_snapshots.set(user_id, snapshot)
             logger.debug(f"AI agent state saved for user {user_id}")
         except Exception as e:
             logger.error(f"Error saving AI agent state for user {user_id}: {e}", exc_info=True)
+            self._user_data_cache.pop(user_id)
+            agent.dirty = True
+    
+    # Асинхронные обёртки: синхронные запросы к БД выполняются в пуле потоков,
+    # чтобы не блокировать event loop (остальные апдейты обрабатываются параллельно)
+    
+    async def _get_user_data_async(self, user_id: int, *, copy: bool = True) -> Dict[str, Any]:
+        # Попадание в кэш отвечает сразу, без переключения в поток (повторные чтения в одном апдейте)
+        data = self._user_data_cache.get(user_id)
+        if data is not None:
+            return deepcopy(data) if copy else data
+        return await asyncio.to_thread(self._get_user_data, user_id, copy=copy)
+    
+    async def _save_user_data_async(self, user_id: int, data: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None):
+        await asyncio.to_thread(self._save_user_data, user_id, data, state, conversation_type)
+    
+    async def _update_user_data_async(self, user_id: int, **kwargs):
+        await asyncio.to_thread(self._update_user_data, user_id, **kwargs)
+    
+    async def _clear_user_data_async(self, user_id: int):
+        await asyncio.to_thread(self._clear_user_data, user_id)
+    
+    async def _save_ai_agent_state_async(self, user_id: int, agent):
+        await asyncio.to_thread(self._save_ai_agent_state, user_id, agent)
+    
+    def _schedule_ai_agent_save(self, user_id: int, agent):
+        """
+        Отложенное сохранение состояния AI-агента (вне пути ответа пользователю).
+        
+        Повторные вызовы до записи сливаются: сохраняется последнее состояние, один раз.
+        """
+        self._pending_agent_saves[user_id] = agent
+        task = self._agent_save_tasks.get(user_id)
+        if task is None or task.done():
+            self._agent_save_tasks[user_id] = asyncio.create_task(self._run_ai_agent_save(user_id))
+    
+    async def _run_ai_agent_save(self, user_id: int):
+        """Фоновая запись состояния агента; изменения, пришедшие во время записи, пишутся следом"""
+        try:
+            await asyncio.sleep(AI_AGENT_SAVE_DELAY)
+            while user_id in self._pending_agent_saves:
+                agent = self._pending_agent_saves.pop(user_id)
+                await self._save_ai_agent_state_async(user_id, agent)
+        finally:
+            self._agent_save_tasks.pop(user_id, None)
+    
+    async def _flush_ai_agent_saves(self, user_id: Optional[int] = None):
+        """Дождаться отложенных сохранений пользователя (или всех пользователей, если user_id=None)"""
+        if user_id is None:
+            tasks = list(self._agent_save_tasks.values())
+        else:
+            tasks = [t for t in (self._agent_save_tasks.get(user_id),) if t is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _discard_ai_agent_save(self, user_id: int):
+        """Отменить отложенное сохранение (агент завершён) и дождаться уже начатой записи"""
+        self._pending_agent_saves.pop(user_id, None)
+        await self._flush_ai_agent_saves(user_id)
+    
+    def _load_active_ai_agents(self) -> List[Tuple[int, Dict[str, Any], Optional[int]]]:
+        """(user_id, data, chat_id) пользователей с активным AI-агентом — один запрос вместе с записью User (для chat_id)"""
+        with self._session() as db:
+            return [
+                (user_state.user_id, self._row_data(user_state), int(db_user.telegram_id) if db_user else None)
+                for user_state, db_user in db.query(UserState, User).outerjoin(
+                    User, User.telegram_id == cast(UserState.user_id, String)
+                ).filter(
+                    UserState.conversation_type == 'ai_agent',
+                    UserState.state == 'AI_CONVERSATION'
+                )
+            ]
     
     async def _restore_ai_agents_from_db(self):
         """
         Восстановить AI-агентов из БД при старте бота
         Отправляет уведомление пользователям о восстановлении диалога
         """
-        db = SessionLocal()
         try:
-            from backend.bot.ai_agent import LandingAIAgent
-            
-            # Находим всех пользователей с активными AI-агентами
-            active_agents = db.query(UserState).filter(
-                UserState.conversation_type == 'ai_agent',
-                UserState.state == 'AI_CONVERSATION'
-            ).all()
+            # (user_id, data, chat_id по умолчанию) активных AI-агентов
+            if self._state_store:
+                # В личном чате chat_id совпадает с user_id
+                active_agents = [
+                    (user_id, user_data, user_id)
+                    for user_id, user_data in self._state_store.iter_ai_agents()
+                ]
+            else:
+                active_agents = await asyncio.to_thread(self._load_active_ai_agents)
+            # Регистрируем от давно неактивных к недавним — порядок реестра (LRU) совпадает с активностью
+            active_agents.sort(key=lambda item: item[1].get('last_activity', float('inf')))
             
             restored_count = 0
-            for user_state in active_agents:
+            notifications = []
+            semaphore = asyncio.Semaphore(RESTORE_NOTIFY_CONCURRENCY)
+            for user_id, user_data, default_chat_id in active_agents:
                 try:
-                    user_id = int(user_state.user_id)
-                    user_data = user_state.data or {}
-                    
                     if 'ai_agent_state' in user_data:
                         agent_state = user_data['ai_agent_state']
                         agent = LandingAIAgent.from_serialized_state(agent_state)
                         
-                        # Восстанавливаем агента
-                        self.ai_agents[user_id] = agent
-                        
                         # Восстанавливаем время последней активности (если есть)
                         if 'last_activity' in user_data:
-                            import time
-                            self.ai_agents_last_activity[user_id] = user_data['last_activity']
+                            last_activity = user_data['last_activity']
                         else:
                             # Если нет времени активности, ставим текущее время минус 5 минут
                             # чтобы не удалить сразу при очистке
-                            import time
-                            self.ai_agents_last_activity[user_id] = time.time() - 300
+                            last_activity = time.time() - 300
+                        
+                        # chat_id из user_data, иначе из User (получен JOIN'ом) или user_id
+                        chat_id = user_data.get('chat_id') or default_chat_id
+                        
+                        # Восстанавливаем агента
+                        self._register_ai_agent(user_id, AgentEntry(agent, last_activity, chat_id, user_data.get('last_activity')))
                         
                         restored_count += 1
                         logger.info(f"Restored AI agent for user {user_id}, stage: {agent.stage}")
                         
-                        # Отправляем уведомление пользователю о восстановлении диалога
-                        try:
-                            # Получаем chat_id из user_data или из UserState
-                            chat_id = user_data.get('chat_id')
-                            if not chat_id:
-                                # Пытаемся получить из User модели
-                                db_user = db.query(User).filter(User.telegram_id == str(user_id)).first()
-                                if db_user:
-                                    chat_id = int(db_user.telegram_id)
-                            
-                            if chat_id:
-                                stage_info = agent._get_stage_info()
-                                await self.app.bot.send_message(
-                                    chat_id=chat_id,
-                                    text=f"✅ Диалог восстановлен. Продолжаем с этапа: {stage_info}\n\n"
-                                         f"Вы можете продолжить работу с AI-ассистентом.",
-                                    parse_mode='HTML'
-                                )
-                                logger.info(f"Sent restoration notification to user {user_id}")
-                        except Exception as notify_error:
-                            logger.warning(f"Could not send restoration notification to user {user_id}: {notify_error}")
+                        if chat_id:
+                            notifications.append(
+                                self._notify_ai_agent_restored(user_id, chat_id, agent, semaphore)
+                            )
                     else:
                         # Если нет состояния агента, но есть запись - очищаем
                         logger.warning(f"User {user_id} has ai_agent conversation_type but no agent state, clearing")
-                        self._clear_user_data(user_id)
+                        await self._clear_user_data_async(user_id)
                 except Exception as e:
-                    logger.error(f"Error restoring AI agent for user {user_state.user_id}: {e}", exc_info=True)
+                    logger.error(f"Error restoring AI agent for user {user_id}: {e}", exc_info=True)
                     # Очищаем некорректное состояние
                     try:
-                        self._clear_user_data(int(user_state.user_id))
+                        await self._clear_user_data_async(user_id)
                     except Exception:
                         pass
             
+            # Уведомления о восстановлении отправляем параллельно
+            if notifications:
+                await asyncio.gather(*notifications, return_exceptions=True)
+            
             if restored_count > 0:
                 logger.info(f"Restored {restored_count} AI agents from database")
         except Exception as e:
             logger.error(f"Error restoring AI agents from database: {e}", exc_info=True)
-        finally:
-            db.close()
+    
+    async def _get_ai_agent_entry(self, user_id: int, chat_id: Optional[int] = None) -> Optional[AgentEntry]:
+        """
+        AI-агент пользователя: из реестра процесса, иначе из сохранённого состояния (Redis/БД).
+        
+        Сообщение может прийти в другой экземпляр бота (несколько реплик с общим Redis)
+        или после рестарта — тогда агент поднимается из ai_agent_state без участия пользователя.
+        """
+        entry = self.ai_agents.get(user_id)
+        if entry is not None:
+            return entry
+        user_data = await self._get_user_data_async(user_id, copy=False)
+        if not user_data.get('ai_agent_active') or 'ai_agent_state' not in user_data:
+            return None
+        try:
+            # Агент хранит collected_data/историю по ссылке и меняет их на месте — отдаём ему копию, а не кэш
+            agent = LandingAIAgent.from_serialized_state(deepcopy(user_data['ai_agent_state']))
+        except Exception as e:
+            logger.error("Error loading AI agent state for user %s: %s", user_id, e, exc_info=True)
+            return None
+        # Пока восстанавливали, агента мог создать другой апдейт этого пользователя
+        entry = self.ai_agents.get(user_id)
+        if entry is None:
+            entry = self._register_ai_agent(user_id, AgentEntry(
+                agent,
+                user_data.get('last_activity', time.time()),
+                user_data.get('chat_id') or chat_id,
+                user_data.get('last_activity'),
+            ))
+        logger.info("AI agent loaded from saved state for user %s, stage: %s", user_id, entry.agent.stage)
+        return entry
+    
+    def _register_ai_agent(self, user_id: int, entry: AgentEntry) -> AgentEntry:
+        """
+        Добавить агента в реестр процесса, не превышая Config.MAX_AI_AGENTS.
+        
+        При переполнении выгружаются давно неактивные агенты (начало LRU-порядка, O(1) на агента):
+        их состояние уже сохранено, и при следующем сообщении агент поднимается через _get_ai_agent_entry.
+        """
+        self.ai_agents[user_id] = entry
+        self.ai_agents.move_to_end(user_id)
+        self._unloaded_activity.pop(user_id, None)
+        if user_id not in self._expiry_tracked:
+            self._expiry_tracked.add(user_id)
+            heapq.heappush(self._expiry_heap, (entry.last_activity + AI_AGENT_INACTIVE_TIMEOUT, user_id))
+        unloaded = 0
+        while len(self.ai_agents) > max(Config.MAX_AI_AGENTS, 1):
+            unloaded_id, unloaded_entry = self.ai_agents.popitem(last=False)
+            self._unloaded_activity[unloaded_id] = unloaded_entry.last_activity
+            unloaded += 1
+        if unloaded:
+            logger.info(f"AI agents registry full, unloaded {unloaded} least active agents")
+        return entry
+    
+    def _touch_ai_agent(self, user_id: int, entry: AgentEntry):
+        """Отметить активность агента: время для выгрузки по простою и позиция в LRU-порядке реестра"""
+        entry.last_activity = time.time()
+        if self.ai_agents.get(user_id) is entry:
+            self.ai_agents.move_to_end(user_id)
+    
+    async def _notify_ai_agent_restored(self, user_id: int, chat_id: int, agent, semaphore: asyncio.Semaphore):
+        """Уведомление пользователя о восстановлении диалога (ограничено семафором по лимитам Telegram)"""
+        async with semaphore:
+            try:
+                stage_info = agent._get_stage_info()
+                await self.app.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"✅ Диалог восстановлен. Продолжаем с этапа: {stage_info}\n\n"
+                         f"Вы можете продолжить работу с AI-ассистентом.",
+                    parse_mode='HTML'
+                )
+                logger.info(f"Sent restoration notification to user {user_id}")
+            except Exception as notify_error:
+                logger.warning(f"Could not send restoration notification to user {user_id}: {notify_error}")
     
     def _register_handlers(self):
         """Регистрация обработчиков команд"""
@@ -358,8 +1083,6 @@ class LandingBot:
         # Команда отмены AI-режима
         self.app.add_handler(CommandHandler("cancel_ai", self.cancel_ai_command))
         
-        # Подавляем предупреждение PTB: при per_message=False CallbackQueryHandler не привязан к сообщению (приемлемо для нашего flow)
-        warnings.filterwarnings("ignore", message=".*per_message.*CallbackQueryHandler.*", category=UserWarning)
         # ConversationHandler для AI-агента (группа 1 - приоритет)
         ai_agent_handler = ConversationHandler(
             entry_points=[
@@ -400,40 +1123,23 @@ class LandingBot:
         # Обработчики кнопок генерации также вне ConversationHandler как fallback
         # (на случай, если ConversationHandler не активен или не обработает callback)
         # Проверяем наличие AI-агента перед обработкой
-        async def handle_ai_generate_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-            """Fallback обработчик для кнопки генерации вне ConversationHandler"""
+        async def handle_ai_button_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            """Fallback обработчик кнопок генерации/редактирования вне ConversationHandler"""
             if not update.callback_query:
                 return
-            if update.callback_query.data != "ai_generate":
+            handler = self._ai_button_dispatch.get(update.callback_query.data)
+            if handler is None:
                 return
             
             user_id = update.callback_query.from_user.id
-            if user_id in self.ai_agents:
-                logger.info(f"Fallback handler (group=0): User {user_id} clicked generate button")
+            if await self._get_ai_agent_entry(user_id) is not None:
+                logger.info(f"Fallback handler (group=0): User {user_id} clicked {update.callback_query.data} button")
                 # Вызываем основной обработчик
-                result = await self.handle_ai_generate(update, context)
-                return result
+                return await handler(update, context)
             else:
                 logger.warning(f"Fallback handler: AI agent not found for user {user_id}")
         
-        async def handle_ai_edit_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-            """Fallback обработчик для кнопки редактирования вне ConversationHandler"""
-            if not update.callback_query:
-                return
-            if update.callback_query.data != "ai_edit":
-                return
-            
-            user_id = update.callback_query.from_user.id
-            if user_id in self.ai_agents:
-                logger.info(f"Fallback handler (group=0): User {user_id} clicked edit button")
-                # Вызываем основной обработчик
-                result = await self.handle_ai_edit(update, context)
-                return result
-            else:
-                logger.warning(f"Fallback handler: AI agent not found for user {user_id}")
-        
-        self.app.add_handler(CallbackQueryHandler(handle_ai_generate_fallback, pattern="^ai_generate$"), group=0)
-        self.app.add_handler(CallbackQueryHandler(handle_ai_edit_fallback, pattern="^ai_edit$"), group=0)
+        self.app.add_handler(CallbackQueryHandler(handle_ai_button_fallback, pattern="^ai_(generate|edit)$"), group=0)
         
         # Обработка остальных кнопок меню (помощь, отмена) - после ConversationHandler
         self.app.add_handler(MessageHandler(
@@ -465,16 +1171,13 @@ class LandingBot:
         """Обработка нажатий на кнопки главного меню"""
         text = update.message.text
         user_id = update.effective_user.id
-        logger.info(f"User {user_id} pressed button: {text}")
+        logger.info("User %s pressed button: %s", user_id, text)
         
-        if text == "🤖 Создать лендинг":
-            # Кнопка теперь обрабатывается через entry_points ConversationHandler
-            # Но оставляем здесь для совместимости
-            await self.create_mode_selection_command(update, context)
-        elif text == "📚 Помощь":
-            await self.help_command(update, context)
-        elif text == "❌ Отмена":
-            await self.cancel_ai_command(update, context)
+        # "🤖 Создать лендинг" обрабатывается через entry_points ConversationHandler,
+        # но остаётся в таблице для совместимости
+        handler = self._menu_dispatch.get(text)
+        if handler:
+            await handler(update, context)
     
     # ==================== /start и /help ====================
     
@@ -482,90 +1185,78 @@ class LandingBot:
         """Обработка команды /start"""
         user = update.effective_user
         
-        # Сохраняем пользователя в БД
-        db = SessionLocal()
-        try:
-            db_user = db.query(User).filter(User.telegram_id == str(user.id)).first()
-            if not db_user:
-                db_user = User(
-                    telegram_id=str(user.id),
-                    username=user.username,
-                    first_name=user.first_name,
-                    last_name=user.last_name
-                )
-                db.add(db_user)
-                db.commit()
-        finally:
-            db.close()
-        
-        welcome_text = f"""👋 Привет, {user.first_name}!
-
-Я помогу тебе создать лендинг для продажи товаров.
-
-🤖 <b>Создание лендинга:</b>
-/ai - Создать лендинг с AI-ассистентом
-
-📚 <b>Помощь:</b>
-/help - Показать помощь"""
+        # Сохраняем пользователя в БД (в потоке, не блокируя event loop)
+        await asyncio.to_thread(self._save_telegram_user, user)
         
         try:
             await update.message.reply_text(
-                welcome_text,
+                WELCOME_TEXT_TEMPLATE.format(name=user.first_name),
                 parse_mode='HTML',
                 reply_markup=self.main_keyboard
             )
         except Exception as e:
             logger.warning(f"HTML parse error in start command, sending plain text: {e}")
-            plain_text = welcome_text.replace('<b>', '').replace('</b>', '').replace('<i>', '').replace('</i>', '')
             await update.message.reply_text(
-                plain_text,
+                WELCOME_TEXT_PLAIN_TEMPLATE.format(name=user.first_name),
                 reply_markup=self.main_keyboard
             )
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /help"""
-        help_text = """📚 <b>Команды бота:</b>
-
-/start - Начать работу
-/ai - Создать лендинг с AI-ассистентом
-/myid - Узнать свой Telegram ID
-/help - Эта помощь
-/cancel_ai - Отменить AI-режим
-
-🤖 <b>Как работает AI-ассистент:</b>
-
-1. Выберите режим: один товар или несколько товаров
-2. AI-ассистент задаст вопросы в формате диалога
-3. Отвечайте на вопросы и отправляйте фото/видео
-4. После сбора всех данных AI создаст лендинг
-
-📋 <b>Что собирает AI-ассистент:</b>
-
-• Общая информация (цель сайта, аудитория, стиль)
-• Данные о товарах (название, описание, цена, фото)
-• Настройки уведомлений (email или Telegram)
-• Дополнительные материалы (видео, галереи, отзывы)
-
-⏱ <b>Время генерации:</b> 30-60 секунд
-
-💡 <b>Совет:</b> Отвечайте подробно - это поможет создать более качественный лендинг!"""
-        
         try:
             await update.message.reply_text(
-                help_text,
+                HELP_TEXT,
                 parse_mode='HTML'
             )
         except Exception as e:
             logger.warning(f"HTML parse error in help command, sending plain text: {e}")
-            # Убираем HTML теги для plain text
-            plain_text = help_text.replace('<b>', '').replace('</b>', '').replace('<i>', '').replace('</i>', '')
-            await update.message.reply_text(plain_text)
+            await update.message.reply_text(HELP_TEXT_PLAIN)
     
     # ==================== Генерация ====================
     
+    def _save_generation_record(self, tg_user, user_id: int, template_id: str, user_data: Dict[str, Any], result: Dict[str, Any]):
+        """
+        Запись проекта и генерации (для rate limiting) по результату генерации.
+        Пользователь, проект и генерация — одна транзакция (flush выдаёт id без commit).
+        """
+        success = result.get('success', False)
+        generation_time = result.get('generation_time', 0)
+        files_info = result.get('files') or _EMPTY_MAPPING
+        with self._session() as db:
+            # Получаем или создаем пользователя
+            user_pk = self._upsert_user(db, tg_user)
+            
+            # Создаем проект
+            project = Project(
+                user_id=user_pk,
+                template_id=template_id,
+                template_name=template_id,
+                user_data=user_data,
+                status='completed' if success else 'failed',
+                generation_time=generation_time,
+                files_path=files_info.get('project_dir', ''),
+                zip_file=files_info.get('zip_file', '')
+            )
+            db.add(project)
+            db.flush()
+            
+            # Создаем запись Generation для rate limiting
+            generation = Generation(
+                user_id=str(user_id),
+                project_id=project.id,
+                prompt=f"Template: {template_id}",
+                response="Success" if success else result.get('error', ''),
+                tokens_used=result.get('tokens_used', 0),
+                generation_time=generation_time,
+                success=success,
+                error_message=None if success else result.get('error')
+            )
+            db.add(generation)
+            db.commit()
+    
     async def _start_generation(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Запуск генерации лендинга"""
-        logger.info(f"Starting generation for user {user_id}")
+        logger.info("Starting generation for user %s", user_id)
         
         # Определяем chat_id и bot
         if hasattr(update, 'callback_query') and update.callback_query:
@@ -576,7 +1267,7 @@ class LandingBot:
             bot = context.bot
         
         try:
-            data = self._get_user_data(user_id)
+            data = await self._get_user_data_async(user_id)
             
             # Проверяем, используется ли новая структура (17 пунктов)
             landing_type = data.get('landing_type')
@@ -584,71 +1275,8 @@ class LandingBot:
             if landing_type:
                 # НОВАЯ СТРУКТУРА (17 пунктов) - собираем ВСЕ данные
                 user_data_for_gen = {
-                    # Пункт 1: Тип лендинга
-                    'landing_type': landing_type,
-                    
-                    # Пункт 2: Название товара
-                    'product_name': data.get('product_name', 'Товар'),
-                    
-                    # Пункт 1: Hero блок
-                    'hero_media': data.get('hero_media'),
-                    'hero_media_type': data.get('hero_media_type', 'photo'),
-                    'hero_media_format': data.get('hero_media_format', 'jpeg'),
-                    'hero_aspect_ratio': data.get('hero_aspect_ratio', '3:4'),
-                    'hero_discount': data.get('hero_discount'),
-                    'hero_discount_position': data.get('hero_discount_position'),
-                    
-                    # Пункт 3: 3 яркие характеристики
-                    'characteristics': data.get('characteristics', []),
-                    
-                    # Пункт 4: Таймер
-                    'timer_enabled': data.get('timer_enabled', False),
-                    'timer_type': data.get('timer_type'),
-                    'timer_date': data.get('timer_date'),
-                    
-                    # Пункт 5: Цены
-                    'old_price': data.get('old_price', '152 BYN'),
-                    'new_price': data.get('new_price', '99 BYN'),
-                    
-                    # Пункт 6: Опции формы
-                    'sizes': data.get('sizes', []),
-                    'colors': data.get('colors', []),
-                    'characteristics_list': data.get('characteristics_list', []),
-                    'form_has_sizes': data.get('form_has_sizes', False),
-                    'form_has_colors': data.get('form_has_colors', False),
-                    'form_has_characteristics': data.get('form_has_characteristics', False),
-                    'form_has_quantity': data.get('form_has_quantity', False),
-                    
-                    # Пункт 7: Средний блок
-                    'middle_block_type': data.get('middle_block_type'),
-                    'middle_video': data.get('middle_video'),
-                    'middle_video_format': data.get('middle_video_format'),
-                    'middle_video_aspect_ratio': data.get('middle_video_aspect_ratio'),
-                    'middle_gallery': data.get('middle_gallery', []),  # Могут быть словари с filename
-                    
-                    # Пункт 8: Описание
-                    'description_text': data.get('description_text', ''),
-                    'description_photos': data.get('description_photos', []),  # Могут быть словари с filename
-                    'description_is_wildberries': data.get('description_is_wildberries', False),
-                    
-                    # Пункт 12: Отзывы
-                    'reviews': data.get('reviews', []),
-                    'reviews_type': data.get('reviews_type'),
-                    'reviews_aspect_ratio': data.get('reviews_aspect_ratio', '3:4'),
-                    'reviews_photo_format': data.get('reviews_photo_format', 'jpeg'),
-                    
-                    # Пункт 17: Подвал
-                    'footer_info': data.get('footer_info', {}),
-                    
-                    # Уведомления
-                    'notification_type': data.get('notification_type', 'telegram'),
-                    'notification_email': data.get('notification_email', ''),
-                    'notification_telegram_token': data.get('notification_telegram_token', ''),
-                    'notification_telegram_chat_id': data.get('notification_telegram_chat_id', ''),
-                    
-                    # Дополнительные данные
-                    'photos_dir': data.get('photos_dir', ''),
-                    'videos_dir': data.get('videos_dir', ''),
+                    key: data[key] if key in data else (default.copy() if isinstance(default, (list, dict)) else default)
+                    for key, default in _GEN_FIELDS
                 }
                 
                 # Для обратной совместимости добавляем старые поля
@@ -656,18 +1284,10 @@ class LandingBot:
                 user_data_for_gen['benefits'] = user_data_for_gen['characteristics']
                 
                 # Обрабатываем фото (могут быть словарями или строками)
-                photos_list = []
-                for photo in user_data_for_gen.get('middle_gallery', []):
-                    if isinstance(photo, dict):
-                        photos_list.append(photo.get('path', photo))
-                    else:
-                        photos_list.append(photo)
-                for photo in user_data_for_gen.get('description_photos', []):
-                    if isinstance(photo, dict):
-                        photos_list.append(photo.get('path', photo))
-                    else:
-                        photos_list.append(photo)
-                user_data_for_gen['photos'] = photos_list
+                user_data_for_gen['photos'] = [
+                    photo.get('path', photo) if isinstance(photo, dict) else photo
+                    for photo in chain(user_data_for_gen['middle_gallery'] or [], user_data_for_gen['description_photos'] or [])
+                ]
                 
                 template_id = landing_type
             else:
@@ -702,13 +1322,10 @@ class LandingBot:
                     user_data_for_gen['footer_info'] = footer_info
                 else:
                     # Пробуем получить из extra_fields или напрямую из data
-                    footer_fields = ['company_name', 'ip_name', 'unp', 'ogrn', 'inn', 'address', 'phone', 'email']
-                    footer_data = {}
-                    for field in footer_fields:
-                        if field in data:
-                            footer_data[field] = data[field]
-                        elif 'extra_fields' in data and field in data['extra_fields']:
-                            footer_data[field] = data['extra_fields'][field]
+                    # Значения из data приоритетнее extra_fields
+                    extra_fields = data.get('extra_fields') or {}
+                    footer_data = {field: extra_fields[field] for field in _FOOTER_FIELDS & extra_fields.keys()}
+                    footer_data.update({field: data[field] for field in _FOOTER_FIELDS & data.keys()})
                     
                     if footer_data:
                         user_data_for_gen['footer_info'] = footer_data
@@ -718,122 +1335,84 @@ class LandingBot:
             
             # Вычисляем скидку
             try:
-                old = float(str(user_data_for_gen['old_price']).replace('BYN', '').replace('RUB', '').replace('USD', '').strip())
-                new = float(str(user_data_for_gen['new_price']).replace('BYN', '').replace('RUB', '').replace('USD', '').strip())
+                old = parse_price(user_data_for_gen['old_price'])
+                new = parse_price(user_data_for_gen['new_price'])
                 discount = int(((old - new) / old) * 100)
                 user_data_for_gen['discount_percent'] = discount
             except Exception:
                 user_data_for_gen['discount_percent'] = 35
             
-            logger.info(f"Generating with template: {template_id}, data keys: {list(user_data_for_gen.keys())}")
-            logger.info(f"Sample data: product_name={user_data_for_gen.get('product_name')}, old_price={user_data_for_gen.get('old_price')}, new_price={user_data_for_gen.get('new_price')}")
-            logger.info(f"Characteristics: {user_data_for_gen.get('characteristics')}, Footer: {user_data_for_gen.get('footer_info')}")
+            # Ленивое форматирование: при уровне логов выше INFO строки (и список ключей) не собираются
+            logger.info("Generating with template: %s, data keys: %s", template_id, user_data_for_gen.keys())
+            logger.info(
+                "Sample data: product_name=%r, old_price=%r, new_price=%r",
+                user_data_for_gen.get('product_name'), user_data_for_gen.get('old_price'), user_data_for_gen.get('new_price')
+            )
+            logger.info("Characteristics: %s, Footer: %s", user_data_for_gen.get('characteristics'), user_data_for_gen.get('footer_info'))
             
             # Генерируем лендинг
             result = await self.code_generator.generate(template_id, user_data_for_gen)
             
-            # Сохраняем запись Generation для rate limiting
-            db = SessionLocal()
+            # Сохраняем запись Generation для rate limiting (в потоке: JSON user_data и запросы к БД не блокируют event loop)
             try:
-                # Используем транзакцию для атомарности
-                # Получаем или создаем пользователя
-                db_user = db.query(User).filter(User.telegram_id == str(user_id)).first()
-                if not db_user:
-                    user_obj = update.effective_user
-                    db_user = User(
-                        telegram_id=str(user_id),
-                        username=user_obj.username,
-                        first_name=user_obj.first_name,
-                        last_name=user_obj.last_name
-                    )
-                    db.add(db_user)
-                    db.commit()
-                    db.refresh(db_user)
-                
-                # Создаем проект
-                project = Project(
-                    user_id=db_user.id,
-                    template_id=template_id,
-                    template_name=template_id,
-                    user_data=user_data_for_gen,
-                    status='completed' if result.get('success') else 'failed',
-                    generation_time=result.get('generation_time', 0),
-                    files_path=result.get('files', {}).get('project_dir', ''),
-                    zip_file=result.get('files', {}).get('zip_file', '')
-                )
-                db.add(project)
-                db.commit()
-                db.refresh(project)
-                
-                # Создаем запись Generation для rate limiting
-                generation = Generation(
-                    user_id=str(user_id),
-                    project_id=project.id,
-                    prompt=f"Template: {template_id}",
-                    response="Success" if result.get('success') else result.get('error', ''),
-                    tokens_used=result.get('tokens_used', 0),
-                    generation_time=result.get('generation_time', 0),
-                    success=result.get('success', False),
-                    error_message=result.get('error') if not result.get('success') else None
+                await asyncio.to_thread(
+                    self._save_generation_record, update.effective_user, user_id, template_id, user_data_for_gen, result
                 )
-                db.add(generation)
-                db.commit()
-                logger.info(f"Saved generation record for user {user_id}")
             except Exception as e:
-                logger.error(f"Error saving generation record: {e}")
-                db.rollback()
-            finally:
-                db.close()
+                logger.error("Error saving generation record: %s", e)
+            
+            # Одна запись на генерацию; поля extra= попадают в JSON-логи (LOG_JSON) для метрик
+            logger.info(
+                "Generation finished for user %s: template=%s, success=%s",
+                user_id, template_id, bool(result.get('success')),
+                extra={
+                    'event': 'generation',
+                    'user_id': user_id,
+                    'template': template_id,
+                    'success': bool(result.get('success')),
+                    'generation_time': result.get('generation_time', 0),
+                    'tokens_used': result.get('tokens_used', 0),
+                }
+            )
             
             if result.get('success'):
-                logger.info(f"Generation successful for user {user_id}")
                 
                 # Копируем фото в папку проекта
-                files_info = result.get('files', {})
+                files_info = result.get('files') or _EMPTY_MAPPING
                 project_dir = files_info.get('project_dir', '')
                 
                 if project_dir and data.get('photos'):
                     img_dir = os.path.join(project_dir, 'img')
                     os.makedirs(img_dir, exist_ok=True)
                     
-                    for i, photo_path in enumerate(data.get('photos', [])):
-                        if os.path.exists(photo_path):
-                            dest_path = os.path.join(img_dir, f'product_{i+1}.jpg')
-                            shutil.copy2(photo_path, dest_path)
-                            logger.info(f"Copied photo to {dest_path}")
+                    # Копирование — в потоках параллельно, чтобы не блокировать event loop
+                    dest_paths = [os.path.join(img_dir, f'product_{i+1}.jpg') for i in range(len(data['photos']))]
+                    copied = await asyncio.gather(*(
+                        asyncio.to_thread(_copy_photo, photo_path, dest_path)
+                        for photo_path, dest_path in zip(data['photos'], dest_paths)
+                    ))
+                    for dest_path, ok in zip(dest_paths, copied):
+                        if ok:
+                            logger.info("Copied photo to %s", dest_path)
                 
                 zip_path = files_info.get('zip_file', '')
-                
-                if zip_path and os.path.exists(zip_path):
-                    # Отправляем ZIP
-                    # Экранируем спецсимволы Markdown в template_id
-                    safe_template_id = template_id.replace('_', '\\_').replace('*', '\\*').replace('[', '\\[').replace('`', '\\`')
-                    await bot.send_message(
-                        chat_id=chat_id,
-                        text=f"✅ *Лендинг успешно создан!*\n\n"
-                             f"📁 Шаблон: {safe_template_id}\n"
-                             f"⏱ Время генерации: {result.get('generation_time', 0)} сек\n\n"
-                             f"Отправляю архив с файлами...",
-                        parse_mode='Markdown'
-                    )
-                    
-                    with open(zip_path, 'rb') as f:
-                        await bot.send_document(
-                            chat_id=chat_id,
-                            document=f,
-                            filename=f"landing_{user_data_for_gen.get('product_name', 'товар')[:20]}.zip",
-                            caption="📦 Ваш лендинг готов!\n\n"
-                                    "В архиве:\n"
-                                    "• index.html - главная страница\n"
-                                    "• css/styles.css - стили\n"
-                                    "• js/script.js - скрипты\n"
-                                    "• sendCPA.php - обработчик формы\n\n"
-                                    "Выберите действие из меню:",
-                            reply_markup=self.main_keyboard
-                        )
-                    logger.info(f"ZIP sent to user {user_id}")
-                else:
-                    logger.error(f"ZIP file not found: {zip_path}")
+                # Отправляем ZIP одним запросом: итог генерации — в подписи к архиву
+                # Экранируем спецсимволы Markdown в template_id
+                safe_template_id = _md_escape(template_id)
+                sent = await self._send_landing_zip(
+                    chat_id,
+                    zip_path,
+                    caption=LANDING_READY_CAPTION_TEMPLATE.format(
+                        template=safe_template_id,
+                        secs=result.get('generation_time', 0)
+                    ),
+                    bot=bot,
+                    filename=f"landing_{user_data_for_gen.get('product_name', 'товар')[:20]}.zip",
+                    parse_mode='Markdown',
+                    reply_markup=self.main_keyboard
+                )
+                if not sent:
+                    logger.error("ZIP file not found: %s", zip_path)
                     await bot.send_message(
                         chat_id=chat_id,
                         text="⚠️ Лендинг создан, но возникла проблема с архивом.\n"
@@ -842,7 +1421,7 @@ class LandingBot:
                     )
             else:
                 error_msg = result.get('error', 'Неизвестная ошибка')
-                logger.error(f"Generation failed for user {user_id}: {error_msg}")
+                logger.error("Generation failed for user %s: %s", user_id, error_msg)
                 
                 # Улучшенные сообщения об ошибках для пользователя
                 user_friendly_msg = self._format_error_message(error_msg)
@@ -854,7 +1433,7 @@ class LandingBot:
                 )
         
         except Exception as e:
-            logger.error(f"Exception in generation for user {user_id}: {str(e)}", exc_info=True)
+            logger.error("Exception in generation for user %s: %s", user_id, e, exc_info=True)
             try:
                 user_friendly_msg = self._format_error_message(str(e))
                 await bot.send_message(
@@ -867,24 +1446,21 @@ class LandingBot:
         
         finally:
             # Очищаем данные пользователя
-            self._cleanup_user_data(user_id)
+            await self._cleanup_user_data(user_id)
     
-    def _cleanup_user_data(self, user_id: int):
+    async def _cleanup_user_data(self, user_id: int):
         """Очистка данных пользователя"""
-        data = self._get_user_data(user_id)
+        data = await self._get_user_data_async(user_id, copy=False)
         if data:
-            # Удаляем временную папку с фото
+            # Удаляем временную папку с фото в фоне: ответ пользователю не ждёт удаления файлов
             photos_dir = data.get('photos_dir')
-            if photos_dir and os.path.exists(photos_dir):
-                try:
-                    shutil.rmtree(photos_dir)
-                    logger.info(f"Cleaned up photos dir for user {user_id}")
-                except Exception:
-                    pass
+            if photos_dir:
+                self._spawn_background(asyncio.to_thread(shutil.rmtree, photos_dir, ignore_errors=True))
+                logger.info("Scheduled cleanup of photos dir for user %s", user_id)
             
             # Очищаем данные из БД
-            self._clear_user_data(user_id)
-            logger.info(f"Cleaned up user data for {user_id}")
+            await self._clear_user_data_async(user_id)
+            logger.info("Cleaned up user data for %s", user_id)
     
     async def myid_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /myid - показать свой Telegram ID"""
@@ -904,20 +1480,20 @@ class LandingBot:
         
         await update.message.reply_text(message, parse_mode='Markdown')
     
+    def refresh_admin_ids(self) -> None:
+        """Перечитать Config.BOT_ADMIN_IDS (если список администраторов изменился во время работы)"""
+        self._admin_ids = frozenset(aid.strip() for aid in Config.BOT_ADMIN_IDS if aid.strip())
+
     def _is_admin(self, user_id: int) -> bool:
         """Проверка, является ли пользователь администратором."""
-        admin_ids = [aid.strip() for aid in Config.BOT_ADMIN_IDS if aid.strip()]
-        return not admin_ids or str(user_id) in admin_ids
+        return not self._admin_ids or str(user_id) in self._admin_ids
 
     async def notify_admins(self, text: str, parse_mode: Optional[str] = None) -> None:
         """
         Отправить сообщение всем администраторам (для алертов и мониторинга).
         Ошибки отправки логируются, но не прерывают выполнение.
         """
-        admin_ids = [aid.strip() for aid in Config.BOT_ADMIN_IDS if aid.strip()]
-        if not admin_ids:
-            return
-        for uid_str in admin_ids:
+        async def send(uid_str: str):
             try:
                 uid = int(uid_str)
                 await self.app.bot.send_message(
@@ -928,6 +1504,9 @@ class LandingBot:
             except Exception as e:
                 logger.warning(f"Не удалось отправить алерт админу {uid_str}: {e}")
 
+        # Администраторов единицы — отправляем всем одновременно
+        await asyncio.gather(*(send(uid_str) for uid_str in self._admin_ids))
+
     async def admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /admin — панель администратора (меню с кнопками)."""
         user_id = update.effective_user.id
@@ -937,15 +1516,9 @@ class LandingBot:
                 "❌ У вас нет прав. Эта команда только для администраторов."
             )
             return
-        keyboard = [
-            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-            [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
-            [InlineKeyboardButton("❌ Закрыть", callback_data="admin_close")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             "🔐 **Панель администратора**\n\nВыберите действие:",
-            reply_markup=reply_markup,
+            reply_markup=self.admin_keyboard,
             parse_mode='Markdown'
         )
 
@@ -963,8 +1536,7 @@ class LandingBot:
             return
         if data == "admin_stats":
             try:
-                from backend.utils.metrics import MetricsCollector
-                stats = MetricsCollector.get_all_stats()
+                stats = await asyncio.to_thread(MetricsCollector.get_all_stats)
                 msg = "📊 **Статистика бота**\n\n"
                 users = stats.get('users', {})
                 msg += f"👥 Пользователи: всего {users.get('total_users', 0)}, за 24ч: {users.get('new_users_24h', 0)}\n\n"
@@ -997,29 +1569,54 @@ class LandingBot:
         if not self._is_admin(user_id) or not context.user_data.pop('admin_waiting_broadcast', False):
             return
         text = update.message.text
-        from backend.utils.metrics import MetricsCollector
-        chat_ids = MetricsCollector.get_all_telegram_user_ids()
+        # id читаются из БД постранично (короткая сессия на страницу); чтение пачки — в потоке, чтобы не блокировать event loop
+        chat_ids = MetricsCollector.iter_telegram_user_ids()
+
+        def next_batch():
+            return list(islice(chat_ids, BROADCAST_BATCH_SIZE))
+
         sent = 0
         failed = 0
-        for cid in chat_ids:
-            try:
-                await context.bot.send_message(chat_id=cid, text=text)
-                sent += 1
-            except Exception as e:
-                failed += 1
-                logger.warning(f"Broadcast to {cid} failed: {e}")
+        try:
+            # Пачками по BROADCAST_BATCH_SIZE параллельно, с паузой между пачками
+            batch = await asyncio.to_thread(next_batch)
+            while batch:
+                results = await asyncio.gather(*(self._broadcast_send(context.bot, cid, text) for cid in batch))
+                delivered = sum(results)
+                sent += delivered
+                failed += len(batch) - delivered
+                batch = await asyncio.to_thread(next_batch)
+                if batch:
+                    await asyncio.sleep(BROADCAST_BATCH_INTERVAL)
+        finally:
+            chat_ids.close()
         await update.message.reply_text(
             f"📢 Рассылка завершена.\nОтправлено: {sent}, не доставлено: {failed}."
         )
 
+    async def _broadcast_send(self, bot, chat_id: int, text: str) -> bool:
+        """Отправка одного сообщения рассылки; при RetryAfter ждём указанное Telegram время и пробуем ещё раз"""
+        for attempt in range(2):
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as e:
+                if attempt:
+                    logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                    return False
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+            except Exception as e:
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                return False
+        return False
+    
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /stats - статистика бота (только для админов)"""
         user_id = update.effective_user.id
-        user_id_str = str(user_id)
         
         # Проверка прав администратора
-        admin_ids = [aid.strip() for aid in Config.BOT_ADMIN_IDS if aid.strip()]
-        if admin_ids and user_id_str not in admin_ids:
+        if not self._is_admin(user_id):
             await update.message.reply_text(
                 "❌ У вас нет прав для выполнения этой команды.\n\n"
                 "Эта команда доступна только администраторам."
@@ -1027,10 +1624,8 @@ class LandingBot:
             return
         
         try:
-            from backend.utils.metrics import MetricsCollector
-            
             # Получаем статистику
-            stats = MetricsCollector.get_all_stats()
+            stats = await asyncio.to_thread(MetricsCollector.get_all_stats)
             
             # Форматируем сообщение
             message = "📊 **Статистика бота**\n\n"
@@ -1083,76 +1678,18 @@ class LandingBot:
         Returns:
             Понятное сообщение для пользователя
         """
-        error_lower = error_msg.lower()
-        
-        # Таймаут
-        if 'timeout' in error_lower or 'таймаут' in error_lower:
-            return (
-                "⏱️ **Превышено время ожидания**\n\n"
-                "Генерация заняла слишком много времени.\n\n"
-            "💡 **Что делать:**\n"
-            "• Попробуйте снова через /create\n"
-            "• Уменьшите количество данных (меньше фото, короче описание)\n"
-            "• Проверьте интернет-соединение"
-            )
-        
-        # Rate limit
-        if 'rate limit' in error_lower or '429' in error_lower or 'лимит' in error_lower:
-            return (
-                "⏸️ **Превышен лимит запросов**\n\n"
-                "Слишком много запросов к сервису генерации.\n\n"
-            "💡 **Что делать:**\n"
-            "• Подождите несколько минут\n"
-            "• Попробуйте снова через /create"
-            )
-        
-        # Ошибка сети
-        if 'network' in error_lower or 'connection' in error_lower or 'сеть' in error_lower:
-            return (
-                "🌐 **Проблема с подключением**\n\n"
-                "Не удалось подключиться к сервису генерации.\n\n"
-            "💡 **Что делать:**\n"
-            "• Проверьте интернет-соединение\n"
-            "• Подождите минуту и попробуйте снова\n"
-            "• Используйте /create для повторной попытки"
-            )
-        
-        # Ошибка API ключа
-        if 'api key' in error_lower or 'ключ' in error_lower or 'unauthorized' in error_lower:
-            return (
-                "🔑 **Проблема с настройками**\n\n"
-                "Ошибка конфигурации сервиса генерации.\n\n"
-                "💡 **Что делать:**\n"
-                "• Обратитесь к администратору бота\n"
-                "• Попробуйте позже"
-            )
-        
-        # Исчерпаны попытки / сервис временно недоступен
-        if 'попыток' in error_lower or 'attempts' in error_lower or 'retries' in error_lower:
-            return (
-                "⏳ **Сервис временно перегружен**\n\n"
-                "Не удалось сгенерировать лендинг после нескольких попыток.\n\n"
-                "💡 **Что делать:**\n"
-                "• Подождите 1–2 минуты и нажмите «Да, генерировать» снова\n"
-                "• Или начните заново: /ai"
-            )
-        
-        # Общая ошибка
-        return (
-            "❌ **Ошибка при генерации**\n\n"
-            "Не удалось создать лендинг.\n\n"
-            "💡 **Что делать:**\n"
-            "• Попробуйте снова через /create\n"
-            "• Убедитесь, что все данные введены корректно\n"
-            "• Если проблема повторяется, обратитесь к администратору"
-        )
+        # Из найденных категорий берётся первая по порядку в ERROR_MESSAGES
+        categories = {match.lastindex for match in _ERROR_KEYWORDS_RE.finditer(error_msg)}
+        if not categories:
+            return GENERIC_ERROR_MESSAGE
+        return ERROR_MESSAGES[min(categories) - 1][1]
     
     # ==================== Общие методы ====================
     
     async def _handle_notification_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Диспетчер для обработки данных уведомлений"""
         user_id = update.effective_user.id
-        data = self._get_user_data(user_id)
+        data = await self._get_user_data_async(user_id, copy=False)
         notification_type = data.get('notification_type')
         
         # Проверяем, есть ли уже токен (для Telegram)
@@ -1172,7 +1709,7 @@ class LandingBot:
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена создания"""
         user_id = update.effective_user.id
-        self._cleanup_user_data(user_id)
+        await self._cleanup_user_data(user_id)
         
         await update.message.reply_text(
             "❌ Создание лендинга отменено.\n\nВыберите действие из меню:",
@@ -1207,7 +1744,7 @@ class LandingBot:
             return ConversationHandler.END
         
         # Проверяем, есть ли незавершенное создание лендинга в БД
-        user_data = self._get_user_data(user_id)
+        user_data = await self._get_user_data_async(user_id, copy=False)
         state = user_data.get('state') if user_data else None
         
         # Если есть активное состояние в БД, значит ConversationHandler должен быть активен
@@ -1216,15 +1753,10 @@ class LandingBot:
             # Есть состояние в БД, но нет в context - состояние потеряно
             if user_data and user_data.get('conversation_type') == 'create':
                 # Предлагаем продолжить или начать сначала
-                keyboard = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔄 Продолжить создание", callback_data="resume_create")],
-                    [InlineKeyboardButton("🆕 Начать сначала", callback_data="restart_create")],
-                    [InlineKeyboardButton("❌ Отмена", callback_data="cancel_create")]
-                ])
                 await update.message.reply_text(
                     "⚠️ Похоже, создание лендинга было прервано.\n\n"
                     "Что вы хотите сделать?",
-                    reply_markup=keyboard
+                    reply_markup=self.resume_create_keyboard
                 )
                 return ConversationHandler.END
         
@@ -1246,29 +1778,41 @@ class LandingBot:
             BotCommand("admin", "Панель администратора"),
         ]
 
+        async def setup_admin_commands(uid_str: str):
+            try:
+                uid = int(uid_str)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Неверный BOT_ADMIN_IDS элемент '{uid_str}': {e}")
+                return
+            try:
+                await self.app.bot.set_my_commands(
+                    admin_commands,
+                    scope=BotCommandScopeChatMember(chat_id=uid, user_id=uid),
+                )
+                logger.info(f"✓ Команды для админа {uid} установлены")
+            except Exception as e:
+                logger.warning(f"Не удалось установить команды для админа {uid}: {e}")
+
+        async def setup_menu_button():
+            try:
+                menu_button = MenuButtonCommands()
+                await self.app.bot.set_chat_menu_button(menu_button=menu_button)
+                logger.info("✓ Кнопка меню установлена")
+            except Exception as e:
+                logger.debug(f"Кнопка меню не установлена (может не поддерживаться): {e}")
+
         async def setup_commands():
             try:
                 await self.app.bot.set_my_commands(default_commands, scope=BotCommandScopeDefault())
                 logger.info("✓ Меню команд по умолчанию установлено")
-                admin_ids = [aid.strip() for aid in Config.BOT_ADMIN_IDS if aid.strip()]
-                for uid_str in admin_ids:
-                    try:
-                        uid = int(uid_str)
-                        await self.app.bot.set_my_commands(
-                            admin_commands,
-                            scope=BotCommandScopeChatMember(chat_id=uid, user_id=uid),
-                        )
-                        logger.info(f"✓ Команды для админа {uid} установлены")
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Неверный BOT_ADMIN_IDS элемент '{uid_str}': {e}")
-                try:
-                    menu_button = MenuButtonCommands()
-                    await self.app.bot.set_chat_menu_button(menu_button=menu_button)
-                    logger.info("✓ Кнопка меню установлена")
-                except Exception as e:
-                    logger.debug(f"Кнопка меню не установлена (может не поддерживаться): {e}")
             except Exception as e:
                 logger.warning(f"Не удалось установить меню команд: {e}")
+                return
+            # Команды админов и кнопка меню — параллельными запросами
+            await asyncio.gather(
+                *(setup_admin_commands(uid_str) for uid_str in self._admin_ids),
+                setup_menu_button()
+            )
         
         # Сохраняем задачу для выполнения при запуске
         self._menu_setup_task = setup_commands
@@ -1278,6 +1822,8 @@ class LandingBot:
         logger.info("Запуск Telegram бота...")
         await self.app.initialize()
         await self.app.start()
+        # Соединение с LLM открываем в фоне, пока восстанавливаются агенты и ставится меню
+        self._spawn_background(self.llm_client.warmup())
         
         # Восстанавливаем AI-агентов из БД
         await self._restore_ai_agents_from_db()
@@ -1289,16 +1835,19 @@ class LandingBot:
         await self.app.updater.start_polling()
         logger.info("Бот запущен и готов к работе")
         if Config.NOTIFY_ADMINS_ON_STARTUP:
-            from datetime import datetime
             await self.notify_admins(
                 f"✅ Бот запущен (polling)\n{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} UTC"
             )
     
     async def stop(self):
         """Остановка бота"""
-        # Очищаем все AI-агенты перед остановкой
+        # Дописываем отложенные состояния агентов, время активности и очищаем все AI-агенты перед остановкой
+        await self._flush_ai_agent_saves()
+        try:
+            await asyncio.to_thread(self._flush_ai_activity)
+        except Exception as e:
+            logger.error(f"Error saving AI agents activity on stop: {e}")
         self.ai_agents.clear()
-        self.ai_agents_last_activity.clear()
         
         await self.app.updater.stop()
         await self.app.stop()
@@ -1312,11 +1861,7 @@ class LandingBot:
         logger.info(f"User {user_id} started mode selection")
         
         try:
-            keyboard = [
-                [InlineKeyboardButton("📄 Лендинг (1 товар)", callback_data="mode_single")],
-                [InlineKeyboardButton("🌐 Сайт (несколько товаров)", callback_data="mode_multi")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.mode_keyboard
             
             # Проверяем, есть ли message (для команд и текстовых сообщений)
             if update.message:
@@ -1358,7 +1903,7 @@ class LandingBot:
         
         # Сохраняем выбор режима
         context.user_data['selected_mode'] = mode
-        self._update_user_data(user_id, ai_mode=mode)
+        await self._update_user_data_async(user_id, ai_mode=mode)
         
         logger.info(f"User {user_id} selected mode: {mode}")
         
@@ -1387,21 +1932,17 @@ class LandingBot:
     async def start_ai_agent(self, user_id: int, mode: str, chat_id: int, context: ContextTypes.DEFAULT_TYPE = None, force_new: bool = False):
         """Запуск AI-ассистента. Если force_new=True (выбор режима из меню), всегда создаём нового агента и показываем приветствие."""
         try:
-            from backend.bot.ai_agent import LandingAIAgent
-            
             logger.info(f"Starting AI agent for user {user_id} with mode {mode} (force_new={force_new})")
             
             # Восстанавливаем из БД только если не явный старт с выбором режима
-            user_data = self._get_user_data(user_id)
+            user_data = await self._get_user_data_async(user_id, copy=False)
             if not force_new and 'ai_agent_state' in user_data and user_data.get('ai_agent_active'):
                 try:
-                    # Восстанавливаем агента из сохраненного состояния
-                    agent = LandingAIAgent.from_serialized_state(user_data['ai_agent_state'])
-                    self.ai_agents[user_id] = agent
+                    # Восстанавливаем агента из копии сохраненного состояния (агент меняет его на месте)
+                    agent = LandingAIAgent.from_serialized_state(deepcopy(user_data['ai_agent_state']))
                     
-                    # Восстанавливаем время последней активности
-                    import time
-                    self.ai_agents_last_activity[user_id] = user_data.get('last_activity', time.time())
+                    # Восстанавливаем агента и время последней активности
+                    self._register_ai_agent(user_id, AgentEntry(agent, user_data.get('last_activity', time.time()), chat_id, user_data.get('last_activity')))
                     
                     logger.info(f"AI agent restored from DB for user {user_id}, stage: {agent.stage}")
                     
@@ -1422,12 +1963,10 @@ class LandingBot:
             
             # Создаем нового агента
             agent = LandingAIAgent(mode=mode)
-            self.ai_agents[user_id] = agent
-            import time
-            self.ai_agents_last_activity[user_id] = time.time()
+            self._register_ai_agent(user_id, AgentEntry(agent, time.time(), chat_id))
             
             # Сохраняем состояние агента в БД
-            self._save_ai_agent_state(user_id, agent)
+            await self._save_ai_agent_state_async(user_id, agent)
             
             # Начинаем диалог
             greeting = await agent.start_conversation()
@@ -1468,46 +2007,31 @@ class LandingBot:
             return ConversationHandler.END
         
         # Проверяем, есть ли активный AI-агент для пользователя
-        if user_id not in self.ai_agents:
+        entry = await self._get_ai_agent_entry(user_id, update.message.chat.id)
+        if entry is None:
             return ConversationHandler.END  # Не обрабатываем, если нет активного агента
         
-        agent = self.ai_agents[user_id]
+        agent = entry.agent
         message_text = update.message.text
         
         # Проверяем команды запуска генерации (если агент в стадии generation)
         if agent.stage == 'generation':
-            generation_commands = [
-                'начинай генерацию', 'начни генерацию', 'генерируй', 'генерировать',
-                'готов', 'да', 'давай', 'начинай', 'начни', 'создавай', 'создай',
-                'да, генерировать', 'да генерировать', 'давай генерировать'
-            ]
-            if message_text.lower().strip() in generation_commands or any(cmd in message_text.lower() for cmd in ['генерир', 'создай', 'готов', 'давай']):
+            if _GENERATION_COMMAND_RE.search(message_text):
                 logger.info(f"User {user_id} confirmed generation via text command: {message_text}")
-                
-                # Создаем классы-обертки для имитации callback_query
-                class FakeCallbackQuery:
-                    def __init__(self, msg, user):
-                        self.data = 'ai_generate'
-                        self.from_user = user
-                        self.message = msg
-                        self.id = f'fake_{int(time.time() * 1000)}'
-                    
-                    async def answer(self, text=None, show_alert=False):
-                        pass
-                    
-                    async def edit_message_text(self, text, **kwargs):
-                        await self.message.reply_text(text, **kwargs)
-                
-                class FakeUpdate:
-                    def __init__(self, original_update):
-                        self.callback_query = FakeCallbackQuery(original_update.message, original_update.effective_user)
-                        self.effective_user = original_update.effective_user
-                
-                import time
-                FakeUpdate(update)  # конструктор для совместимости, результат не используется
+                if user_id in self._ai_generating:
+                    await update.message.reply_text(AI_GENERATION_BUSY_TEXT)
+                    return AI_CONVERSATION
                 
                 # Вызываем обработчик генерации напрямую, передавая нужные параметры
+                self._ai_generating.add(user_id)
                 try:
+                    # Валидация данных — до запроса лимита к БД
+                    validation_errors = agent.validate_data()
+                    if validation_errors:
+                        error_msg = "❌ Обнаружены ошибки в данных:\n\n" + "\n".join([f"• {e}" for e in validation_errors])
+                        await update.message.reply_text(error_msg + "\n\nПожалуйста, исправьте данные и попробуйте снова.")
+                        return AI_CONVERSATION
+                    
                     # Проверка rate limit
                     allowed, remaining = await rate_limiter.check_db_rate_limit(user_id)
                     if not allowed:
@@ -1525,13 +2049,6 @@ class LandingBot:
                     logger.info(f"Converting AI agent data to user_data for user {user_id}")
                     user_data = agent.convert_to_user_data()
                     
-                    # Валидация данных
-                    validation_errors = agent.validate_data()
-                    if validation_errors:
-                        error_msg = "❌ Обнаружены ошибки в данных:\n\n" + "\n".join([f"• {e}" for e in validation_errors])
-                        await update.message.reply_text(error_msg + "\n\nПожалуйста, исправьте данные и попробуйте снова.")
-                        return AI_CONVERSATION
-                    
                     # Генерируем лендинг
                     template_id = 'single_product' if agent.mode == 'SINGLE' else 'multi_product'
                     logger.info(f"Starting generation for user {user_id}, template_id: {template_id}")
@@ -1539,30 +2056,16 @@ class LandingBot:
                     result = await self.code_generator.generate(template_id, user_data)
                     
                     if result.get('success'):
-                        files_info = result.get('files', {})
+                        files_info = result.get('files') or _EMPTY_MAPPING
                         zip_file = files_info.get('zip_file')
                         
-                        if zip_file and os.path.exists(zip_file):
-                            with open(zip_file, 'rb') as f:
-                                await self.app.bot.send_document(
-                                    chat_id=update.message.chat.id,
-                                    document=f,
-                                    filename=os.path.basename(zip_file),
-                                    caption="✅ Лендинг успешно сгенерирован!"
-                                )
-                        else:
+                        if not await self._send_landing_zip(update.message.chat.id, zip_file):
                             await update.message.reply_text("✅ Лендинг сгенерирован, но файл не найден.")
                         # Очищаем агента
                         await self._cleanup_ai_agent_files(user_id)
-                        if user_id in self.ai_agents:
-                            del self.ai_agents[user_id]
-                        if user_id in self.ai_agents_last_activity:
-                            del self.ai_agents_last_activity[user_id]
-                        user_data_db = self._get_user_data(user_id)
-                        user_data_db.pop('ai_agent_state', None)
-                        user_data_db.pop('ai_agent_active', None)
-                        user_data_db.pop('last_activity', None)
-                        self._save_user_data(user_id, user_data_db, state=None, conversation_type=None)
+                        self.ai_agents.pop(user_id, None)
+                        await self._discard_ai_agent_save(user_id)
+                        await asyncio.to_thread(self._clear_ai_agent_states, [user_id])
                         return ConversationHandler.END
                     else:
                         error = result.get('error', 'Неизвестная ошибка')
@@ -1574,37 +2077,26 @@ class LandingBot:
                     formatted_error = self._format_error_message(str(e))
                     await update.message.reply_text(f"❌ Произошла ошибка:\n\n{formatted_error}")
                     return AI_CONVERSATION
+                finally:
+                    self._ai_generating.discard(user_id)
         
         # Обновляем время последней активности
-        import time
-        self.ai_agents_last_activity[user_id] = time.time()
+        self._touch_ai_agent(user_id, entry)
         
         try:
             # Обрабатываем сообщение через агента
             response = await agent.process_message(message_text, user_id)
             
             # Проверяем: если после обработки появилось описание товара и есть hero-фото - запускаем vision-анализ
-            products = agent.collected_data.get('products', [])
-            files = agent.collected_data.get('files', [])
-            hero_file = next((f for f in files if f.get('block') == 'hero'), None)
-            
-            if products and products[0].get('product_description') and hero_file and hero_file.get('type') == 'photo':
-                # Проверяем, не запускали ли уже анализ
-                if 'vision_style_suggestion' not in agent.collected_data:
-                    product_name = products[0].get('product_name', '')
-                    description = products[0].get('product_description', '')
-                    hero_path = hero_file.get('path')
-                    
-                    if hero_path and os.path.exists(hero_path):
-                        # Запускаем vision-анализ в фоне
-                        import asyncio
-                        asyncio.create_task(
-                            self._analyze_hero_image_async(user_id, hero_path, product_name, description, agent)
-                        )
+            hero_file = agent.hero_file
+            if hero_file and hero_file.get('type') == 'photo' and self._hero_vision_needed(agent):
+                hero_path = hero_file.get('path')
+                if hero_path and await asyncio.to_thread(os.path.exists, hero_path):
+                    if self._start_hero_vision(user_id, agent, hero_path):
                         logger.info(f"Started background vision analysis after description received: {hero_path}")
             
-            # Сохраняем состояние агента после обработки сообщения
-            self._save_ai_agent_state(user_id, agent)
+            # Сохраняем состояние агента после обработки сообщения (в фоне, после ответа)
+            self._schedule_ai_agent_save(user_id, agent)
             
             # Проверяем длину ответа (Telegram ограничивает до 4096 символов)
             max_length = 4000  # Оставляем запас
@@ -1612,18 +2104,8 @@ class LandingBot:
                 logger.warning(f"Response too long ({len(response)} chars), truncating to {max_length}")
                 response = response[:max_length] + "\n\n... (сообщение обрезано)"
             
-            # Отправляем ответ с обработкой ошибок парсинга
-            try:
-                await update.message.reply_text(response, parse_mode='HTML')
-            except Exception as parse_error:
-                # Если HTML не работает, пробуем Markdown
-                try:
-                    await update.message.reply_text(response, parse_mode='Markdown')
-                except Exception:
-                    # Если и Markdown не работает, отправляем без разметки
-                    logger.warning(f"Parse error, sending plain text: {parse_error}")
-                    plain_response = response.replace('*', '').replace('_', '').replace('`', '').replace('<b>', '').replace('</b>', '').replace('<i>', '').replace('</i>', '')
-                    await update.message.reply_text(plain_response)
+            # Отправляем ответ (при ошибке разметки — plain-текст)
+            await self._reply_ai_text(update.message, agent, response)
             
             # Проверяем, готовы ли данные для генерации (после обработки сообщения и перехода стадий)
             logger.info(f"Current agent stage after processing: {agent.stage}")
@@ -1638,55 +2120,39 @@ class LandingBot:
                     # Переходим в verification
                     agent.stage = 'verification'
                     agent.collected_data['stage'] = 'verification'
+                    agent.dirty = True
                     logger.info("Auto-transitioned to verification stage - products complete")
                 elif agent.stage == 'verification':
                     # Переходим в generation
                     agent.stage = 'generation'
                     agent.collected_data['stage'] = 'generation'
+                    agent.dirty = True
                     logger.info("Auto-transitioned to generation stage - all data complete")
-                # Сохраняем состояние после перехода
-                self._save_ai_agent_state(user_id, agent)
+                # Сохраняем состояние после перехода (сливается с сохранением выше)
+                self._schedule_ai_agent_save(user_id, agent)
             
-            # Если агент в стадии generation, показываем кнопки (даже если LLM уже ответил)
+            # Если агент в стадии generation, показываем кнопки (даже если LLM уже ответил).
+            # Полнота уже проверена выше: смена этапа данные не меняет
             if agent.stage == 'generation':
-                is_complete, missing = agent.check_completeness()
                 if is_complete:
-                    # Проверяем, не были ли уже отправлены кнопки в этом сообщении
+                    # Сводка с кнопками строится и отправляется один раз на агента
                     # (чтобы не дублировать, если LLM уже упомянул генерацию)
-                    if not hasattr(agent, '_summary_sent') or not agent._summary_sent:
+                    if 'summary_sent' not in agent.ui_flags:
                         summary = self._format_ai_summary(agent.collected_data)
-                        keyboard = [
-                            [InlineKeyboardButton("✅ Да, генерировать", callback_data="ai_generate")],
-                            [InlineKeyboardButton("❌ Нет, исправить", callback_data="ai_edit")]
-                        ]
-                        reply_markup = InlineKeyboardMarkup(keyboard)
+                        reply_markup = self.ai_confirm_keyboard
                         
                         # Отправляем сводку с обработкой ошибок парсинга
                         summary_text = f"📋 <b>Сводка собранных данных:</b>\n\n{summary}\n\nВсё верно? Готов сгенерировать лендинг!"
-                        try:
-                            await update.message.reply_text(
-                                summary_text,
-                                reply_markup=reply_markup,
-                                parse_mode='HTML'
-                            )
-                            logger.info(f"Summary with buttons sent to user {user_id}")
-                            agent._summary_sent = True
-                        except Exception as parse_error:
-                            logger.warning(f"HTML parse error for summary, sending plain text: {parse_error}")
-                            plain_summary = summary_text.replace('<b>', '').replace('</b>', '').replace('<i>', '').replace('</i>', '')
-                            await update.message.reply_text(
-                                plain_summary,
-                                reply_markup=reply_markup
-                            )
-                            logger.info(f"Summary with buttons sent (plain text) to user {user_id}")
-                            agent._summary_sent = True
+                        await self._reply_ai_text(update.message, agent, summary_text, reply_markup=reply_markup)
+                        logger.info(f"Summary with buttons sent to user {user_id}")
+                        agent.ui_flags.add('summary_sent')
                 else:
                     logger.warning(f"Generation stage but data incomplete: {missing}")
-                    if not hasattr(agent, '_missing_data_sent') or not agent._missing_data_sent:
+                    if 'missing_data_sent' not in agent.ui_flags:
                         await update.message.reply_text(
                             f"⚠️ Не хватает данных:\n" + "\n".join([f"- {m}" for m in missing])
                         )
-                        agent._missing_data_sent = True
+                        agent.ui_flags.add('missing_data_sent')
         except Exception as e:
             logger.error(f"Error handling AI message: {e}", exc_info=True)
             
@@ -1710,14 +2176,14 @@ class LandingBot:
         user_id = update.effective_user.id
         
         # Проверяем, есть ли активный AI-агент
-        if user_id not in self.ai_agents:
+        entry = await self._get_ai_agent_entry(user_id, update.message.chat.id)
+        if entry is None:
             return ConversationHandler.END
         
-        agent = self.ai_agents[user_id]
+        agent = entry.agent
         
         # Обновляем время последней активности
-        import time
-        self.ai_agents_last_activity[user_id] = time.time()
+        self._touch_ai_agent(user_id, entry)
         
         try:
             # Определяем тип медиа
@@ -1742,14 +2208,11 @@ class LandingBot:
             # Добавляем расширение к пути ДО скачивания, чтобы файл сохранялся с расширением
             # (иначе генератор не находит файл при копировании в проект)
             ext = 'jpg' if file_type == 'photo' else (getattr(file_obj, 'mime_type', '') or 'mp4').split('/')[-1]
-            if ext not in ('jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mov', 'webm'):
+            if ext not in MEDIA_EXTENSIONS:
                 ext = 'jpg' if file_type == 'photo' else 'mp4'
-            file_path = os.path.join(Config.FILES_DIR, f'temp_{user_id}_{file_obj.file_unique_id}.{ext}')
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file_path = os.path.abspath(file_path)
+            file_path = os.path.abspath(os.path.join(Config.FILES_DIR, f'temp_{user_id}_{file_obj.file_unique_id}.{ext}'))
 
-            file = await self.app.bot.get_file(file_obj.file_id)
-            await file.download_to_drive(file_path)
+            await self._download_media(file_obj, file_path)
 
             file_info = {
                 'path': file_path,
@@ -1764,44 +2227,26 @@ class LandingBot:
             # Только фото без подписи — короткое подтверждение без вызова LLM
             if not caption:
                 total = await agent.add_files_only(files_list)
-                ordinals = ('Первое', 'Второе', 'Третье', 'Четвёртое', 'Пятое', 'Шестое', 'Седьмое', 'Восьмое', 'Девятое', 'Десятое')
-                which = ordinals[total - 1] if 1 <= total <= 10 else f'{total}-е'
+                which = _PHOTO_ORDINALS[total - 1] if 1 <= total <= len(_PHOTO_ORDINALS) else f'{total}-е'
                 await update.message.reply_text(f"✅ {which} фото получил.")
                 # Vision для hero-фото по возможности
-                files_after = agent.collected_data.get('files', [])
-                hero_file = next((f for f in files_after if f.get('block') == 'hero' and f.get('path') == file_path), None)
-                if hero_file and file_type == 'photo':
-                    products = agent.collected_data.get('products', [])
-                    has_description = bool(products and products[0].get('product_description'))
-                    if has_description and 'vision_style_suggestion' not in agent.collected_data:
-                        import asyncio
-                        asyncio.create_task(
-                            self._analyze_hero_image_async(user_id, file_path, products[0].get('product_name', ''), products[0].get('product_description', ''), agent)
-                        )
-                self._save_ai_agent_state(user_id, agent)
+                hero_file = agent.hero_file
+                if hero_file and hero_file.get('path') == file_path and file_type == 'photo':
+                    self._start_hero_vision(user_id, agent, file_path)
+                await self._save_ai_agent_state_async(user_id, agent)
             else:
-                # Фото с подписью — полная обработка через агента
+                # Фото с подписью — полная обработка через агента.
+                # Если описание товара уже есть и фото станет hero (hero ещё нет), vision-анализ
+                # запускается до вызова LLM и идёт параллельно с ним, а не после ответа
+                if file_type == 'photo' and agent.hero_file is None:
+                    self._start_hero_vision(user_id, agent, file_path)
                 response = await agent.process_message(caption, user_id, files=files_list)
-                files_after = agent.collected_data.get('files', [])
-                hero_file = next((f for f in files_after if f.get('block') == 'hero' and f.get('path') == file_path), None)
-                if hero_file and file_type == 'photo':
-                    products = agent.collected_data.get('products', [])
-                    has_description = bool(products and products[0].get('product_description'))
-                    if has_description and 'vision_style_suggestion' not in agent.collected_data:
-                        import asyncio
-                        asyncio.create_task(
-                            self._analyze_hero_image_async(user_id, file_path, products[0].get('product_name', ''), products[0].get('product_description', ''), agent)
-                        )
-                try:
-                    await update.message.reply_text(
-                        f"✅ Файл получен!\n\n{response}",
-                        parse_mode='HTML'
-                    )
-                except Exception:
-                    await update.message.reply_text(
-                        "✅ Файл получен!\n\n" + response.replace('<b>', '').replace('</b>', ''),
-                    )
-                self._save_ai_agent_state(user_id, agent)
+                hero_file = agent.hero_file
+                if hero_file and hero_file.get('path') == file_path and file_type == 'photo':
+                    # Описание могло прийти в этой же подписи
+                    self._start_hero_vision(user_id, agent, file_path)
+                await self._reply_ai_text(update.message, agent, f"✅ Файл получен!\n\n{response}")
+                await self._save_ai_agent_state_async(user_id, agent)
         except Exception as e:
             logger.error(f"Error handling AI media: {e}", exc_info=True)
             
@@ -1820,6 +2265,90 @@ class LandingBot:
         
         return AI_CONVERSATION
     
+    async def _reply_ai_text(self, message, agent, text: str, **kwargs):
+        """
+        Ответ в AI-диалоге с разметкой agent.parse_mode.
+        
+        Если Telegram не разобрал разметку, ответ уходит plain-текстом, а диалог переключается
+        на plain: следующие ответы не тратят лишний запрос на заведомо неудачную попытку.
+        """
+        if agent.parse_mode:
+            try:
+                return await message.reply_text(text, parse_mode=agent.parse_mode, **kwargs)
+            except BadRequest as e:
+                if 'parse' not in str(e).lower():
+                    raise
+                logger.warning(f"Parse error in AI reply, switching dialogue to plain text: {e}")
+                agent.parse_mode = None
+                agent.dirty = True
+        return await message.reply_text(_MARKUP_STRIP_RE.sub('', text), **kwargs)
+    
+    async def _send_landing_zip(self, chat_id: int, zip_file: Optional[str], caption: str = AI_LANDING_CAPTION, *, bot=None, filename: Optional[str] = None, **kwargs) -> bool:
+        """
+        Отправить архив лендинга документом; False, если архива нет.
+        
+        Файл открывается сразу (без отдельной проверки os.path.exists) и в потоке — открытие на медленной ФС
+        не блокирует event loop, а read_file_handle=False передаёт его в httpx, который читает кусками:
+        память не зависит от размера архива. kwargs (parse_mode, reply_markup) передаются в send_document.
+        """
+        if not zip_file:
+            return False
+        try:
+            f = await asyncio.to_thread(open, zip_file, 'rb')
+        except FileNotFoundError:
+            return False
+        with f:
+            await (bot or self.app.bot).send_document(
+                chat_id=chat_id,
+                document=InputFile(f, filename=filename or os.path.basename(zip_file), read_file_handle=False),
+                caption=caption,
+                **kwargs
+            )
+        return True
+    
+    async def _download_media(self, file_obj, file_path: str):
+        """
+        Скачать файл Telegram в file_path, если он ещё не скачан.
+        
+        Путь строится из file_unique_id (одинаков для повторной отправки того же файла),
+        поэтому уже существующий файл переиспользуется без запроса к Telegram.
+        Скачивание идёт во временный файл: оборванная загрузка не принимается за готовую.
+        """
+        # Проверки и операции с диском — в потоке: медленная ФС не задерживает апдейты других пользователей
+        if await asyncio.to_thread(_media_downloaded, file_path):
+            logger.debug(f"Media already downloaded: {file_path}")
+            return
+        async with self._download_semaphore:
+            file = await self.app.bot.get_file(file_obj.file_id)
+            part_path = f"{file_path}.part"
+            try:
+                await file.download_to_drive(part_path)
+                await asyncio.to_thread(os.replace, part_path, file_path)
+            except Exception:
+                await asyncio.to_thread(_remove_file, part_path)
+                raise
+    
+    @staticmethod
+    def _hero_vision_needed(agent) -> bool:
+        """Есть описание товара, а vision-анализ ещё не выполнен и не запущен"""
+        products = agent.collected_data.get('products') or []
+        return bool(
+            products and products[0].get('product_description')
+            and 'vision_style_suggestion' not in agent.collected_data
+            and 'vision_running' not in agent.ui_flags
+        )
+    
+    def _start_hero_vision(self, user_id: int, agent, image_path: str) -> bool:
+        """Запуск vision-анализа hero-фото в фоне, если он нужен; True — задача создана"""
+        if not self._hero_vision_needed(agent):
+            return False
+        product = agent.collected_data['products'][0]
+        agent.ui_flags.add('vision_running')
+        self._spawn_background(
+            self._analyze_hero_image_async(user_id, image_path, product.get('product_name', ''), product.get('product_description', ''), agent)
+        )
+        return True
+    
     async def _analyze_hero_image_async(self, user_id: int, image_path: str, product_name: str, description: str, agent):
         """
         Асинхронный анализ hero-фото через Vision API (выполняется в фоне, не блокирует диалог)
@@ -1834,18 +2363,15 @@ class LandingBot:
         try:
             logger.info(f"Starting vision analysis for user {user_id}, image: {image_path}")
             
-            # Используем LLM клиент из code_generator (или создаем новый)
-            from backend.generator.llm_client import LLMClient
-            llm_client = LLMClient()
-            
-            vision_result = await llm_client.analyze_image_style(image_path, product_name, description)
+            vision_result = await self.llm_client.analyze_image_style(image_path, product_name, description)
             
             if vision_result and 'colors' in vision_result and 'fonts' in vision_result:
                 # Сохраняем результат в агента
                 agent.collected_data['vision_style_suggestion'] = vision_result
+                agent.dirty = True
                 
                 # Сохраняем состояние агента в БД
-                self._save_ai_agent_state(user_id, agent)
+                await self._save_ai_agent_state_async(user_id, agent)
                 
                 logger.info(
                     f"✓ Vision analysis completed for user {user_id}: "
@@ -1864,6 +2390,9 @@ class LandingBot:
         except Exception as e:
             logger.error(f"Error in background vision analysis for user {user_id}: {e}", exc_info=True)
             # Не прерываем диалог при ошибке vision-анализа - используем текстовый fallback
+        finally:
+            # При неудаче анализ можно запустить повторно на следующем сообщении
+            agent.ui_flags.discard('vision_running')
     
     def _format_ai_summary(self, collected_data: Dict[str, Any]) -> str:
         """Форматирование сводки собранных данных"""
@@ -1901,16 +2430,11 @@ class LandingBot:
             # Очищаем временные файлы
             await self._cleanup_ai_agent_files(user_id)
             del self.ai_agents[user_id]
-            if user_id in self.ai_agents_last_activity:
-                del self.ai_agents_last_activity[user_id]
             logger.info(f"AI agent cancelled for user {user_id}")
+        await self._discard_ai_agent_save(user_id)
         
         # Очищаем состояние агента из БД
-        user_data = self._get_user_data(user_id)
-        user_data.pop('ai_agent_state', None)
-        user_data.pop('ai_agent_active', None)
-        user_data.pop('last_activity', None)
-        self._save_user_data(user_id, user_data, state=None, conversation_type=None)
+        await asyncio.to_thread(self._clear_ai_agent_states, [user_id])
         
         await self.app.bot.send_message(
             chat_id=chat_id,
@@ -1923,85 +2447,125 @@ class LandingBot:
         await self.cancel_ai_mode(user_id, update.message.chat.id)
         return ConversationHandler.END
     
+    async def _answer_callback_safe(self, query, text: Optional[str] = None):
+        """Ответ на callback-запрос; ошибка только логируется"""
+        try:
+            await query.answer(text, cache_time=CALLBACK_ANSWER_CACHE_TIME)
+        except Exception as e:
+            logger.error(f"Error answering callback query: {e}", exc_info=True)
+
+    def _answer_callback(self, query, text: Optional[str] = None):
+        """Ответ на callback-запрос в фоне: спиннер у пользователя снимается, обработчик не ждёт HTTP-запроса"""
+        self._spawn_background(self._answer_callback_safe(query, text))
+
+    def _spawn_background(self, coro) -> asyncio.Task:
+        """Запуск корутины фоновой задачей; ссылка на задачу хранится до её завершения"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
     async def handle_ai_generate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка подтверждения генерации в AI-режиме"""
-        logger.info("=" * 80)
-        logger.info("handle_ai_generate CALLED")
-        logger.info("=" * 80)
-        
         if not update.callback_query:
             logger.error("handle_ai_generate called without callback_query")
             return ConversationHandler.END
         
         query = update.callback_query
         user_id = query.from_user.id
+        # Отвечаем на callback до любой работы; повторный клик (или дубль callback от клиента),
+        # пока генерация идёт, только подтверждается
+        busy = user_id in self._ai_generating
+        self._answer_callback(query, AI_GENERATION_BUSY_TEXT if busy else None)
         
         logger.info(f"User {user_id} clicked generate button (callback_data: {query.data})")
-        logger.info(f"Current conversation state: {context.user_data.get('_conversation_state')}")
-        logger.info(f"AI agents available: {list(self.ai_agents.keys())}")
+        # Подробности — только на уровне DEBUG: аргументы не вычисляются, если он выключен
+        logger.debug("Current conversation state: %s", context.user_data.get('_conversation_state'))
         
-        try:
-            await query.answer()
-            logger.info("Callback query answered successfully")
-        except Exception as e:
-            logger.error(f"Error answering callback query: {e}", exc_info=True)
+        if busy:
+            return AI_CONVERSATION
         
-        if user_id not in self.ai_agents:
+        self._ai_generating.add(user_id)
+        try:
+            return await self._generate_ai_landing(query, user_id)
+        finally:
+            self._ai_generating.discard(user_id)
+    
+    async def _edit_query_message(self, query, text: str):
+        """
+        Изменить сообщение с кнопкой: при RetryAfter — одна повторная попытка после паузы Telegram,
+        если сообщение нельзя отредактировать — отправляется новое
+        """
+        for attempt in range(2):
+            try:
+                await query.edit_message_text(text)
+                return
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+            except BadRequest as e:
+                logger.warning(f"Could not edit message, sending new one: {e}")
+                await query.message.reply_text(text)
+                return
+    
+    async def _generate_ai_landing(self, query, user_id: int):
+        """Генерация лендинга по данным AI-агента после нажатия «Да, генерировать»"""
+        entry = await self._get_ai_agent_entry(user_id, query.message.chat.id)
+        if entry is None:
             logger.warning(f"AI agent not found for user {user_id}")
-            await query.edit_message_text("❌ AI-агент не найден. Начните заново с /ai")
+            await self._edit_query_message(query, "❌ AI-агент не найден. Начните заново с /ai")
             return ConversationHandler.END
         
-        agent = self.ai_agents[user_id]
+        agent = entry.agent
         
         try:
-            # Проверка rate limit перед генерацией
-            logger.info(f"Checking rate limit for user {user_id}")
-            allowed, remaining = await rate_limiter.check_db_rate_limit(user_id)
-            if not allowed:
-                logger.warning(f"Rate limit exceeded for user {user_id}")
-                await query.edit_message_text(
-                    f"⏸️ Превышен лимит запросов\n\n"
-                    f"Вы можете создать максимум {rate_limiter.max_requests} "
-                    f"лендингов в час.\n\n"
-                    f"Попробуйте позже."
-                )
-                return ConversationHandler.END
-            logger.info(f"Rate limit OK for user {user_id}, starting generation")
-            await query.edit_message_text("🔄 Генерирую лендинг... Это может занять несколько минут.")
-            
-            # Восстановить токен/chat_id из истории, если не попали в general_info
-            agent.recover_telegram_credentials_from_history()
-            # Преобразуем данные агента в формат user_data
-            logger.info(f"Converting AI agent data to user_data for user {user_id}")
-            logger.info(f"Agent collected_data keys: {list(agent.collected_data.keys())}")
-            logger.info(f"Agent products count: {len(agent.collected_data.get('products', []))}")
-            if agent.collected_data.get('products'):
-                logger.info(f"First product keys: {list(agent.collected_data['products'][0].keys())}")
-            
-            user_data = agent.convert_to_user_data()
-            logger.info(f"Converted user_data keys: {list(user_data.keys())}")
-            logger.info(f"Converted user_data values: {user_data}")
-            
+            # Сначала дешёвые локальные проверки: повторные клики с неполными данными
+            # не идут в БД за лимитом и не тратят его
             # Без фото лендинг будет без главного изображения — требуем хотя бы одно
-            has_photo = bool(user_data.get('hero_media') or user_data.get('photos') or agent.collected_data.get('files'))
-            if not has_photo:
-                await query.edit_message_text(
+            # (все медиа user_data — hero_media, photos — строятся из collected_data['files'])
+            if not agent.collected_data.get('files'):
+                await self._edit_query_message(
+                    query,
                     "📷 Чтобы лендинг выглядел привлекательно, нужна хотя бы одна фотография товара.\n\n"
                     "Отправьте фото в чат (оно будет главным изображением на странице), "
                     "затем снова нажмите «Да, генерировать»."
                 )
                 return AI_CONVERSATION
+            # Восстановить токен/chat_id из истории, если не попали в general_info
+            agent.recover_telegram_credentials_from_history()
             # Валидация данных перед генерацией
-            logger.info(f"Validating data for user {user_id}")
             validation_errors = agent.validate_data()
-            logger.info(f"Validation result: errors={validation_errors}")
             
             if validation_errors:
                 logger.warning(f"Validation errors for user {user_id}: {validation_errors}")
                 error_msg = "❌ Обнаружены ошибки в данных:\n\n" + "\n".join([f"• {e}" for e in validation_errors])
-                await query.edit_message_text(error_msg + "\n\nПожалуйста, исправьте данные и попробуйте снова.")
+                await self._edit_query_message(query, error_msg + "\n\nПожалуйста, исправьте данные и попробуйте снова.")
                 return AI_CONVERSATION
             
+            # Проверка rate limit перед генерацией
+            allowed, remaining = await rate_limiter.check_db_rate_limit(user_id)
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for user {user_id}")
+                await self._edit_query_message(
+                    query,
+                    f"⏸️ Превышен лимит запросов\n\n"
+                    f"Вы можете создать максимум {rate_limiter.max_requests} "
+                    f"лендингов в час.\n\n"
+                    f"Попробуйте позже."
+                )
+                return ConversationHandler.END
+            await self._edit_query_message(query, "🔄 Генерирую лендинг... Это может занять несколько минут.")
+            
+            # Преобразуем данные агента в формат user_data
+            user_data = agent.convert_to_user_data()
+            if logger.isEnabledFor(logging.DEBUG):
+                products = agent.collected_data.get('products') or []
+                logger.debug("Agent collected_data keys: %s", list(agent.collected_data))
+                logger.debug("Agent products count: %s, first product keys: %s", len(products), list(products[0]) if products else [])
+                logger.debug("Converted user_data: %s", user_data)
+            
             # Генерируем лендинг
             template_id = 'single_product' if agent.mode == 'SINGLE' else 'multi_product'
             logger.info(f"Starting generation for user {user_id}, template_id: {template_id}, landing_type: {user_data.get('landing_type')}")
@@ -2012,49 +2576,33 @@ class LandingBot:
             
             if result.get('success'):
                 # Отправляем результат
-                files_info = result.get('files', {})
+                files_info = result.get('files') or _EMPTY_MAPPING
                 zip_file = files_info.get('zip_file')
                 
                 logger.info(f"Generation successful for user {user_id}, zip_file: {zip_file}")
                 
-                if zip_file and os.path.exists(zip_file):
-                    logger.info(f"Sending zip file to user {user_id}: {zip_file}")
-                    try:
-                        with open(zip_file, 'rb') as f:
-                            await self.app.bot.send_document(
-                                chat_id=query.message.chat.id,
-                                document=f,
-                                filename=os.path.basename(zip_file),
-                                caption="✅ Лендинг успешно сгенерирован!"
-                            )
-                        logger.info(f"Zip file sent successfully to user {user_id}")
-                        try:
-                            await query.edit_message_text(
-                                "✅ Готово! Лендинг отправлен в чат.\n\nЧтобы создать новый — отправьте /ai"
-                            )
-                        except Exception:
-                            pass
-                    except Exception as send_error:
-                        logger.error(f"Error sending zip file to user {user_id}: {send_error}", exc_info=True)
-                        await query.edit_message_text(f"✅ Лендинг сгенерирован, но произошла ошибка при отправке: {str(send_error)}")
+                logger.info(f"Sending zip file to user {user_id}: {zip_file}")
+                try:
+                    sent = await self._send_landing_zip(query.message.chat.id, zip_file)
+                except Exception as send_error:
+                    logger.error(f"Error sending zip file to user {user_id}: {send_error}", exc_info=True)
+                    await self._edit_query_message(query, f"✅ Лендинг сгенерирован, но произошла ошибка при отправке: {str(send_error)}")
                 else:
-                    logger.error(f"Zip file not found for user {user_id}: {zip_file}")
-                    await query.edit_message_text("✅ Лендинг сгенерирован, но файл не найден.")
+                    # Подпись архива и есть итоговое сообщение — сообщение с кнопкой больше не редактируем
+                    if sent:
+                        logger.info(f"Zip file sent successfully to user {user_id}")
+                    else:
+                        logger.error(f"Zip file not found for user {user_id}: {zip_file}")
+                        await self._edit_query_message(query, "✅ Лендинг сгенерирован, но файл не найден.")
                 
                 # Очищаем агента и временные файлы после успешной генерации
                 logger.info(f"Cleaning up AI agent for user {user_id}")
                 await self._cleanup_ai_agent_files(user_id)
-                if user_id in self.ai_agents:
-                    del self.ai_agents[user_id]
-                if user_id in self.ai_agents_last_activity:
-                    del self.ai_agents_last_activity[user_id]
+                self.ai_agents.pop(user_id, None)
+                await self._discard_ai_agent_save(user_id)
                 
                 # Очищаем состояние агента из БД
-                user_data = self._get_user_data(user_id)
-                user_data.pop('ai_agent_state', None)
-                user_data.pop('ai_agent_active', None)
-                user_data.pop('last_activity', None)
-                self._save_user_data(user_id, user_data, state=None, conversation_type=None)
+                await asyncio.to_thread(self._clear_ai_agent_states, [user_id])
                 
                 # Завершаем ConversationHandler
                 return ConversationHandler.END
@@ -2062,22 +2610,22 @@ class LandingBot:
                 error = result.get('error', 'Неизвестная ошибка')
                 logger.error(f"Generation failed for user {user_id}: {error}")
                 formatted_error = self._format_error_message(error)
-                await query.edit_message_text(f"❌ Ошибка генерации:\n\n{formatted_error}")
+                await self._edit_query_message(query, f"❌ Ошибка генерации:\n\n{formatted_error}")
                 return AI_CONVERSATION  # Возвращаемся в состояние разговора для повторной попытки
         except Exception as e:
             logger.error(f"Error generating from AI agent for user {user_id}: {e}", exc_info=True)
             formatted_error = self._format_error_message(str(e))
-            await query.edit_message_text(f"❌ Произошла ошибка:\n\n{formatted_error}")
+            await self._edit_query_message(query, f"❌ Произошла ошибка:\n\n{formatted_error}")
             return AI_CONVERSATION  # Возвращаемся в состояние разговора
     
     async def handle_ai_edit(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка запроса на редактирование данных в AI-режиме"""
         query = update.callback_query
-        await query.answer()
+        self._answer_callback(query)
         
         user_id = query.from_user.id
         
-        if user_id not in self.ai_agents:
+        if await self._get_ai_agent_entry(user_id) is None:
             await query.edit_message_text("❌ AI-агент не найден.")
             return
         
@@ -2094,61 +2642,148 @@ class LandingBot:
                 "📝 Что хотите изменить?\n\n"
                 "Напишите, какие данные нужно исправить, и я помогу вам их обновить."
             )
-            await query.answer()
+    
+    def _flush_ai_activity(self):
+        """Записать в данные пользователей last_activity AI-агентов, изменившееся с прошлого сброса (одной транзакцией)"""
+        dirty = {
+            user_id: entry.last_activity
+            for user_id, entry in list(self.ai_agents.items())
+            if entry.last_activity != entry.saved_activity
+        }
+        if not dirty:
+            return
+        if self._state_store:
+            for user_id, last_activity in dirty.items():
+                self._merge_user_data(user_id, {'last_activity': last_activity})
+        else:
+            with self._session() as db:
+                patches = {user_id: self._json_patch(db, {'last_activity': last_activity}) for user_id, last_activity in dirty.items()}
+                if all(patch is not None for patch in patches.values()):
+                    # Только ключ last_activity — UPDATE на стороне БД, без чтения записей
+                    for user_id, patch in patches.items():
+                        db.execute(update(UserState).where(UserState.user_id == user_id).values(data=patch))
+                else:
+                    rows = db.execute(select(UserState).where(UserState.user_id.in_(list(dirty)))).scalars()
+                    for user_state in rows:
+                        user_state.data = {**(user_state.data or {}), 'last_activity': dirty[user_state.user_id]}
+                db.commit()
+        for user_id, last_activity in dirty.items():
+            entry = self.ai_agents.get(user_id)
+            if entry:
+                entry.saved_activity = last_activity
+            cached = self._user_data_cache.get(user_id)
+            if cached is not None:
+                self._user_data_cache.set(user_id, {**cached, 'last_activity': last_activity})
+    
+    def _pop_expired_ai_agents(self, now: float) -> List[int]:
+        """
+        Извлечь из кучи сроков пользователей, чьи агенты простаивают дольше AI_AGENT_INACTIVE_TIMEOUT.
+        
+        Элементы устаревают лениво: агент, активный после постановки в кучу, возвращается
+        в неё с новым сроком, а уже удалённый из реестра — просто отбрасывается.
+        Агенты, только выгруженные при переполнении реестра, истекают по сохранённому last_activity.
+        """
+        expired = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, user_id = heapq.heappop(heap)
+            entry = self.ai_agents.get(user_id)
+            last_activity = entry.last_activity if entry else self._unloaded_activity.get(user_id)
+            expires_at = last_activity + AI_AGENT_INACTIVE_TIMEOUT if last_activity is not None else None
+            if expires_at is not None and expires_at > now:
+                heapq.heappush(heap, (expires_at, user_id))
+                continue
+            self._expiry_tracked.discard(user_id)
+            self._unloaded_activity.pop(user_id, None)
+            if expires_at is not None:
+                expired.append(user_id)
+        return expired
+    
+    def _clear_ai_agent_states(self, user_ids: List[int]):
+        """
+        Удалить сохранённые состояния AI-агентов (ai_agent_state, ai_agent_active, last_activity) — в БД одной транзакцией.
+        
+        Ключи удаляются одним UPDATE ... WHERE user_id IN (...) на стороне БД (_json_remove), без чтения записей;
+        если диалект это не поддерживает — записи читаются одним SELECT и переписываются.
+        """
+        cleared: Dict[int, Dict[str, Any]] = {}
+        misses = []
+        for user_id in user_ids:
+            self._ai_agent_snapshots.pop(user_id)
+            cached = self._user_data_cache.pop(user_id)
+            if cached is None:
+                misses.append(user_id)
+            elif any(key in cached for key in AI_AGENT_STATE_KEYS):
+                cleared[user_id] = {k: v for k, v in cached.items() if k not in AI_AGENT_STATE_KEYS}
+        try:
+            if self._state_store:
+                for user_id in [*cleared, *misses]:
+                    record = self._state_store.load(user_id)
+                    if record:
+                        data = {k: v for k, v in (record.get('data') or {}).items() if k not in AI_AGENT_STATE_KEYS}
+                        self._state_store.save(user_id, data, record=record)
+                return
+            with self._session() as db:
+                removed = self._json_remove(db, AI_AGENT_STATE_KEYS)
+                if removed is not None:
+                    if cleared or misses:
+                        db.execute(
+                            update(UserState)
+                            .where(UserState.user_id.in_([*cleared, *misses]))
+                            .values(data=removed, agent_blob=None)
+                        )
+                else:
+                    for user_id, data in cleared.items():
+                        db.execute(update(UserState).where(UserState.user_id == user_id).values(data=data, agent_blob=None))
+                    if misses:
+                        rows = db.execute(select(UserState).where(UserState.user_id.in_(misses))).scalars()
+                        for user_state in rows:
+                            user_state.data = {k: v for k, v in (user_state.data or {}).items() if k not in AI_AGENT_STATE_KEYS}
+                            user_state.agent_blob = None
+                db.commit()
+            for user_id, data in cleared.items():
+                self._user_data_cache.set(user_id, data)
+        except Exception as e:
+            logger.error(f"Error clearing AI agent states for users {user_ids}: {e}", exc_info=True)
+    
+    async def _unload_inactive_ai_agents(self, user_ids: List[int]):
+        """Выгрузить неактивных AI-агентов: временные файлы, реестр и сохранённое состояние"""
+        for user_id in user_ids:
+            logger.info(f"Cleaning up inactive AI agent for user {user_id}")
+            self.ai_agents.pop(user_id, None)
+            await self._discard_ai_agent_save(user_id)
+        # Временные файлы агентов удаляем параллельно, состояния в БД — одним UPDATE
+        await asyncio.gather(*(self._cleanup_ai_agent_files(user_id) for user_id in user_ids))
+        await asyncio.to_thread(self._clear_ai_agent_states, user_ids)
+        logger.info(f"Cleaned up {len(user_ids)} inactive AI agents")
     
     def _start_ai_agents_cleanup_task(self):
-        """Запуск периодической очистки неактивных AI-агентов"""
+        """Запуск фоновой выгрузки неактивных AI-агентов (просыпается к ближайшему сроку, без обхода реестра)"""
         async def cleanup_task():
-            import time
+            next_flush = time.time() + AI_ACTIVITY_FLUSH_INTERVAL
             while True:
                 try:
-                    await asyncio.sleep(300)  # Проверяем каждые 5 минут
-                    current_time = time.time()
-                    inactive_timeout = 1800  # 30 минут неактивности
-                    
-                    # Находим неактивных агентов
-                    inactive_users = []
-                    for user_id, last_activity in list(self.ai_agents_last_activity.items()):
-                        if current_time - last_activity > inactive_timeout:
-                            inactive_users.append(user_id)
-                    
-                    # Очищаем неактивных агентов
-                    for user_id in inactive_users:
-                        if user_id in self.ai_agents:
-                            logger.info(f"Cleaning up inactive AI agent for user {user_id}")
-                            # Очищаем временные файлы агента
-                            await self._cleanup_ai_agent_files(user_id)
-                            del self.ai_agents[user_id]
-                            del self.ai_agents_last_activity[user_id]
-                            
-                            # Очищаем состояние агента из БД
-                            user_data = self._get_user_data(user_id)
-                            user_data.pop('ai_agent_state', None)
-                            user_data.pop('ai_agent_active', None)
-                            user_data.pop('last_activity', None)
-                            self._save_user_data(user_id, user_data, state=None, conversation_type=None)
+                    next_expiry = self._expiry_heap[0][0] if self._expiry_heap else next_flush
+                    await asyncio.sleep(max(0.0, min(next_flush, next_expiry) - time.time()))
+                    now = time.time()
+                    if now >= next_flush:
+                        next_flush = now + AI_ACTIVITY_FLUSH_INTERVAL
+                        # Время активности пишем в БД здесь, пакетом, а не на каждое сообщение
+                        await asyncio.to_thread(self._flush_ai_activity)
                     
+                    inactive_users = self._pop_expired_ai_agents(now)
                     if inactive_users:
-                        logger.info(f"Cleaned up {len(inactive_users)} inactive AI agents")
+                        await self._unload_inactive_ai_agents(inactive_users)
                 except Exception as e:
                     logger.error(f"Error in AI agents cleanup task: {e}", exc_info=True)
         
         # Запускаем задачу в фоне
-        asyncio.create_task(cleanup_task())
+        self._spawn_background(cleanup_task())
         logger.info("AI agents cleanup task started")
     
     async def _cleanup_ai_agent_files(self, user_id: int):
-        """Очистка временных файлов AI-агента"""
+        """Очистка временных файлов AI-агента (обход каталога и удаление — в потоке, не в event loop)"""
         try:
-            import glob
-            temp_pattern = os.path.join(Config.FILES_DIR, f'temp_{user_id}_*')
-            temp_files = glob.glob(temp_pattern)
-            for file_path in temp_files:
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logger.debug(f"Removed temp file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to remove temp file {file_path}: {e}")
+            await asyncio.to_thread(_remove_files, Config.FILES_DIR, f'temp_{user_id}_')
         except Exception as e:
             logger.error(f"Error cleaning up AI agent files: {e}", exc_info=True)
@@ -28,6 +28,17 @@ class Config:
     
     # Database
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///landing_bot.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))  # Постоянные соединения в пуле (PostgreSQL)
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))  # Дополнительные соединения сверх пула
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # Ожидание свободного соединения в секундах
+    USER_DATA_CACHE_SIZE = int(os.getenv('USER_DATA_CACHE_SIZE', '10000'))  # Записей UserState.data в памяти
+    AI_EXTRACTION_CACHE_SIZE = int(os.getenv('AI_EXTRACTION_CACHE_SIZE', '2000'))  # Ответов LLM-извлечения данных в памяти
+    GENERATED_CODE_CACHE_SIZE = int(os.getenv('GENERATED_CODE_CACHE_SIZE', '100'))  # Ответов LLM-генерации лендинга в памяти
+    MAX_AI_AGENTS = int(os.getenv('MAX_AI_AGENTS', '5000'))  # AI-агентов в памяти процесса (давние выгружаются, состояние остаётся в БД/Redis)
+    
+    # Redis (опционально): если задан, состояние диалога хранится в Redis вместо таблицы user_states
+    REDIS_URL = os.getenv('REDIS_URL', '')
+    USER_STATE_TTL = int(os.getenv('USER_STATE_TTL', '86400'))  # Время жизни состояния в Redis в секундах (сутки)
     
     # File Storage
     FILES_DIR = os.getenv('FILES_DIR', 'generated_landings')
@@ -51,9 +62,11 @@ class Config:
     LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
     LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', '10485760'))  # 10MB
     LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_JSON = os.getenv('LOG_JSON', '').lower() in ('1', 'true', 'yes')  # JSON-строки вместо текста (для сбора логов)
     
     # Prompt Optimization
     MAX_PROMPT_LENGTH = int(os.getenv('MAX_PROMPT_LENGTH', '15000'))  # Максимальная длина промпта
+    DEBUG_PROMPTS = os.getenv('DEBUG_PROMPTS', '').lower() in ('1', 'true', 'yes')  # Сохранять промпты в FILES_DIR/prompts для отладки
     
     # AI Agent Settings
     AI_AGENT_TIMEOUT = int(os.getenv('AI_AGENT_TIMEOUT', '1800'))  # Таймаут для AI-агента в секундах (30 минут)
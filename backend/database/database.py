@@ -1,10 +1,11 @@
 """
 Управление базой данных
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, close_all_sessions
 from backend.database.models import Base
 from backend.config import Config
+from backend.utils.helpers import json_dumps_text, json_loads
 
 # Создание движка БД
 # Оптимизация для PostgreSQL (из DEPLOYMENT_INSTRUCTIONS.md)
@@ -13,9 +14,13 @@ if "postgresql" in Config.DATABASE_URL or "postgres" in Config.DATABASE_URL:
         Config.DATABASE_URL,
         echo=False,  # Включить для отладки SQL запросов
         pool_pre_ping=True,  # Проверка соединения перед использованием
-        pool_size=10,  # Количество соединений
-        max_overflow=20,  # Максимум дополнительных соединений
+        pool_size=Config.DB_POOL_SIZE,  # Количество соединений
+        max_overflow=Config.DB_MAX_OVERFLOW,  # Максимум дополнительных соединений
+        pool_timeout=Config.DB_POOL_TIMEOUT,  # Ожидание свободного соединения из пула
         pool_recycle=3600,  # Переподключение каждый час
+        pool_use_lifo=True,  # Отдаём последнее возвращённое ("тёплое") соединение
+        json_serializer=json_dumps_text,  # Колонки JSON — через orjson, если установлен
+        json_deserializer=json_loads,
     )
 else:
     # Для SQLite
@@ -23,11 +28,27 @@ else:
         Config.DATABASE_URL,
         echo=False,
         pool_pre_ping=True,
-        connect_args={"check_same_thread": False}
+        # timeout: писатель ждёт освобождения блокировки, а не падает с "database is locked"
+        connect_args={"check_same_thread": False, "timeout": 30},
+        json_serializer=json_dumps_text,
+        json_deserializer=json_loads,
     )
 
-# Создание сессии
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        WAL: чтения не блокируются записью, а запись не ждёт читателей;
+        synchronous=NORMAL в WAL — fsync только на checkpoint (при сбое ОС теряются лишь последние транзакции)
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+# Фабрика сессий: каждый вызов SessionLocal() — новая сессия (не thread-local scoped_session:
+# корутины в одном потоке event loop не делят сессию и её identity map)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     """Инициализация базы данных (создание таблиц)"""
@@ -44,4 +65,5 @@ def get_db():
 
 def close_db():
     """Закрыть все соединения с БД"""
-    SessionLocal.remove()
+    close_all_sessions()
+    engine.dispose()
@@ -1,13 +1,37 @@
 """
 Модели базы данных
 """
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Text, ForeignKey, Boolean, LargeBinary, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.sql.expression import FunctionElement
 
 Base = declarative_base()
 
+
+class utcnow(FunctionElement):
+    """Текущее время UTC, вычисляемое на стороне БД (naive, как datetime.utcnow)"""
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+@compiles(utcnow, 'sqlite')
+def _utcnow_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP в SQLite — с точностью до секунды, берём миллисекунды
+    return "STRFTIME('%Y-%m-%d %H:%M:%f', 'now')"
+
 class User(Base):
     """Модель пользователя"""
     __tablename__ = 'users'
@@ -18,8 +42,8 @@ class User(Base):
     first_name = Column(String(100), nullable=True)
     last_name = Column(String(100), nullable=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow(), server_default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), server_default=utcnow(), onupdate=utcnow())
     
     # Связи
     projects = relationship('Project', back_populates='user', cascade='all, delete-orphan')
@@ -54,8 +78,8 @@ class Project(Base):
     
     # Метаданные
     generation_time = Column(Integer, nullable=True)  # Время генерации в секундах
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow(), server_default=utcnow(), index=True)
+    updated_at = Column(DateTime, default=utcnow(), server_default=utcnow(), onupdate=utcnow())
     
     # Связи
     user = relationship('User', back_populates='projects')
@@ -84,7 +108,7 @@ class Generation(Base):
     success = Column(Boolean, default=False)
     error_message = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=utcnow(), server_default=utcnow(), index=True)
     
     def __repr__(self):
         return f"<Generation(id={self.id}, project_id={self.project_id}, success={self.success})>"
@@ -95,12 +119,26 @@ class UserState(Base):
     __tablename__ = 'user_states'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(String(50), unique=True, nullable=False, index=True)
+    user_id = Column(BigInteger, unique=True, nullable=False, index=True)  # Telegram ID (целое, до 2^52)
     state = Column(String(50), nullable=True)  # Текущее состояние диалога
-    data = Column(JSON, nullable=False, default=dict)  # Все данные пользователя
+    # Все данные пользователя; в PostgreSQL — JSONB: отдельные ключи дописываются в UPDATE без перезаписи всего объекта
+    data = Column(JSON().with_variant(JSONB(), 'postgresql'), nullable=False, default=dict)
+    agent_blob = Column(LargeBinary, nullable=True)  # Сжатое состояние AI-агента (helpers.pack_json)
     conversation_type = Column(String(50), nullable=True)  # 'quick' или 'create'
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Время ставит БД (выражение прямо в INSERT/UPDATE); default нужен для таблиц, созданных без server_default
+    created_at = Column(DateTime, default=utcnow(), server_default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), server_default=utcnow(), onupdate=utcnow())
+    
+    # Частичный индекс для восстановления AI-агентов при старте: в нём только строки активных диалогов,
+    # поэтому выборка не просматривает всю таблицу (условие совпадает с фильтром запроса)
+    __table_args__ = (
+        Index(
+            'ix_user_states_active_ai_agents',
+            'user_id',
+            postgresql_where=text("conversation_type = 'ai_agent' AND state = 'AI_CONVERSATION'"),
+            sqlite_where=text("conversation_type = 'ai_agent' AND state = 'AI_CONVERSATION'"),
+        ),
+    )
     
     def __repr__(self):
         return f"<UserState(user_id={self.user_id}, state={self.state})>"
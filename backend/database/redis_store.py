@@ -0,0 +1,100 @@
+"""
+Хранилище состояния диалога (UserState) в Redis
+
+Используется вместо таблицы user_states, если задан REDIS_URL: состояние пишется
+на каждое сообщение и читается только по user_id — это KV-нагрузка, которой не нужны
+транзакции и WAL PostgreSQL. Пользователи, проекты и генерации остаются в БД.
+"""
+import logging
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from backend.config import Config
+from backend.utils.helpers import json_loads, json_dumps
+
+try:
+    import redis
+except ImportError:  # redis опционален: без него состояние хранится в PostgreSQL
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'us:'
+# Множество user_id с активным AI-агентом (для восстановления после рестарта)
+AI_AGENTS_KEY = 'us:ai_agents'
+
+
+class RedisUserStateStore:
+    """Состояние пользователя в Redis: us:{user_id} -> JSON {data, state, conversation_type}"""
+
+    def __init__(self, client, ttl: int = 86400):
+        """
+        Args:
+            client: Синхронный клиент redis.Redis
+            ttl: Время жизни записи в секундах (продлевается при каждой записи)
+        """
+        self.client = client
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls) -> Optional['RedisUserStateStore']:
+        """Хранилище по Config.REDIS_URL или None, если Redis не настроен или не установлен"""
+        if not Config.REDIS_URL:
+            return None
+        if redis is None:
+            logger.warning("REDIS_URL задан, но пакет redis не установлен — состояние хранится в БД")
+            return None
+        client = redis.Redis.from_url(Config.REDIS_URL, decode_responses=False)
+        return cls(client, ttl=Config.USER_STATE_TTL)
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"{KEY_PREFIX}{user_id}"
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Запись пользователя ({data, state, conversation_type}) или None"""
+        raw = self.client.get(self._key(user_id))
+        return json_loads(raw) if raw else None
+
+    def save(self, user_id: int, data: Dict[str, Any], state: Optional[str] = None, conversation_type: Optional[str] = None, record: Optional[Dict[str, Any]] = None):
+        """
+        Сохранение данных пользователя.
+
+        Как и для UserState в БД, state/conversation_type=None не меняют сохранённые значения.
+        record — уже прочитанная запись (чтобы не читать её повторно).
+        """
+        if record is None and (state is None or conversation_type is None):
+            record = self.load(user_id)
+        record = record or {}
+        state = state if state is not None else record.get('state')
+        conversation_type = conversation_type if conversation_type is not None else record.get('conversation_type')
+
+        payload = json_dumps({'data': data, 'state': state, 'conversation_type': conversation_type})
+        pipe = self.client.pipeline()
+        pipe.set(self._key(user_id), payload, ex=self.ttl)
+        if conversation_type == 'ai_agent' and state == 'AI_CONVERSATION':
+            pipe.sadd(AI_AGENTS_KEY, user_id)
+        else:
+            pipe.srem(AI_AGENTS_KEY, user_id)
+        pipe.execute()
+
+    def delete(self, user_id: int):
+        """Удаление записи пользователя"""
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(user_id))
+        pipe.srem(AI_AGENTS_KEY, user_id)
+        pipe.execute()
+
+    def iter_ai_agents(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(user_id, data) пользователей с активным AI-агентом; истёкшие записи убираются из множества"""
+        user_ids = [int(uid) for uid in self.client.smembers(AI_AGENTS_KEY)]
+        if not user_ids:
+            return
+        raws = self.client.mget([self._key(uid) for uid in user_ids])
+        expired = []
+        for user_id, raw in zip(user_ids, raws):
+            if raw is None:
+                expired.append(user_id)
+                continue
+            yield user_id, json_loads(raw).get('data') or {}
+        if expired:
+            self.client.srem(AI_AGENTS_KEY, *expired)
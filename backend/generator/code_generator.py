@@ -2,18 +2,131 @@
 Генератор кода лендингов
 """
 import os
+import re
+import asyncio
 import json
 import shutil
+import hashlib
 import logging
 from typing import Dict, Any
 from backend.generator.llm_client import LLMClient
 from backend.generator.prompt_builder import PromptBuilder
+from backend.generator.prompt_builder_new import NewPromptBuilder
 from backend.generator.template_loader import TemplateLoader
 from backend.generator.code_validator import CodeValidator
 from backend.config import Config
+from backend.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Принятые (прошедшие проверки) ответы LLM: sha256 промпта -> код.
+# Ключ — весь промпт, поэтому попадание только при тех же данных (повторная генерация
+# после ошибки отправки, повторный запуск с теми же ответами); похожие, но другие товары
+# кэш не разделяют — в коде лендинга их цены и контакты
+_GENERATED_CODE_CACHE = LRUCache(max_size=Config.GENERATED_CODE_CACHE_SIZE)
+# Подбор цветов/шрифтов по товару (без состояния, результаты кэшируются в prompt_builder_new)
+_STYLE_ANALYZER = NewPromptBuilder()
+
+# Пути к медиа в HTML от LLM -> относительные пути img/... проекта.
+# (префикс пути, имя файла): префикс {other} — любой символ, кроме закрывающей кавычки
+_MEDIA_PATH_PARTS = (
+    # Фото отзывов по абсолютному пути generated_landings/.../photos/
+    (r'generated_landings/{other}+/photos/', r'review_\d+\.(?:jpg|jpeg|png)'),
+    # Hero медиа
+    (r'{other}*', r'hero\.(?:jpg|jpeg|png|mp4|webm)'),
+    # Галерея
+    (r'{other}*', r'gallery_\d+\.(?:jpg|jpeg|png)'),
+    # Фото описания
+    (r'{other}*', r'description_\d+\.(?:jpg|jpeg|png)'),
+    # Среднее видео
+    (r'{other}*', r'middle\.(?:mp4|webm|ogg)'),
+)
+
+
+def _media_path_alternatives(quote: str) -> str:
+    other = f'[^{quote}]'
+    alternatives = '|'.join(f"{prefix.format(other=other)}({name})" for prefix, name in _MEDIA_PATH_PARTS)
+    return f'{quote}(?:{alternatives}){quote}'
+
+
+# Все замены одним проходом: src="..." и src='...' (окончания имён взаимоисключающие,
+# поэтому результат совпадает с последовательными re.sub по каждому виду медиа)
+_MEDIA_PATH_RE = re.compile(f'src=(?:{_media_path_alternatives(chr(34))}|{_media_path_alternatives(chr(39))})')
+
+
+def _media_path_repl(match: re.Match) -> str:
+    quote = match.group(0)[4]  # символ сразу после 'src='
+    name = next(group for group in match.groups() if group)
+    return f'src={quote}img/{name}{quote}'
+
+
+# Фиксированные исправления HTML от LLM: формы -> send.php, пути CSS/JS -> файлы проекта
+_STATIC_FIXUPS = {
+    'action=""': 'action="send.php"',
+    "action=''": "action='send.php'",
+    'action="sendCPA.php"': 'action="send.php"',
+    "action='sendCPA.php'": "action='send.php'",
+    'href="css/pillow.css"': 'href="css/style.css"',
+    'href="css/styles.css"': 'href="css/style.css"',
+    'src="js/pillow.js"': 'src="js/script.js"',
+}
+_STATIC_RE = re.compile('|'.join(re.escape(key) for key in _STATIC_FIXUPS))
+_FOOTER_RE = re.compile(r'<footer[^>]*>[\s\S]*?</footer>\s*', re.IGNORECASE)
+
+
+def _write_text(path: str, content: str):
+    """Запись текстового файла (вызывается через asyncio.to_thread, чтобы не блокировать event loop)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def _make_dirs(*paths: str):
+    """Создание конечных папок: родительские создаются вместе с первой из них"""
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+
+def _css_signals(css: str) -> Dict[str, Any]:
+    """Признаки качества CSS от LLM (строки, стили, цвета, переменные, шрифты); нижний регистр считается один раз"""
+    if not css:
+        return {'lines': 0, 'has_styles': False, 'has_colors': False, 'has_variables': False, 'has_fonts': False}
+    lower = css.lower()
+    return {
+        'lines': css.count('\n') + 1,
+        'has_styles': '{' in css and '}' in css and ':' in css,
+        'has_colors': 'color' in lower or 'background' in lower or 'gradient' in lower,
+        'has_variables': ':root' in css and '--primary-color' in css,
+        'has_fonts': 'font-family' in lower or '@import' in lower or 'googleapis.com' in lower,
+    }
+
+
+# Фоновые записи промптов (ссылки держим до завершения, иначе задачу может собрать GC)
+_PROMPT_DUMP_TASKS = set()
+
+
+def _dump_prompt(prompt: str, user_data: Dict[str, Any]):
+    """Сохранение полного промпта в FILES_DIR/prompts (только при Config.DEBUG_PROMPTS)"""
+    from datetime import datetime
+    try:
+        prompts_dir = os.path.join(Config.FILES_DIR, 'prompts')
+        # Флаг могли включить после создания генератора, а папку — удалить
+        os.makedirs(prompts_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        product_name = user_data.get('product_name', 'unknown').replace('/', '_').replace('\\', '_')[:50]
+        prompt_file = os.path.join(prompts_dir, f"prompt_{timestamp}_{product_name}.txt")
+        with open(prompt_file, 'w', encoding='utf-8') as f:
+            f.write(f"=== PROMPT FOR LLM ===\n")
+            f.write(f"Generated at: {datetime.now().isoformat()}\n")
+            f.write(f"Product: {user_data.get('product_name', 'Unknown')}\n")
+            f.write(f"Landing type: {user_data.get('landing_type', 'Unknown')}\n")
+            f.write(f"Length: {len(prompt)} characters\n")
+            f.write(f"\n{'='*80}\n\n")
+            f.write(prompt)
+        logger.info(f"Full prompt saved to: {prompt_file}")
+    except Exception as e:
+        logger.warning(f"Failed to save prompt to file: {e}")
+
+
 class CodeGenerator:
     """Генератор HTML/CSS/JS кода для лендингов"""
     
@@ -77,21 +190,19 @@ class CodeGenerator:
             else:
                 logger.info("Using vision analysis result from dialog (already completed)")
             
-            # Проверяем кэш промптов (для AI-собранных данных с фото не кэшируем — всегда свежий промпт)
+            # Сжимаем данные пользователя для оптимизации промпта
+            from backend.utils.prompt_compressor import PromptCompressor
+            compressed_data = PromptCompressor.compress_user_data(user_data)
+            
+            # Сохраняем vision_style_suggestion в compressed_data (если есть)
+            if 'vision_style_suggestion' in user_data:
+                compressed_data['vision_style_suggestion'] = user_data['vision_style_suggestion']
+            
+            # Кэш промптов: ключ — хеш всех данных, из которых строится промпт
             from backend.utils.cache import prompt_cache
-            prompt = None
-            if not user_data.get('hero_media'):
-                prompt = prompt_cache.get(user_data)
+            prompt = prompt_cache.get(compressed_data, template_id)
             
             if not prompt:
-                # Сжимаем данные пользователя для оптимизации промпта
-                from backend.utils.prompt_compressor import PromptCompressor
-                compressed_data = PromptCompressor.compress_user_data(user_data)
-                
-                # Сохраняем vision_style_suggestion в compressed_data (если есть)
-                if 'vision_style_suggestion' in user_data:
-                    compressed_data['vision_style_suggestion'] = user_data['vision_style_suggestion']
-                
                 # Строим промпт, если нет в кэше
                 prompt = self.prompt_builder.build_prompt(template_id, compressed_data)
                 
@@ -100,9 +211,7 @@ class CodeGenerator:
                 if was_compressed:
                     logger.warning("Prompt was compressed due to length")
                 
-                # Сохраняем в кэш только если это не AI-собранные данные (без hero_media)
-                if not user_data.get('hero_media'):
-                    prompt_cache.set(user_data, prompt)
+                prompt_cache.set(compressed_data, prompt, template_id)
             else:
                 logger.info("Using cached prompt")
             
@@ -110,51 +219,34 @@ class CodeGenerator:
             logger.info(f"Generated prompt length: {len(prompt)} characters")
             logger.debug(f"Prompt preview (first 2000 chars):\n{prompt[:2000]}")
             
-            # Сохраняем полный промпт в файл для отладки
-            from datetime import datetime
-            prompts_dir = os.path.join(Config.FILES_DIR, 'prompts')
-            os.makedirs(prompts_dir, exist_ok=True)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            product_name = user_data.get('product_name', 'unknown').replace('/', '_').replace('\\', '_')[:50]
-            prompt_file = os.path.join(prompts_dir, f"prompt_{timestamp}_{product_name}.txt")
-            try:
-                with open(prompt_file, 'w', encoding='utf-8') as f:
-                    f.write(f"=== PROMPT FOR LLM ===\n")
-                    f.write(f"Generated at: {datetime.now().isoformat()}\n")
-                    f.write(f"Product: {user_data.get('product_name', 'Unknown')}\n")
-                    f.write(f"Landing type: {user_data.get('landing_type', 'Unknown')}\n")
-                    f.write(f"Length: {len(prompt)} characters\n")
-                    f.write(f"\n{'='*80}\n\n")
-                    f.write(prompt)
-                logger.info(f"Full prompt saved to: {prompt_file}")
-            except Exception as e:
-                logger.warning(f"Failed to save prompt to file: {e}")
+            # Сохраняем полный промпт в файл для отладки — в фоне, не задерживая вызов LLM
+            if Config.DEBUG_PROMPTS:
+                task = asyncio.create_task(asyncio.to_thread(_dump_prompt, prompt, user_data))
+                _PROMPT_DUMP_TASKS.add(task)
+                task.add_done_callback(_PROMPT_DUMP_TASKS.discard)
             
             # Логируем часть промпта с цветами и шрифтами (если есть)
-            if 'ЦВЕТОВАЯ СХЕМА' in prompt or 'РЕКОМЕНДУЕМАЯ ЦВЕТОВАЯ СХЕМА' in prompt:
-                color_section_start = prompt.find('ЦВЕТОВАЯ СХЕМА') or prompt.find('РЕКОМЕНДУЕМАЯ ЦВЕТОВАЯ СХЕМА')
-                if color_section_start > 0:
-                    color_section = prompt[color_section_start:color_section_start+1000]
-                    logger.info(f"Color and font recommendations in prompt:\n{color_section}")
+            # Один поиск: «ЦВЕТОВАЯ СХЕМА» входит и в заголовок «РЕКОМЕНДУЕМАЯ ЦВЕТОВАЯ СХЕМА»
+            color_section_start = prompt.find('ЦВЕТОВАЯ СХЕМА')
+            if color_section_start >= 0:
+                color_section = prompt[color_section_start:color_section_start+1000]
+                logger.info(f"Color and font recommendations in prompt:\n{color_section}")
             
             logger.info(f"User data keys: {list(user_data.keys())}")
             logger.info(f"Form data - sizes: {user_data.get('sizes')}, colors: {user_data.get('colors')}, characteristics: {user_data.get('characteristics_list')}")
             logger.info(f"Landing type: {user_data.get('landing_type')}, Product name: {user_data.get('product_name')}")
             
-            # Генерируем код через LLM
-            generated_code = await self.llm_client.generate_landing(prompt)
-            
-            # Валидируем код
-            validation_result = self.validator.validate(generated_code)
+            # Генерируем код через LLM (тот же промпт уже генерировался — берём принятый ответ)
+            prompt_key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+            cached_code = _GENERATED_CODE_CACHE.get(prompt_key)
+            if cached_code is not None:
+                logger.info("Using cached LLM response for identical prompt")
+                generated_code = {**cached_code, 'tokens_used': 0}
+            else:
+                generated_code = await self.llm_client.generate_landing(prompt)
             
-            # Проверяем данные пользователя
-            if user_data:
-                user_data_errors, user_data_warnings = self.validator._check_user_data(
-                    generated_code.get('html', ''), user_data
-                )
-                validation_result['errors'].extend(user_data_errors)
-                validation_result['warnings'].extend(user_data_warnings)
-                validation_result['valid'] = len(validation_result['errors']) == 0
+            # Валидируем код вместе с данными пользователя
+            validation_result = self.validator.validate(generated_code, user_data=user_data)
             
             # Если код невалиден или слишком короткий - используем fallback
             html = generated_code.get('html', '')
@@ -162,11 +254,12 @@ class CodeGenerator:
             js = generated_code.get('js', '')
             
             # Проверяем качество CSS
-            css_lines = len(css.split('\n')) if css else 0
-            css_has_styles = bool(css and '{' in css and '}' in css and ':' in css)
-            css_has_colors = bool(css and ('color' in css.lower() or 'background' in css.lower() or 'gradient' in css.lower()))
-            css_has_variables = bool(css and ':root' in css and '--primary-color' in css)
-            css_has_fonts = bool(css and ('font-family' in css.lower() or '@import' in css.lower() or 'googleapis.com' in css.lower()))
+            signals = _css_signals(css)
+            css_lines = signals['lines']
+            css_has_styles = signals['has_styles']
+            css_has_colors = signals['has_colors']
+            css_has_variables = signals['has_variables']
+            css_has_fonts = signals['has_fonts']
             
             logger.info(f"Generated code lengths: HTML={len(html)}, CSS={len(css)} ({css_lines} lines), JS={len(js)}")
             logger.info(f"CSS quality: has_styles={css_has_styles}, has_colors={css_has_colors}, has_variables={css_has_variables}, has_fonts={css_has_fonts}")
@@ -174,11 +267,9 @@ class CodeGenerator:
             # Проверяем, содержит ли CSS рекомендуемые цвета (если есть анализ товара)
             css_has_recommended_colors = True
             if user_data.get('landing_type'):
-                from backend.generator.prompt_builder_new import NewPromptBuilder
-                prompt_builder = NewPromptBuilder()
                 product_name = user_data.get('product_name', 'Товар')
                 description = user_data.get('description_text', '')
-                style_suggestion = prompt_builder._analyze_product_and_suggest_style(product_name, description)
+                style_suggestion = _STYLE_ANALYZER._analyze_product_and_suggest_style(product_name, description)
                 recommended_primary = style_suggestion['colors']['primary']
                 # Проверяем, есть ли рекомендуемый цвет в CSS
                 css_has_recommended_colors = recommended_primary in css
@@ -201,6 +292,9 @@ class CodeGenerator:
                 logger.warning(f"CSS не содержит рекомендуемые цвета. Заменяем на fallback с правильными цветами.")
                 generated_code = self._create_fallback_code(template_id, user_data)
                 validation_result = self.validator.validate(generated_code)
+            else:
+                # Копия: _add_required_elements дописывает код на месте
+                _GENERATED_CODE_CACHE.set(prompt_key, dict(generated_code))
             
             # Добавляем необходимые элементы
             generated_code = self._add_required_elements(generated_code, template_id, user_data)
@@ -293,81 +387,17 @@ class CodeGenerator:
             
             html = html.replace('</body>', pixel_code + '\n</body>')
         
-        # Убеждаемся что формы ведут на send.php
-        html = html.replace('action=""', 'action="send.php"')
-        html = html.replace("action=''", "action='send.php'")
-        # Исправляем sendCPA.php на send.php
-        html = html.replace('action="sendCPA.php"', 'action="send.php"')
-        html = html.replace("action='sendCPA.php'", "action='send.php'")
-        
-        # Исправляем абсолютные пути к медиа файлам на относительные
-        import re
-        # Паттерн для поиска абсолютных путей к фото отзывов
-        html = re.sub(
-            r'src="generated_landings/[^"]+/photos/review_(\d+)\.(jpg|jpeg|png)"',
-            r'src="img/review_\1.\2"',
-            html
-        )
-        # Также исправляем пути с одинарными кавычками
-        html = re.sub(
-            r"src='generated_landings/[^']+/photos/review_(\d+)\.(jpg|jpeg|png)'",
-            r"src='img/review_\1.\2'",
-            html
-        )
-        
-        # Исправляем пути к hero медиа
-        html = re.sub(
-            r'src="[^"]*hero\.(jpg|jpeg|png|mp4|webm)"',
-            r'src="img/hero.\1"',
-            html
-        )
-        html = re.sub(
-            r"src='[^']*hero\.(jpg|jpeg|png|mp4|webm)'",
-            r"src='img/hero.\1'",
-            html
-        )
-        
-        # Исправляем пути к галерее
-        html = re.sub(
-            r'src="[^"]*gallery_(\d+)\.(jpg|jpeg|png)"',
-            r'src="img/gallery_\1.\2"',
-            html
-        )
-        html = re.sub(
-            r"src='[^']*gallery_(\d+)\.(jpg|jpeg|png)'",
-            r"src='img/gallery_\1.\2'",
-            html
-        )
-        
-        # Исправляем пути к фото описания
-        html = re.sub(
-            r'src="[^"]*description_(\d+)\.(jpg|jpeg|png)"',
-            r'src="img/description_\1.\2"',
-            html
-        )
-        html = re.sub(
-            r"src='[^']*description_(\d+)\.(jpg|jpeg|png)'",
-            r"src='img/description_\1.\2'",
-            html
-        )
-        
-        # Исправляем пути к среднему видео
-        html = re.sub(
-            r'src="[^"]*middle\.(mp4|webm|ogg)"',
-            r'src="img/middle.\1"',
-            html
-        )
-        html = re.sub(
-            r"src='[^']*middle\.(mp4|webm|ogg)'",
-            r"src='img/middle.\1'",
-            html
-        )
+        # Формы ведут на send.php (в т.ч. вместо sendCPA.php), пути CSS/JS — на файлы проекта
+        html = _STATIC_RE.sub(lambda m: _STATIC_FIXUPS[m.group(0)], html)
+        
+        # Исправляем абсолютные пути к медиа файлам на относительные (img/...)
+        html = _MEDIA_PATH_RE.sub(_media_path_repl, html)
         
         # Подвал: всегда подставляем из user_data при наличии данных (заменяем пустой/дефолтный footer)
         footer_html = self._build_footer_html(user_data)
         if footer_html:
             # Удаляем любой существующий footer, чтобы подставить свой с ИП/УНП/адресом
-            html = re.sub(r'<footer[^>]*>[\s\S]*?</footer>\s*', '', html, flags=re.IGNORECASE)
+            html = _FOOTER_RE.sub('', html)
             html = html.replace('</body>', footer_html + '\n</body>')
         # Гарантируем полноширинные изображения во всех блоках
         img_fullwidth_css = """
@@ -454,15 +484,12 @@ section img, .hero img, .hero-section img, .gallery img, .benefits-section img,
         
         project_id = str(uuid.uuid4())[:8]
         project_dir = get_safe_path(f"project_{project_id}", Config.FILES_DIR)
-        os.makedirs(project_dir, exist_ok=True)
         
-        # Создаем подпапки с валидацией
+        # Создаем подпапки с валидацией (папка проекта создаётся вместе с первой из них)
         css_dir = get_safe_path('css', project_dir)
         js_dir = get_safe_path('js', project_dir)
         img_dir = get_safe_path('img', project_dir)
-        os.makedirs(css_dir, exist_ok=True)
-        os.makedirs(js_dir, exist_ok=True)
-        os.makedirs(img_dir, exist_ok=True)
+        await asyncio.to_thread(_make_dirs, css_dir, js_dir, img_dir)
         
         # Определяем имена файлов с валидацией
         html_file = get_safe_path('index.html', project_dir)
@@ -472,75 +499,34 @@ section img, .hero img, .hero-section img, .gallery img, .benefits-section img,
             # Проверяем, используется ли новая структура (для товарщиков)
         is_new_structure = user_data.get('landing_type') is not None
         
-        # Сохраняем HTML (index.html)
-        with open(html_file, 'w', encoding='utf-8') as f:
-            # Заменяем пути к CSS и JS если нужно
-            html = code.get('html', '')
-            html = html.replace('href="css/pillow.css"', 'href="css/style.css"')
-            html = html.replace('href="css/styles.css"', 'href="css/style.css"')
-            html = html.replace('src="js/pillow.js"', 'src="js/script.js"')
-            html = html.replace('src="js/script.js"', 'src="js/script.js"')
-            
-            # Исправляем абсолютные пути к фото отзывов на относительные
-            import re
-            # Паттерн для поиска абсолютных путей к фото отзывов
-            html = re.sub(
-                r'src="generated_landings/[^"]+/photos/review_(\d+)\.jpg"',
-                r'src="img/review_\1.jpg"',
-                html
-            )
-            # Также исправляем пути с одинарными кавычками
-            html = re.sub(
-                r"src='generated_landings/[^']+/photos/review_(\d+)\.jpg'",
-                r"src='img/review_\1.jpg'",
-                html
-            )
-            
-            f.write(html)
-        
-        # Сохраняем CSS
-        with open(css_file, 'w', encoding='utf-8') as f:
-            f.write(code.get('css', ''))
-        
-        # Сохраняем JS
-        with open(js_file, 'w', encoding='utf-8') as f:
-            f.write(code.get('js', ''))
-        
-        # Создаем страницу благодарности good.html
-        good_html = self._create_good_page(user_data, code.get('css', ''))
-        good_file = os.path.join(project_dir, 'good.html')
-        with open(good_file, 'w', encoding='utf-8') as f:
-            f.write(good_html)
+        # Страницы проекта: путь -> содержимое (пишутся параллельно в пуле потоков)
+        pages = {
+            # Пути к CSS/JS и медиа уже исправлены в _add_required_elements
+            html_file: code.get('html', ''),
+            css_file: code.get('css', ''),
+            js_file: code.get('js', ''),
+            # Страница благодарности
+            os.path.join(project_dir, 'good.html'): self._create_good_page(user_data, code.get('css', '')),
+        }
         
         # Для новой структуры создаем дополнительные файлы
         if is_new_structure:
             # oferta.html - публичная оферта
-            oferta_html = code.get('oferta_html', self._create_default_oferta(user_data, code.get('css', '')))
-            oferta_file = os.path.join(project_dir, 'oferta.html')
-            with open(oferta_file, 'w', encoding='utf-8') as f:
-                f.write(oferta_html)
-            
+            pages[os.path.join(project_dir, 'oferta.html')] = code.get('oferta_html', self._create_default_oferta(user_data, code.get('css', '')))
             # obmen.html - возврат и обмен
-            obmen_html = code.get('obmen_html', self._create_default_obmen(user_data, code.get('css', '')))
-            obmen_file = os.path.join(project_dir, 'obmen.html')
-            with open(obmen_file, 'w', encoding='utf-8') as f:
-                f.write(obmen_html)
-            
+            pages[os.path.join(project_dir, 'obmen.html')] = code.get('obmen_html', self._create_default_obmen(user_data, code.get('css', '')))
             # politics.html - политика конфиденциальности
-            politics_html = code.get('politics_html', self._create_default_politics(user_data, code.get('css', '')))
-            politics_file = os.path.join(project_dir, 'politics.html')
-            with open(politics_file, 'w', encoding='utf-8') as f:
-                f.write(politics_html)
-            
+            pages[os.path.join(project_dir, 'politics.html')] = code.get('politics_html', self._create_default_politics(user_data, code.get('css', '')))
             # send.php - обработчик отправки (обновляем для новой структуры)
             send_php = code.get('send_php', '')
             if send_php:
-                php_file = os.path.join(project_dir, 'send.php')
-                with open(php_file, 'w', encoding='utf-8') as f:
-                    f.write(send_php)
-            else:
-                # Используем метод создания send.php
-                await self._create_send_php(project_dir, user_data)
+                pages[os.path.join(project_dir, 'send.php')] = send_php
+        
+        writes = [asyncio.to_thread(_write_text, path, content) for path, content in pages.items()]
+        if is_new_structure and not send_php:
+            # Используем метод создания send.php
+            writes.append(self._create_send_php(project_dir, user_data))
+        await asyncio.gather(*writes)
         
         # Копируем медиа пользователя в проект до создания ZIP, иначе архив выйдет без фото
         await self._copy_user_media(project_dir, user_data)
@@ -779,8 +765,7 @@ if (@mail($to, $subject, $message, $headers)) {{
 '''
         
         php_file = os.path.join(project_dir, 'send.php')
-        with open(php_file, 'w', encoding='utf-8') as f:
-            f.write(php_content)
+        await asyncio.to_thread(_write_text, php_file, php_content)
     
     async def _create_zip(self, project_dir: str, project_id: str) -> str:
         """
@@ -822,11 +807,9 @@ if (@mail($to, $subject, $message, $headers)) {{
         
         # Для новой структуры используем анализ товара для подбора цветов
         if user_data.get('landing_type'):
-            from backend.generator.prompt_builder_new import NewPromptBuilder
-            prompt_builder = NewPromptBuilder()
             product_name = user_data.get('product_name', 'Товар')
             description = user_data.get('description_text', '')
-            style_suggestion = prompt_builder._analyze_product_and_suggest_style(product_name, description)
+            style_suggestion = _STYLE_ANALYZER._analyze_product_and_suggest_style(product_name, description)
             suggested_colors = style_suggestion['colors']
             suggested_fonts = style_suggestion['fonts']
             
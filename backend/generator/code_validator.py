@@ -2,17 +2,18 @@
 Валидатор сгенерированного кода
 """
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 class CodeValidator:
     """Валидация HTML/CSS/JS кода"""
     
-    def validate(self, code: Dict[str, str]) -> Dict[str, Any]:
+    def validate(self, code: Dict[str, str], user_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Валидация всего кода
         
         Args:
             code: Словарь с html, css, js
+            user_data: Данные пользователя (если заданы — проверяется их наличие в HTML)
             
         Returns:
             Результат валидации с ошибками
@@ -23,6 +24,8 @@ class CodeValidator:
         html = code.get('html', '')
         css = code.get('css', '')
         js = code.get('js', '')
+        # HTML в нижнем регистре один раз на все проверки
+        html_lower = html.lower()
         
         # Валидация HTML
         html_errors, html_warnings = self._validate_html(html)
@@ -40,20 +43,26 @@ class CodeValidator:
         warnings.extend(js_warnings)
         
         # Проверка наличия обязательных элементов
-        required_errors, required_warnings = self._check_required_elements(html, css, js)
+        required_errors, required_warnings = self._check_required_elements(html, css, js, html_lower)
         errors.extend(required_errors)
         warnings.extend(required_warnings)
         
         # Проверка SEO
-        seo_errors, seo_warnings = self._validate_seo(html)
+        seo_errors, seo_warnings = self._validate_seo(html, html_lower)
         errors.extend(seo_errors)
         warnings.extend(seo_warnings)
         
         # Проверка Accessibility
-        a11y_errors, a11y_warnings = self._validate_accessibility(html)
+        a11y_errors, a11y_warnings = self._validate_accessibility(html, html_lower)
         errors.extend(a11y_errors)
         warnings.extend(a11y_warnings)
         
+        # Проверка данных пользователя
+        if user_data:
+            user_data_errors, user_data_warnings = self._check_user_data(html, user_data, html_lower)
+            errors.extend(user_data_errors)
+            warnings.extend(user_data_warnings)
+        
         return {
             'valid': len(errors) == 0,
             'errors': errors,
@@ -148,10 +157,13 @@ class CodeValidator:
         
         return errors, warnings
     
-    def _check_required_elements(self, html: str, css: str, js: str) -> tuple[List[str], List[str]]:
+    def _check_required_elements(self, html: str, css: str, js: str, html_lower: Optional[str] = None) -> tuple[List[str], List[str]]:
         """
         Проверка наличия обязательных элементов
         
+        Args:
+            html_lower: html.lower(), если уже посчитан
+            
         Returns:
             (errors, warnings) - кортеж со списками ошибок и предупреждений
         """
@@ -179,7 +191,9 @@ class CodeValidator:
             errors.append("Отсутствует закрывающий тег </body>")
         
         # Проверка подключения CSS и JS
-        if 'link' not in html.lower() and 'stylesheet' not in html.lower():
+        if html_lower is None:
+            html_lower = html.lower()
+        if 'link' not in html_lower and 'stylesheet' not in html_lower:
             warnings.append("Возможно отсутствует подключение CSS файла")
         
         if 'script.js' not in html and 'pillow.js' not in html:
@@ -206,13 +220,14 @@ class CodeValidator:
         
         return errors, warnings
     
-    def _check_user_data(self, html: str, user_data: Dict[str, Any]) -> tuple[List[str], List[str]]:
+    def _check_user_data(self, html: str, user_data: Dict[str, Any], html_lower: Optional[str] = None) -> tuple[List[str], List[str]]:
         """
         Проверка наличия данных пользователя в коде
         
         Args:
             html: HTML код
             user_data: Данные пользователя
+            html_lower: html.lower(), если уже посчитан
             
         Returns:
             (errors, warnings) - кортеж со списками ошибок и предупреждений
@@ -228,7 +243,7 @@ class CodeValidator:
         if product_name:
             # Удаляем валюту и лишние символы для проверки
             name_clean = product_name.lower().replace(' ', '')
-            html_clean = html.lower().replace(' ', '').replace('\n', '')
+            html_clean = (html.lower() if html_lower is None else html_lower).replace(' ', '').replace('\n', '')
             
             if len(name_clean) > 3 and name_clean not in html_clean[:len(html_clean)//2]:
                 # Проверяем хотя бы часть названия
@@ -238,7 +253,6 @@ class CodeValidator:
         
         if new_price:
             # Извлекаем число из цены
-            import re
             price_match = re.search(r'\d+', new_price)
             if price_match:
                 price_num = price_match.group()
@@ -247,17 +261,21 @@ class CodeValidator:
         
         return errors, warnings
     
-    def _validate_seo(self, html: str) -> tuple[List[str], List[str]]:
+    def _validate_seo(self, html: str, html_lower: Optional[str] = None) -> tuple[List[str], List[str]]:
         """
         Валидация SEO элементов
         
+        Args:
+            html_lower: html.lower(), если уже посчитан
+            
         Returns:
             (errors, warnings)
         """
         errors = []
         warnings = []
         
-        html_lower = html.lower()
+        if html_lower is None:
+            html_lower = html.lower()
         
         # Проверка title
         if '<title>' not in html_lower:
@@ -306,22 +324,26 @@ class CodeValidator:
             warnings.append("Отсутствуют заголовки H2 (важно для структуры и SEO)")
         
         # Проверка lang атрибута
-        if 'lang=' not in html.lower() and "lang=" not in html.lower():
+        if 'lang=' not in html_lower:
             warnings.append("Отсутствует атрибут lang в теге <html> (важно для SEO)")
         
         return errors, warnings
     
-    def _validate_accessibility(self, html: str) -> tuple[List[str], List[str]]:
+    def _validate_accessibility(self, html: str, html_lower: Optional[str] = None) -> tuple[List[str], List[str]]:
         """
         Валидация accessibility (доступности)
         
+        Args:
+            html_lower: html.lower(), если уже посчитан
+            
         Returns:
             (errors, warnings)
         """
         errors = []
         warnings = []
         
-        html_lower = html.lower()
+        if html_lower is None:
+            html_lower = html.lower()
         
         # Проверка alt текстов для изображений (критично для accessibility)
         img_tags = re.findall(r'<img[^>]+>', html, re.IGNORECASE)
@@ -14,6 +14,20 @@ from backend.config import Config
 
 logger = logging.getLogger(__name__)
 
+# SDK-клиенты провайдеров общие для процесса: (класс клиента, api_key) -> клиент.
+# У каждого SDK-клиента свой пул HTTP-соединений — LLMClient каждого AI-агента
+# переиспользует уже открытые (и прогретые при старте бота) соединения
+_SDK_CLIENTS: Dict[tuple, Any] = {}
+
+
+def _shared_sdk_client(factory, api_key: str):
+    """Общий SDK-клиент для factory(api_key=...); создаётся при первом обращении"""
+    key = (factory, api_key)
+    client = _SDK_CLIENTS.get(key)
+    if client is None:
+        client = _SDK_CLIENTS[key] = factory(api_key=api_key)
+    return client
+
 class LLMClient:
     """Клиент для работы с LLM API (OpenAI, Anthropic, Google)"""
     
@@ -34,7 +48,7 @@ class LLMClient:
         if self.provider == 'openai':
             self.api_key = api_key or Config.OPENAI_API_KEY
             if self.api_key:
-                self.client = OpenAI(api_key=self.api_key)
+                self.client = _shared_sdk_client(OpenAI, self.api_key)
             else:
                 self.client = None
         elif self.provider == 'anthropic':
@@ -42,7 +56,7 @@ class LLMClient:
                 import anthropic
                 self.api_key = api_key or Config.ANTHROPIC_API_KEY
                 if self.api_key:
-                    self.client = anthropic.Anthropic(api_key=self.api_key)
+                    self.client = _shared_sdk_client(anthropic.Anthropic, self.api_key)
                 else:
                     self.client = None
             except ImportError:
@@ -342,6 +356,25 @@ class LLMClient:
         
         return result
     
+    async def warmup(self) -> bool:
+        """
+        Заранее открыть соединение с API (DNS, TLS, пул соединений SDK-клиента),
+        чтобы первый запрос пользователя не ждал рукопожатия. Токены не расходуются.
+        
+        Returns:
+            True если соединение установлено
+        """
+        # Бесплатный лёгкий запрос есть только у OpenAI (список моделей)
+        if not self.client or self.provider != 'openai':
+            return False
+        try:
+            await asyncio.to_thread(self.client.models.list)
+            logger.info(f"Соединение с {self.provider} прогрето")
+            return True
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть соединение с {self.provider}: {e}")
+            return False
+    
     def test_connection(self) -> bool:
         """
         Проверка подключения к API
@@ -5,8 +5,14 @@ from typing import Dict, Any, Optional
 import logging
 import os
 
+from backend.utils.cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
+# Подбор стиля зависит только от названия и описания товара, а за одну генерацию
+# вызывается несколько раз (промпт, проверка CSS ответа, fallback-код)
+_STYLE_SUGGESTION_CACHE = LRUCache(max_size=1024)
+
 class NewPromptBuilder:
     """Промпт-билдер для новой структуры лендинга из 17 пунктов"""
     
@@ -19,8 +25,13 @@ class NewPromptBuilder:
             description: Описание товара
             
         Returns:
-            Словарь с предложенными цветами и стилями
+            Словарь с предложенными цветами и стилями (общий для вызовов — не изменять)
         """
+        cache_key = (product_name, description)
+        cached = _STYLE_SUGGESTION_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        
         text = (product_name + ' ' + description).lower()
         
         # Определяем категорию товара
@@ -116,12 +127,14 @@ class NewPromptBuilder:
         
         font_pair = fonts.get(category, fonts['general'])
         
-        return {
+        suggestion = {
             'category': category,
             'style': 'elegant' if category == 'health' else 'modern',
             'colors': colors,
             'fonts': font_pair,
         }
+        _STYLE_SUGGESTION_CACHE.set(cache_key, suggestion)
+        return suggestion
     
     def _is_very_bright_palette(self, colors: dict) -> bool:
         """Проверка, что палитра слишком яркая для категории health (высокая насыщенность primary)."""
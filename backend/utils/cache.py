@@ -1,11 +1,13 @@
 """
-Кэширование промптов для похожих товаров
+Кэширование промптов для похожих товаров и LRU-кэш в памяти
 """
 import hashlib
 import json
 import logging
 import os
-from typing import Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable
 from datetime import datetime, timedelta
 from backend.config import Config
 
@@ -27,57 +29,43 @@ class PromptCache:
         self.ttl_hours = ttl_hours
         os.makedirs(self.cache_dir, exist_ok=True)
     
-    def _generate_cache_key(self, user_data: Dict[str, Any]) -> str:
+    def _generate_cache_key(self, user_data: Dict[str, Any], template_id: str = '') -> str:
         """
-        Генерация ключа кэша на основе данных пользователя
+        Генерация ключа кэша по содержимому данных
+        
+        Промпт строится из всех переданных данных, поэтому ключ — хеш всего словаря
+        (в каноническом JSON: порядок ключей не влияет), а не выборки полей.
         
         Args:
-            user_data: Данные пользователя
+            user_data: Данные, из которых строится промпт (после PromptCompressor)
+            template_id: ID шаблона
             
         Returns:
             Хеш-ключ для кэша
         """
-        # Создаем упрощенную версию данных для ключа
-        key_data = {
-            'product_name': user_data.get('product_name', ''),
-            'landing_type': user_data.get('landing_type', ''),
-            'old_price': user_data.get('old_price', ''),
-            'new_price': user_data.get('new_price', ''),
-            'characteristics': user_data.get('characteristics_list', []),
-            'sizes': user_data.get('sizes', []),
-            'colors': user_data.get('colors', []),
-        }
-        
-        # Сортируем списки для консистентности
-        if isinstance(key_data['characteristics'], list):
-            key_data['characteristics'] = sorted(key_data['characteristics'])
-        if isinstance(key_data['sizes'], list):
-            key_data['sizes'] = sorted(key_data['sizes'])
-        if isinstance(key_data['colors'], list):
-            key_data['colors'] = sorted(key_data['colors'])
-        
-        # Создаем JSON строку и хеш
-        key_string = json.dumps(key_data, sort_keys=True, ensure_ascii=False)
-        cache_key = hashlib.md5(key_string.encode('utf-8')).hexdigest()
-        
-        return cache_key
+        key_string = json.dumps(
+            {'template_id': template_id, 'data': user_data},
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.md5(key_string.encode('utf-8')).hexdigest()
     
     def _get_cache_path(self, cache_key: str) -> str:
         """Получить путь к файлу кэша"""
         return os.path.join(self.cache_dir, f"{cache_key}.json")
     
-    def get(self, user_data: Dict[str, Any]) -> Optional[str]:
+    def get(self, user_data: Dict[str, Any], template_id: str = '') -> Optional[str]:
         """
         Получить промпт из кэша
         
         Args:
             user_data: Данные пользователя
+            template_id: ID шаблона
             
         Returns:
             Промпт из кэша или None
         """
         try:
-            cache_key = self._generate_cache_key(user_data)
+            cache_key = self._generate_cache_key(user_data, template_id)
             cache_path = self._get_cache_path(cache_key)
             
             if not os.path.exists(cache_path):
@@ -102,19 +90,20 @@ class PromptCache:
             logger.warning(f"Error reading from cache: {e}")
             return None
     
-    def set(self, user_data: Dict[str, Any], prompt: str) -> bool:
+    def set(self, user_data: Dict[str, Any], prompt: str, template_id: str = '') -> bool:
         """
         Сохранить промпт в кэш
         
         Args:
             user_data: Данные пользователя
             prompt: Промпт для сохранения
+            template_id: ID шаблона
             
         Returns:
             True если успешно сохранено
         """
         try:
-            cache_key = self._generate_cache_key(user_data)
+            cache_key = self._generate_cache_key(user_data, template_id)
             cache_path = self._get_cache_path(cache_key)
             
             cache_data = {
@@ -196,6 +185,55 @@ class PromptCache:
         return deleted_count
 
 
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти с ограничением по количеству записей"""
+    
+    def __init__(self, max_size: int = 1000):
+        """
+        Инициализация кэша
+        
+        Args:
+            max_size: Максимальное количество записей (самые давние вытесняются)
+        """
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получить значение и отметить запись как недавно использованную"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение, вытеснив самую давнюю запись при переполнении"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удалить запись и вернуть её значение"""
+        with self._lock:
+            return self._data.pop(key, default)
+    
+    def clear(self) -> None:
+        """Очистить кэш"""
+        with self._lock:
+            self._data.clear()
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
 # Глобальный экземпляр кэша
 prompt_cache = PromptCache(ttl_hours=24)
 
@@ -1,6 +1,7 @@
 """
 Модуль для проверки здоровья системы (health check)
 """
+import asyncio
 import logging
 from typing import Dict, Any
 from backend.database.database import SessionLocal, engine
@@ -18,6 +19,12 @@ async def check_database() -> Dict[str, Any]:
     Returns:
         Словарь с результатом проверки
     """
+    # Синхронный драйвер БД: запрос выполняется в потоке, event loop бота не блокируется
+    return await asyncio.to_thread(_check_database_sync)
+
+
+def _check_database_sync() -> Dict[str, Any]:
+    """Синхронная часть check_database: пробный запрос к БД"""
     try:
         db = SessionLocal()
         try:
@@ -1,7 +1,26 @@
 """
 Вспомогательные функции
 """
+import json
 import os
+import re
+import zlib
+
+try:
+    import orjson
+except ImportError:  # orjson опционален: без него используется стандартный json
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard опционален: без него сжимаем через zlib
+    zstandard = None
+
+# Первые байты кадра zstd: по ним pack/unpack различают zstd и zlib
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Всё, кроме цифр, разделителей и минуса: валюта (BYN, EUR, ₽...) и пробелы
+_PRICE_STRIP_RE = re.compile(r'[^\d.,-]')
 
 def ensure_dir(directory: str):
     """Создать директорию если не существует"""
@@ -47,3 +66,46 @@ def sanitize_filename(filename: str) -> str:
     if len(filename) > 200:
         filename = filename[:200]
     return filename
+
+def parse_price(value) -> float:
+    """
+    Число из строки цены: "152 BYN" -> 152.0, "99,90 €" -> 99.9.
+    ValueError, если числа в строке нет.
+    """
+    return float(_PRICE_STRIP_RE.sub('', str(value)).replace(',', '.'))
+
+def json_loads(data):
+    """Разбор JSON из bytes/str (через orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj) -> bytes:
+    """Сериализация в JSON (bytes, UTF-8; через orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def json_dumps_text(obj) -> str:
+    """Сериализация в JSON-строку для колонок JSON SQLAlchemy (json_serializer движка)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+def pack_json(obj, level: int = 3) -> bytes:
+    """Сериализация в JSON и сжатие (zstd, если установлен, иначе zlib)"""
+    return compress_json(json_dumps(obj), level)
+
+def compress_json(raw: bytes, level: int = 3) -> bytes:
+    """Сжатие уже сериализованного JSON (формат pack_json)"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(raw)
+    return zlib.compress(raw, level)
+
+def unpack_json(blob: bytes):
+    """Распаковка результата pack_json (формат определяется по заголовку)"""
+    if blob[:4] == _ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Данные сжаты zstd, но пакет zstandard не установлен")
+        return json_loads(zstandard.ZstdDecompressor().decompress(blob))
+    return json_loads(zlib.decompress(blob))
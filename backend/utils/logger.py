@@ -1,6 +1,7 @@
 """
 Улучшенная система логирования с контекстом
 """
+import json
 import logging
 import re
 import sys
@@ -58,6 +59,28 @@ class ContextualFormatter(logging.Formatter):
         return super().format(record)
 
 
+# Стандартные атрибуты LogRecord: всё остальное в записи — поля, переданные через extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение, контекст и поля из extra="""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': request_id_var.get(),
+            'user_id': user_id_var.get(),
+        }
+        payload.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
 def setup_logging(
     log_level: str = 'INFO',
     log_file: str = 'bot.log',
@@ -85,16 +108,15 @@ def setup_logging(
     
     # Формат логирования
     if enable_json:
-        # JSON формат для продакшн (можно добавить позже)
-        log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        # JSON формат для продакшн: поля из extra= попадают в запись (для метрик по логам)
+        formatter = JsonFormatter(datefmt='%Y-%m-%d %H:%M:%S')
     else:
         # Расширенный формат с контекстом
         log_format = (
             '%(asctime)s | %(levelname)-8s | %(name)-20s | '
             'User: %(user_id)s | Request: %(request_id)s | %(message)s'
         )
-    
-    formatter = ContextualFormatter(log_format, datefmt='%Y-%m-%d %H:%M:%S')
+        formatter = ContextualFormatter(log_format, datefmt='%Y-%m-%d %H:%M:%S')
     
     # Обработчик для файла с ротацией
     redaction_filter = SecretRedactionFilter()
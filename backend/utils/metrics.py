@@ -2,9 +2,9 @@
 Модуль для сбора метрик и статистики
 """
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, select, cast, String
 from backend.database.database import SessionLocal
 from backend.database.models import User, Project, Generation, UserState
 
@@ -235,3 +235,35 @@ class MetricsCollector:
         finally:
             db.close()
 
+    @staticmethod
+    def iter_telegram_user_ids(chunk_size: int = 1000) -> Iterator[int]:
+        """
+        Telegram user_id для рассылки постранично, без загрузки всего списка в память.
+
+        UNION user_states и users дедуплицирует id на стороне БД; страницы по chunk_size
+        читаются по ключу (id > последний, ORDER BY id LIMIT), каждая в своей короткой сессии —
+        соединение не удерживается, пока вызывающий код рассылает пачку и ждёт паузу.
+        """
+        ids = select(cast(UserState.user_id, String).label('id')).union(select(User.telegram_id.label('id'))).subquery()
+        last_id = None
+        while True:
+            stmt = select(ids.c.id).where(ids.c.id.isnot(None)).order_by(ids.c.id).limit(chunk_size)
+            if last_id is not None:
+                stmt = stmt.where(ids.c.id > last_id)
+            db = SessionLocal()
+            try:
+                page = db.execute(stmt).scalars().all()
+            except Exception as e:
+                logger.error(f"Error streaming telegram user ids: {e}")
+                return
+            finally:
+                db.close()
+            for raw_id in page:
+                try:
+                    yield int(raw_id)
+                except (ValueError, TypeError):
+                    pass
+            if len(page) < chunk_size:
+                return
+            last_id = page[-1]
+
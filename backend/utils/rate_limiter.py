@@ -3,15 +3,25 @@ Rate Limiter для контроля запросов пользователей
 """
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Tuple
 from collections import defaultdict
 from backend.database.database import SessionLocal
 from backend.database.models import Generation
 from backend.config import Config
+from backend.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Сколько секунд помнить отказ check_db_rate_limit: повторные попытки (кнопка/«давай» подряд)
+# не идут в БД
+DB_DENIAL_CACHE_TTL = 5.0
+# Сколько секунд расходовать остаток, полученный из БД, локально: в течение этого времени разрешения
+# выдаются без запроса к БД, пока остаток не исчерпан (каждая проверка считается генерацией).
+# Другие инстансы могут расходовать тот же лимит — поэтому срок короткий
+DB_ALLOWANCE_TTL = 60.0
+
 
 class RateLimiter:
     """Rate limiter для контроля запросов пользователей"""
@@ -29,6 +39,10 @@ class RateLimiter:
         # In-memory кэш для быстрой проверки (для одного инстанса)
         self.requests: Dict[str, list] = defaultdict(list)
         self.lock = asyncio.Lock()
+        # user_id -> time.monotonic(), до которого действует последний отказ из БД
+        self._db_denials = LRUCache(max_size=10000)
+        # user_id -> [time.monotonic() окончания, остаток] — остаток из БД, расходуемый без запросов к ней
+        self._db_allowances = LRUCache(max_size=10000)
     
     async def check_rate_limit(self, user_id: int) -> Tuple[bool, int]:
         """
@@ -72,9 +86,37 @@ class RateLimiter:
         Returns:
             (allowed, remaining_requests)
         """
+        user_id_str = str(user_id)
+        denied_until = self._db_denials.get(user_id_str)
+        if denied_until is not None:
+            if time.monotonic() < denied_until:
+                return False, 0
+            self._db_denials.pop(user_id_str)
+        
+        allowance = self._db_allowances.get(user_id_str)
+        if allowance is not None and time.monotonic() < allowance[0] and allowance[1] > 0:
+            remaining = allowance[1]
+            allowance[1] -= 1
+            return True, remaining
+        
+        # Синхронный запрос к БД — в потоке, чтобы не блокировать event loop
+        try:
+            allowed, remaining = await asyncio.to_thread(self._count_db_requests, user_id_str)
+        except Exception as e:
+            logger.error(f"Error checking rate limit in DB: {e}")
+            # В случае ошибки разрешаем запрос (fail-open), но ничего не кэшируем
+            return True, self.max_requests
+        if allowed:
+            self._db_allowances.set(user_id_str, [time.monotonic() + DB_ALLOWANCE_TTL, remaining - 1])
+        else:
+            self._db_allowances.pop(user_id_str)
+            self._db_denials.set(user_id_str, time.monotonic() + DB_DENIAL_CACHE_TTL)
+        return allowed, remaining
+    
+    def _count_db_requests(self, user_id_str: str) -> Tuple[bool, int]:
+        """(allowed, remaining) по числу генераций пользователя в БД за период; ошибки БД пробрасываются"""
         db = SessionLocal()
         try:
-            user_id_str = str(user_id)
             cutoff = datetime.utcnow() - timedelta(seconds=self.per_seconds)
             
             # Считаем запросы за последний период
@@ -88,10 +130,6 @@ class RateLimiter:
             
             remaining = self.max_requests - count
             return True, remaining
-        except Exception as e:
-            logger.error(f"Error checking rate limit in DB: {e}")
-            # В случае ошибки разрешаем запрос (fail-open)
-            return True, self.max_requests
         finally:
             db.close()
     
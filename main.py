@@ -17,12 +17,14 @@ log_level = getattr(Config, 'LOG_LEVEL', 'INFO')
 log_file = getattr(Config, 'LOG_FILE', 'bot.log')
 log_max_bytes = getattr(Config, 'LOG_MAX_BYTES', 10485760)  # 10MB
 log_backup_count = getattr(Config, 'LOG_BACKUP_COUNT', 5)
+log_json = getattr(Config, 'LOG_JSON', False)
 
 setup_logging(
     log_level=log_level,
     log_file=log_file,
     max_bytes=log_max_bytes,
-    backup_count=log_backup_count
+    backup_count=log_backup_count,
+    enable_json=log_json
 )
 
 logger = get_logger(__name__)
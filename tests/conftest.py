@@ -6,6 +6,7 @@ import os
 from unittest.mock import Mock, MagicMock, AsyncMock, patch
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import StaticPool
 from telegram import Update, Message, User, Chat, CallbackQuery
 from telegram.ext import ContextTypes
 
@@ -20,11 +21,14 @@ def test_db_session():
     Создает in-memory SQLite базу данных для тестов.
     Автоматически создает все таблицы и очищает после теста.
     """
-    # Используем SQLite in-memory для тестов
+    # Используем SQLite in-memory для тестов.
+    # StaticPool: одно соединение на все потоки, иначе запросы из asyncio.to_thread
+    # попадут в другую (пустую) in-memory базу
     engine = create_engine(
         "sqlite:///:memory:",
         echo=False,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
     )
     
     # Создаем все таблицы
@@ -169,7 +173,6 @@ def mock_bot():
     
     bot = Mock(spec=LandingBot)
     bot.ai_agents = {}
-    bot.ai_agents_last_activity = {}
     bot._save_user_data = Mock()
     bot._get_user_data = Mock(return_value={})
     bot._clear_user_data = Mock()
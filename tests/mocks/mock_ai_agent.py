@@ -38,6 +38,9 @@ class MockLandingAIAgent:
         }
         self.conversation_history = []
         self.max_history_length = 20
+        self.ui_flags = set()
+        self.parse_mode = 'HTML'
+        self.dirty = True
         
         logger.info(f"MockLandingAIAgent initialized for user {user_id}, mode: {mode}")
     
@@ -51,6 +54,7 @@ class MockLandingAIAgent:
         message_lower = message.lower()
         
         # Сохраняем в историю
+        self.dirty = True
         self.conversation_history.append({'role': 'user', 'content': message})
         
         # Детерминированные ответы в зависимости от стадии
@@ -183,6 +187,7 @@ class MockLandingAIAgent:
         agent.collected_data = state.get('collected_data', agent.collected_data)
         agent.conversation_history = state.get('conversation_history', [])
         agent.user_id = state.get('user_id', user_id if user_id is not None else 0)
+        agent.dirty = False
         return agent
     
     async def start_conversation(self) -> str:
@@ -194,6 +199,7 @@ class MockLandingAIAgent:
         """
         greeting = f"Привет! Я помогу создать лендинг в режиме {self.mode}. Давайте начнем!"
         self.conversation_history.append({'role': 'assistant', 'content': greeting})
+        self.dirty = True
         return greeting
     
     def _get_stage_info(self) -> str:
@@ -211,6 +217,11 @@ class MockLandingAIAgent:
         }
         return stage_names.get(self.stage, 'Неизвестная стадия')
     
+    @property
+    def hero_file(self) -> Optional[Dict[str, Any]]:
+        """Первый файл блока hero (как LandingAIAgent.hero_file)"""
+        return next((f for f in self.collected_data.get('files', []) if f.get('block') == 'hero'), None)
+    
     def convert_to_user_data(self) -> Dict[str, Any]:
         """
         Преобразует собранные данные агента в формат user_data для генерации
@@ -0,0 +1,77 @@
+"""
+In-memory mock of the redis.Redis subset used by RedisUserStateStore
+"""
+from typing import Dict, List, Optional, Set
+
+
+class MockRedis:
+    """
+    Mock синхронного клиента redis.Redis (decode_responses=False).
+    TTL запоминается, но не истекает — для проверки истечения удаляйте ключи вручную.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, bytes] = {}
+        self.ttls: Dict[str, Optional[int]] = {}
+        self.sets: Dict[str, Set[bytes]] = {}
+
+    @staticmethod
+    def _member(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        self.values[key] = value
+        self.ttls[key] = ex
+        return True
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.values.get(key) for key in keys]
+
+    def delete(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            removed += self.values.pop(key, None) is not None
+            self.ttls.pop(key, None)
+        return removed
+
+    def sadd(self, key: str, *members) -> int:
+        members = {self._member(m) for m in members}
+        target = self.sets.setdefault(key, set())
+        added = len(members - target)
+        target |= members
+        return added
+
+    def srem(self, key: str, *members) -> int:
+        target = self.sets.get(key, set())
+        members = {self._member(m) for m in members}
+        removed = len(members & target)
+        target -= members
+        return removed
+
+    def smembers(self, key: str) -> Set[bytes]:
+        return set(self.sets.get(key, set()))
+
+    def pipeline(self) -> 'MockPipeline':
+        return MockPipeline(self)
+
+
+class MockPipeline:
+    """Mock pipeline: команды копятся и выполняются в execute()"""
+
+    def __init__(self, client: MockRedis):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results = [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
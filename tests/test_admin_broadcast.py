@@ -0,0 +1,81 @@
+"""
+Тесты рассылки администратора (handle_admin_broadcast_message)
+"""
+import pytest
+from unittest.mock import patch, AsyncMock
+from telegram.error import RetryAfter
+
+from backend.bot.telegram_bot import LandingBot, BROADCAST_BATCH_SIZE
+
+
+@pytest.fixture
+async def bot(mock_application):
+    with patch("backend.bot.telegram_bot.init_db"), \
+            patch("backend.bot.telegram_bot.Config.BOT_ADMIN_IDS", []):
+        yield LandingBot()
+
+
+class TestAdminBroadcast:
+    """Тесты пакетной рассылки"""
+
+    async def test_broadcast_in_batches(self, bot, mock_update, mock_context):
+        chat_ids = list(range(1, 2 * BROADCAST_BATCH_SIZE + 2))
+        retried = set()
+
+        async def send_message(chat_id, text):
+            if chat_id == 2:
+                raise Exception("Forbidden: bot was blocked by the user")
+            if chat_id == 3 and chat_id not in retried:
+                retried.add(chat_id)
+                raise RetryAfter(5)
+
+        mock_context.bot.send_message = AsyncMock(side_effect=send_message)
+        mock_context.user_data["admin_waiting_broadcast"] = True
+        mock_update.message.text = "Новости"
+
+        with patch("backend.utils.metrics.MetricsCollector.iter_telegram_user_ids", return_value=(cid for cid in chat_ids)), \
+                patch("backend.bot.telegram_bot.asyncio.sleep", new_callable=AsyncMock) as sleep:
+            await bot.handle_admin_broadcast_message(mock_update, mock_context)
+
+        report = mock_update.message.reply_text.call_args.args[0]
+        assert f"Отправлено: {len(chat_ids) - 1}, не доставлено: 1" in report
+        # RetryAfter(5) и две паузы между тремя пачками
+        sleep_args = [call.args[0] for call in sleep.await_args_list]
+        assert sorted(sleep_args) == [1.0, 1.0, 5]
+
+    async def test_ignored_without_pending_broadcast(self, bot, mock_update, mock_context):
+        await bot.handle_admin_broadcast_message(mock_update, mock_context)
+        mock_context.bot.send_message.assert_not_called()
+        mock_update.message.reply_text.assert_not_called()
+
+
+class TestAdminIds:
+    """Тесты разбора BOT_ADMIN_IDS"""
+
+    def test_admin_ids_parsed_once(self, bot):
+        with patch("backend.bot.telegram_bot.Config.BOT_ADMIN_IDS", [" 123", "", "456 "]):
+            assert bot._is_admin(789)  # список ещё не перечитан: админы не заданы
+            bot.refresh_admin_ids()
+        assert bot._admin_ids == frozenset({"123", "456"})
+        assert bot._is_admin(123)
+        assert not bot._is_admin(789)
+
+    async def test_notify_admins_sends_to_each_admin(self, bot):
+        bot._admin_ids = frozenset({"1", "bad"})
+        await bot.notify_admins("alert")
+        bot.app.bot.send_message.assert_awaited_once_with(chat_id=1, text="alert", parse_mode=None)
+
+    async def test_admin_menu_keyboard_reused(self, bot, mock_update, mock_context):
+        await bot.admin_command(mock_update, mock_context)
+        await bot.admin_command(mock_update, mock_context)
+        first, second = mock_update.message.reply_text.call_args_list
+        assert first.kwargs["reply_markup"] is second.kwargs["reply_markup"] is bot.admin_keyboard
+
+    async def test_menu_commands_set_for_each_admin(self, bot):
+        bot.app.bot.set_my_commands = AsyncMock()
+        bot.app.bot.set_chat_menu_button = AsyncMock()
+        bot._admin_ids = frozenset({"1", "2", "bad"})
+        await bot._menu_setup_task()
+        scopes = [call.kwargs.get("scope") for call in bot.app.bot.set_my_commands.await_args_list]
+        assert sorted(s.chat_id for s in scopes[1:]) == [1, 2]
+        bot.app.bot.set_chat_menu_button.assert_awaited_once()
@@ -8,9 +8,9 @@
 - convert_to_user_data для генератора
 """
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from backend.bot.ai_agent import LandingAIAgent
+from backend.bot.ai_agent import LandingAIAgent, _EXTRACTION_CACHE
 
 
 @pytest.fixture
@@ -257,3 +257,79 @@ class TestScenarioWildberriesDescription:
             agent.collected_data["files"] = []
             user_data = agent.convert_to_user_data()
             assert user_data["description_is_wildberries"] is False
+
+
+
+# ---------- Кэш LLM-извлечения ----------
+
+class TestExtractionCache:
+    """Повторное сообщение на том же этапе не вызывает LLM повторно."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        _EXTRACTION_CACHE.clear()
+        yield
+        _EXTRACTION_CACHE.clear()
+
+    async def test_same_message_served_from_cache(self, mock_llm_client):
+        agent = LandingAIAgent("SINGLE")
+        other = LandingAIAgent("SINGLE")
+        llm = AsyncMock(return_value='{"product_name": "Подушка"}')
+        with patch.object(LandingAIAgent, "_call_llm_for_dialogue", llm):
+            first = await agent._llm_extract_data("Подушка  ортопедическая", "products")
+            first["product_name"] = "изменено"
+            second = await other._llm_extract_data("Подушка ортопедическая", "products")
+        assert second == {"product_name": "Подушка"}
+        llm.assert_awaited_once()
+
+    async def test_nested_values_not_shared_between_users(self, mock_llm_client):
+        agent = LandingAIAgent("SINGLE")
+        other = LandingAIAgent("SINGLE")
+        llm = AsyncMock(return_value='{"sizes": ["S", "M"], "product_data": {"color": "синий"}}')
+        with patch.object(LandingAIAgent, "_call_llm_for_dialogue", llm):
+            first = await agent._llm_extract_data("Размеры S и M", "products")
+            first["sizes"].append("XL")
+            first["product_data"]["color"] = "красный"
+            second = await other._llm_extract_data("Размеры S и M", "products")
+        assert second == {"sizes": ["S", "M"], "product_data": {"color": "синий"}}
+
+    async def test_cache_key_includes_stage_and_empty_results_not_cached(self, mock_llm_client):
+        agent = LandingAIAgent("SINGLE")
+        llm = AsyncMock(return_value="{}")
+        with patch.object(LandingAIAgent, "_call_llm_for_dialogue", llm):
+            await agent._llm_extract_data("текст", "products")
+            await agent._llm_extract_data("текст", "products")
+            await agent._llm_extract_data("текст", "general_info")
+        assert llm.await_count == 3
+
+
+
+# ---------- Главный (hero) файл ----------
+
+class TestHeroFile:
+    """hero_file: первый файл блока hero, без повторного просмотра списка файлов."""
+
+    async def test_hero_file_tracks_added_and_restored_files(self, mock_llm_client, tmp_path):
+        agent = LandingAIAgent("SINGLE")
+        assert agent.hero_file is None
+        paths = []
+        for name in ("a.jpg", "b.jpg"):
+            path = tmp_path / name
+            path.write_bytes(b"jpeg")
+            paths.append(str(path))
+        await agent.add_files_only([{"path": paths[0], "type": "photo"}])
+        await agent.add_files_only([{"path": paths[1], "type": "photo"}])
+        assert agent.hero_file["path"] == paths[0]
+        assert [f["block"] for f in agent.collected_data["files"]] == ["hero", "gallery"]
+
+        restored = LandingAIAgent.from_serialized_state(agent.serialize_state())
+        assert restored.hero_file["path"] == paths[0]
+        restored.collected_data = {**restored.collected_data, "files": [{"path": "x", "block": "gallery"}]}
+        assert restored.hero_file is None
+
+
+    def test_parse_mode_survives_restore(self, mock_llm_client):
+        agent = LandingAIAgent("SINGLE")
+        agent.parse_mode = None
+        assert LandingAIAgent.from_serialized_state(agent.serialize_state()).parse_mode is None
+        assert LandingAIAgent.from_serialized_state({"mode": "SINGLE"}).parse_mode == "HTML"
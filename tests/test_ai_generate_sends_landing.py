@@ -2,10 +2,13 @@
 Тесты сценария «Да, генерировать»: проверка, что бот при успешной генерации
 отправляет пользователю архив с лендингом (send_document вызывается с zip).
 """
+import asyncio
+
 import pytest
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
+from telegram.error import BadRequest, RetryAfter
 
-from backend.bot.telegram_bot import LandingBot, AI_CONVERSATION, ConversationHandler
+from backend.bot.telegram_bot import LandingBot, AgentEntry, AI_CONVERSATION, ConversationHandler
 from tests.mocks.mock_ai_agent import MockLandingAIAgent
 
 
@@ -78,8 +81,7 @@ async def test_handle_ai_generate_sends_document_when_generation_succeeds(
     zip_path = tmp_path / "project_abc12345.zip"
     zip_path.write_bytes(b"PK\x03\x04")  # минимальный zip-заголовок
 
-    bot.ai_agents[user_id] = agent_ready_for_generation
-    bot.ai_agents_last_activity[user_id] = 0
+    bot.ai_agents[user_id] = AgentEntry(agent_ready_for_generation, 0)
     bot.code_generator.generate = AsyncMock(return_value={
         "success": True,
         "files": {"zip_file": str(zip_path), "project_dir": str(tmp_path)},
@@ -113,8 +115,7 @@ async def test_handle_ai_generate_does_not_send_document_when_generation_fails(
     bot = bot_with_mock_app
     user_id = update_with_ai_generate_callback.effective_user.id
 
-    bot.ai_agents[user_id] = agent_ready_for_generation
-    bot.ai_agents_last_activity[user_id] = 0
+    bot.ai_agents[user_id] = AgentEntry(agent_ready_for_generation, 0)
     bot.code_generator.generate = AsyncMock(return_value={
         "success": False,
         "error": "LLM API error",
@@ -133,3 +134,114 @@ async def test_handle_ai_generate_does_not_send_document_when_generation_fails(
     last_call = update_with_ai_generate_callback.callback_query.edit_message_text.call_args
     text_sent = (last_call[0][0] if last_call[0] else last_call[1].get("text", ""))
     assert "Ошибка" in text_sent or "ошибка" in text_sent.lower()
+
+
+@pytest.mark.asyncio
+async def test_double_click_starts_one_generation(
+    bot_with_mock_app,
+    update_with_ai_generate_callback,
+    agent_ready_for_generation,
+    mock_context,
+):
+    """Повторное нажатие, пока генерация идёт, только подтверждается и вторую генерацию не запускает."""
+    bot = bot_with_mock_app
+    user_id = update_with_ai_generate_callback.effective_user.id
+    agent_ready_for_generation.recover_telegram_credentials_from_history = Mock()
+    bot.ai_agents[user_id] = AgentEntry(agent_ready_for_generation, 0)
+    release = asyncio.Event()
+
+    async def generate(*args):
+        await release.wait()
+        return {"success": False, "error": "boom"}
+
+    bot.code_generator.generate = AsyncMock(side_effect=generate)
+    query = update_with_ai_generate_callback.callback_query
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+
+    with patch("backend.bot.telegram_bot.rate_limiter.check_db_rate_limit", new_callable=AsyncMock, return_value=(True, 5)):
+        first = asyncio.create_task(bot.handle_ai_generate(update_with_ai_generate_callback, mock_context))
+        while not bot.code_generator.generate.await_count:
+            await asyncio.sleep(0)
+        second = await bot.handle_ai_generate(update_with_ai_generate_callback, mock_context)
+        release.set()
+        assert await first == AI_CONVERSATION
+
+    assert second == AI_CONVERSATION
+    bot.code_generator.generate.assert_awaited_once()
+    query.answer.assert_any_await(None, cache_time=2)
+    query.answer.assert_any_await("⏳ Генерация уже идёт…", cache_time=2)
+    assert user_id not in bot._ai_generating
+
+
+@pytest.mark.asyncio
+async def test_incomplete_data_rejected_before_rate_limit(
+    bot_with_mock_app,
+    update_with_ai_generate_callback,
+    agent_ready_for_generation,
+    mock_context,
+):
+    """Без фото генерация отклоняется локально: лимит в БД не запрашивается, данные не конвертируются."""
+    bot = bot_with_mock_app
+    user_id = update_with_ai_generate_callback.effective_user.id
+    agent_ready_for_generation.collected_data["files"] = []
+    agent_ready_for_generation.convert_to_user_data = Mock()
+    bot.ai_agents[user_id] = AgentEntry(agent_ready_for_generation, 0)
+    query = update_with_ai_generate_callback.callback_query
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+
+    with patch("backend.bot.telegram_bot.rate_limiter.check_db_rate_limit", new_callable=AsyncMock) as check:
+        result = await bot.handle_ai_generate(update_with_ai_generate_callback, mock_context)
+
+    assert result == AI_CONVERSATION
+    check.assert_not_awaited()
+    agent_ready_for_generation.convert_to_user_data.assert_not_called()
+    assert "фотография" in query.edit_message_text.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_success_leaves_only_progress_edit(
+    bot_with_mock_app,
+    update_with_ai_generate_callback,
+    agent_ready_for_generation,
+    mock_context,
+    tmp_path,
+):
+    """После отправки архива сообщение с кнопкой не редактируется: итог — подпись документа."""
+    bot = bot_with_mock_app
+    user_id = update_with_ai_generate_callback.effective_user.id
+    zip_path = tmp_path / "project.zip"
+    zip_path.write_bytes(b"PK\x03\x04")
+    agent_ready_for_generation.recover_telegram_credentials_from_history = Mock()
+    bot.ai_agents[user_id] = AgentEntry(agent_ready_for_generation, 0)
+    bot.code_generator.generate = AsyncMock(return_value={"success": True, "files": {"zip_file": str(zip_path)}})
+    query = update_with_ai_generate_callback.callback_query
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+
+    with patch("backend.bot.telegram_bot.rate_limiter.check_db_rate_limit", new_callable=AsyncMock, return_value=(True, 5)):
+        result = await bot.handle_ai_generate(update_with_ai_generate_callback, mock_context)
+
+    assert result == ConversationHandler.END
+    query.edit_message_text.assert_awaited_once()
+    assert query.edit_message_text.call_args.args[0].startswith("🔄")
+    assert "/ai" in bot.app.bot.send_document.call_args.kwargs["caption"]
+
+
+@pytest.mark.asyncio
+async def test_edit_query_message_retries_and_falls_back(bot_with_mock_app):
+    """RetryAfter — повтор после паузы; нередактируемое сообщение — новое сообщение."""
+    bot = bot_with_mock_app
+    query = MagicMock()
+    query.edit_message_text = AsyncMock(side_effect=[RetryAfter(3), None])
+    query.message.reply_text = AsyncMock()
+    with patch("backend.bot.telegram_bot.asyncio.sleep", new_callable=AsyncMock) as sleep:
+        await bot._edit_query_message(query, "текст")
+    sleep.assert_awaited_once_with(3)
+    assert query.edit_message_text.await_count == 2
+    query.message.reply_text.assert_not_awaited()
+
+    query.edit_message_text = AsyncMock(side_effect=BadRequest("Message can't be edited"))
+    await bot._edit_query_message(query, "текст")
+    query.message.reply_text.assert_awaited_once_with("текст")
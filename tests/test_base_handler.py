@@ -28,7 +28,7 @@ def handler(mock_bot):
 class TestBaseHandlerData:
     def test_get_user_data_delegates_to_bot(self, handler, mock_bot):
         data = handler.get_user_data(12345)
-        mock_bot._get_user_data.assert_called_once_with(12345)
+        mock_bot._get_user_data.assert_called_once_with(12345, copy=True)
         assert data == {"product_name": "Test"}
 
     def test_update_user_data_calls_bot(self, handler, mock_bot):
@@ -44,7 +44,7 @@ class TestBaseHandlerData:
 
     def test_save_state_without_data_uses_get_user_data(self, handler, mock_bot):
         handler.save_state(12345, "NEXT_STATE", conversation_type="quick")
-        mock_bot._get_user_data.assert_called_with(12345)
+        mock_bot._get_user_data.assert_called_with(12345, copy=True)
         mock_bot._save_user_data.assert_called_once()
         assert mock_bot._save_user_data.call_args[0][1] == {"product_name": "Test"}
 
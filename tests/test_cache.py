@@ -9,7 +9,7 @@ from unittest.mock import patch
 
 import pytest
 
-from backend.utils.cache import PromptCache
+from backend.utils.cache import PromptCache, LRUCache
 
 
 @pytest.fixture
@@ -37,6 +37,14 @@ class TestPromptCache:
         key2 = cache_with_dir._generate_cache_key({"product_name": "B"})
         assert key1 != key2
 
+    def test_cache_key_covers_all_prompt_data(self, cache_with_dir):
+        base = {"product_name": "A", "description_text": "первое", "new_price": "99"}
+        reordered = dict(reversed(list(base.items())))
+        assert cache_with_dir._generate_cache_key(base) == cache_with_dir._generate_cache_key(reordered)
+        # Любое поле, попадающее в промпт, меняет ключ (раньше описание в ключ не входило)
+        assert cache_with_dir._generate_cache_key(base) != cache_with_dir._generate_cache_key({**base, "description_text": "второе"})
+        assert cache_with_dir._generate_cache_key(base, "single_product") != cache_with_dir._generate_cache_key(base, "multi_product")
+
     def test_get_miss_returns_none(self, cache_with_dir):
         result = cache_with_dir.get({"product_name": "X"})
         assert result is None
@@ -80,3 +88,29 @@ class TestPromptCache:
         Path(path).write_text("not json", encoding="utf-8")
         result = cache_with_dir.get(user_data)
         assert result is None
+
+
+class TestLRUCache:
+    def test_get_missing_returns_default(self):
+        cache = LRUCache(max_size=2)
+        assert cache.get("x") is None
+        assert cache.get("x", 5) == 5
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+        assert len(cache) == 2
+
+    def test_pop_and_clear(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        assert cache.pop("a") == 1
+        assert cache.pop("a") is None
+        cache.set("b", 2)
+        cache.clear()
+        assert len(cache) == 0
@@ -4,7 +4,14 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from backend.generator.code_generator import CodeGenerator
+from backend.generator.code_generator import CodeGenerator, _GENERATED_CODE_CACHE
+
+
+@pytest.fixture(autouse=True)
+def clear_generated_code_cache():
+    _GENERATED_CODE_CACHE.clear()
+    yield
+    _GENERATED_CODE_CACHE.clear()
 
 
 # Минимальный валидный ответ LLM (чтобы проходила валидация и не срабатывал fallback)
@@ -93,3 +100,29 @@ class TestCodeGenerator:
         assert "error" in result
         assert "API key" in result["error"] or "invalid" in result["error"]
         assert "generation_time" in result
+
+    @pytest.mark.asyncio
+    async def test_identical_prompt_reuses_accepted_llm_response(self, minimal_user_data):
+        """Повторная генерация с теми же данными не обращается к LLM: берётся принятый ответ"""
+        # В CSS — рекомендуемый для товара цвет, иначе ответ LLM заменяется fallback-шаблоном
+        from backend.generator.prompt_builder_new import NewPromptBuilder
+        style = NewPromptBuilder()._analyze_product_and_suggest_style(
+            minimal_user_data["product_name"], minimal_user_data["description_text"]
+        )
+        response = _minimal_llm_response()
+        response["css"] += f".accent {{ color: {style['colors']['primary']}; }}\n"
+        generator = CodeGenerator()
+        generator.llm_client.generate_landing = AsyncMock(return_value=response)
+        generator.validator = MagicMock()
+        generator.validator.validate.side_effect = lambda code, user_data=None: {"valid": True, "errors": [], "warnings": []}
+
+        with patch.object(generator, "_save_files", new_callable=AsyncMock) as mock_save:
+            mock_save.return_value = {"project_dir": "/tmp/test_project", "zip_file": "/tmp/test.zip"}
+            first = await generator.generate("single_product", minimal_user_data)
+            second = await generator.generate("single_product", minimal_user_data)
+
+        assert first["success"] and second["success"]
+        generator.llm_client.generate_landing.assert_awaited_once()
+        assert second["tokens_used"] == 0
+        # Дописанные в код элементы (пиксель и т.п.) не попадают в кэш
+        assert mock_save.await_args_list[0].args[0]["html"] == mock_save.await_args_list[1].args[0]["html"]
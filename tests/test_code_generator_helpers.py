@@ -4,11 +4,11 @@
 import json
 import os
 import tempfile
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 import pytest
 
-from backend.generator.code_generator import CodeGenerator
+from backend.generator.code_generator import CodeGenerator, _dump_prompt, _css_signals
 
 
 @pytest.fixture
@@ -75,3 +75,72 @@ class TestCodeGeneratorBaseCssWithColors:
         result = generator._create_base_css_with_colors(colors, fonts)
         assert "Open+Sans" in result or "Open Sans" in result
         assert "Source" in result
+
+
+class TestCodeGeneratorRequiredElements:
+    def test_media_paths_rewritten_to_img(self, generator):
+        html = (
+            '<body><img src="generated_landings/p1/photos/review_1.jpg">'
+            "<img src='/tmp/x/hero.mp4'><img src=\"a/gallery_3.jpeg\">"
+            "<video src='m/middle.webm'></video></body>"
+        )
+        result = generator._add_required_elements({"html": html, "css": "", "js": ""}, "t1", {})["html"]
+        assert 'src="img/review_1.jpg"' in result
+        assert "src='img/hero.mp4'" in result
+        assert 'src="img/gallery_3.jpeg"' in result
+        assert "src='img/middle.webm'" in result
+
+    def test_static_fixups_applied(self, generator):
+        html = (
+            '<head><link href="css/pillow.css"><script src="js/pillow.js"></script></head>'
+            '<body><form action=""></form><form action=\'sendCPA.php\'></form></body>'
+        )
+        result = generator._add_required_elements({"html": html, "css": "", "js": ""}, "t1", {})["html"]
+        assert 'href="css/style.css"' in result
+        assert 'src="js/script.js"' in result
+        assert 'action="send.php"' in result
+        assert "action='send.php'" in result
+        assert "pillow" not in result and "sendCPA" not in result
+
+
+class TestCodeGeneratorSaveFiles:
+    async def test_pages_written(self, generator, tmp_path):
+        code = {"html": "<html></html>", "css": "body{}", "js": "//js", "send_php": "<?php"}
+        with patch("backend.generator.code_generator.Config.FILES_DIR", str(tmp_path)), \
+             patch.object(generator, "_copy_user_media", new_callable=AsyncMock), \
+             patch.object(generator, "_create_zip", new_callable=AsyncMock, return_value="p.zip"):
+            info = await generator._save_files(code, "t1", {"landing_type": "single"})
+        project_dir = info["project_dir"]
+        assert open(info["html_file"], encoding="utf-8").read() == "<html></html>"
+        assert open(info["css_file"], encoding="utf-8").read() == "body{}"
+        assert open(os.path.join(project_dir, "send.php"), encoding="utf-8").read() == "<?php"
+        for page in ("good.html", "oferta.html", "obmen.html", "politics.html"):
+            assert os.path.getsize(os.path.join(project_dir, page)) > 0
+
+
+class TestDumpPrompt:
+    def test_prompt_saved_to_prompts_dir(self, tmp_path):
+        with patch("backend.generator.code_generator.Config.FILES_DIR", str(tmp_path)):
+            _dump_prompt("PROMPT", {"product_name": "a/b", "landing_type": "single"})
+        (dump,) = (tmp_path / "prompts").iterdir()
+        assert dump.name.endswith("_a_b.txt")
+        content = dump.read_text(encoding="utf-8")
+        assert content.endswith("PROMPT") and "Landing type: single" in content
+
+    def test_write_errors_are_logged(self, tmp_path):
+        with patch("backend.generator.code_generator.Config.FILES_DIR", str(tmp_path)), \
+             patch("builtins.open", side_effect=OSError("disk full")):
+            _dump_prompt("PROMPT", {})  # не падает
+
+
+class TestCssSignals:
+    def test_signals(self):
+        css = ":root { --primary-color: #fff; }\nBODY { BACKGROUND: red; font-family: Inter; }"
+        assert _css_signals(css) == {
+            "lines": 2, "has_styles": True, "has_colors": True, "has_variables": True, "has_fonts": True,
+        }
+
+    def test_empty_css(self):
+        signals = _css_signals("")
+        assert signals["lines"] == 0
+        assert not any(value for key, value in signals.items() if key != "lines")
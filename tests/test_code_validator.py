@@ -39,6 +39,16 @@ class TestCodeValidatorValidate:
         assert isinstance(result["errors"], list)
         assert isinstance(result["warnings"], list)
 
+    def test_user_data_checked_in_same_call(self):
+        validator = CodeValidator()
+        code = {"html": VALID_HTML, "css": VALID_CSS, "js": VALID_JS}
+        assert validator.validate(code, user_data={"product_name": "Товар", "new_price": "99 BYN"})["valid"] is True
+
+        result = validator.validate(code, user_data={"product_name": "Ортопедическая подушка", "new_price": "777"})
+        assert result["valid"] is False
+        assert any("Ортопедическая подушка" in e for e in result["errors"])
+        assert any("777" in w for w in result["warnings"])
+
     def test_empty_html_fails(self):
         validator = CodeValidator()
         result = validator.validate({"html": "", "css": "x", "js": "x"})
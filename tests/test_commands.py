@@ -0,0 +1,100 @@
+"""
+Тесты команд /start и /help и кнопок главного меню
+"""
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from backend.bot.telegram_bot import LandingBot, HELP_TEXT, HELP_TEXT_PLAIN, _strip_html_tags, _MARKUP_STRIP_RE, _md_escape, _GENERATION_COMMAND_RE
+from backend.database.models import User
+
+
+@pytest.fixture
+async def bot(test_db_session, mock_application):
+    """Бот, у которого все сессии БД указывают на in-memory SQLite"""
+    with patch("backend.bot.telegram_bot.SessionLocal", return_value=test_db_session):
+        with patch("backend.bot.telegram_bot.init_db"):
+            yield LandingBot()
+
+
+class TestCommands:
+    """Тесты start_command / help_command"""
+
+    async def test_start_greets_user_by_name(self, bot, mock_update, mock_context):
+        await bot.start_command(mock_update, mock_context)
+        text = mock_update.message.reply_text.call_args.args[0]
+        assert text.startswith("👋 Привет, Test!")
+        assert "<b>" in text
+
+    async def test_start_falls_back_to_plain_text(self, bot, mock_update, mock_context):
+        mock_update.message.reply_text = AsyncMock(side_effect=[Exception("can't parse entities"), None])
+        await bot.start_command(mock_update, mock_context)
+        text = mock_update.message.reply_text.call_args.args[0]
+        assert text.startswith("👋 Привет, Test!")
+        assert "<b>" not in text
+
+    async def test_start_creates_user_once(self, bot, mock_update, mock_context, test_db_session):
+        await bot.start_command(mock_update, mock_context)
+        await bot.start_command(mock_update, mock_context)
+        users = test_db_session.query(User).all()
+        assert [(u.telegram_id, u.username) for u in users] == [(str(mock_update.effective_user.id), mock_update.effective_user.username)]
+
+    def test_upsert_user_returns_existing_id(self, bot, mock_update, test_db_session):
+        first = bot._upsert_user(test_db_session, mock_update.effective_user)
+        second = bot._upsert_user(test_db_session, mock_update.effective_user)
+        assert first == second == test_db_session.query(User.id).scalar()
+
+    def test_upsert_user_cached_after_first_lookup(self, bot, mock_update, test_db_session):
+        user = mock_update.effective_user
+        bot._upsert_user(test_db_session, user)
+        # Только что вставленный id не кэшируется (транзакция ещё может откатиться)
+        assert str(user.id) not in bot._user_pk_cache
+        user_pk = bot._upsert_user(test_db_session, user)
+        assert bot._user_pk_cache.get(str(user.id)) == user_pk
+
+        with patch.object(test_db_session, "execute", side_effect=AssertionError("DB should not be hit")):
+            assert bot._upsert_user(test_db_session, user) == user_pk
+
+    async def test_help_falls_back_to_plain_text(self, bot, mock_update, mock_context):
+        mock_update.message.reply_text = AsyncMock(side_effect=[Exception("can't parse entities"), None])
+        await bot.help_command(mock_update, mock_context)
+        first, second = mock_update.message.reply_text.call_args_list
+        assert first.args[0] == HELP_TEXT
+        assert second.args[0] == HELP_TEXT_PLAIN
+        assert "</b>" not in HELP_TEXT_PLAIN
+
+    async def test_menu_button_dispatches_to_handler(self, bot, mock_update, mock_context):
+        mock_update.message.text = "📚 Помощь"
+        await bot.handle_main_menu_button(mock_update, mock_context)
+        assert mock_update.message.reply_text.call_args.args[0] == HELP_TEXT
+
+    async def test_unknown_menu_text_is_ignored(self, bot, mock_update, mock_context):
+        mock_update.message.text = "что-то другое"
+        await bot.handle_main_menu_button(mock_update, mock_context)
+        mock_update.message.reply_text.assert_not_called()
+
+
+class TestStripMarkup:
+    """Тесты удаления разметки для plain-text fallback"""
+
+    def test_strip_html_tags(self):
+        assert _strip_html_tags("<b>Жирный</b> и <i>курсив</i> <code>x</code>") == "Жирный и курсив <code>x</code>"
+
+    def test_strip_markdown_and_tags(self):
+        assert _MARKUP_STRIP_RE.sub("", "*a* _b_ `c` <b>d</b>") == "a b c d"
+
+    def test_md_escape(self):
+        assert _md_escape("single_product *[x]* `y`") == "single\\_product \\*\\[x]\\* \\`y\\`"
+
+
+class TestGenerationCommand:
+    """Тесты распознавания текстового подтверждения генерации"""
+
+    @pytest.mark.parametrize("text", [
+        "Да", "  начни  ", "Начинай генерацию", "Генерируй!", "ну давай уже", "я готова", "Создай лендинг",
+    ])
+    def test_confirmation_recognized(self, text):
+        assert _GENERATION_COMMAND_RE.search(text)
+
+    @pytest.mark.parametrize("text", ["да, но поменяй цену", "начни с описания", "нет"])
+    def test_other_text_not_recognized(self, text):
+        assert not _GENERATION_COMMAND_RE.search(text)
@@ -1,12 +1,14 @@
 """
 Тесты для проверки flow диалога через ConversationHandler
 """
+import asyncio
 import pytest
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from telegram import Update, Message, User, Chat
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from backend.bot.telegram_bot import LandingBot, AI_MODE_SELECTION, AI_CONVERSATION
+from backend.bot.telegram_bot import LandingBot, AgentEntry, AI_MODE_SELECTION, AI_CONVERSATION
 from tests.mocks.mock_ai_agent import MockLandingAIAgent
 
 
@@ -69,14 +71,14 @@ class TestConversationFlow:
         assert user_id not in bot_instance.ai_agents
         
         # Создаем агента (патчим там, откуда импортируется: ai_agent)
-        with patch('backend.bot.ai_agent.LandingAIAgent', MockLandingAIAgent):
+        with patch('backend.bot.telegram_bot.LandingAIAgent', MockLandingAIAgent):
             agent = MockLandingAIAgent(user_id, mode='SINGLE')
-            bot_instance.ai_agents[user_id] = agent
+            bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Проверяем, что агент создан
         assert user_id in bot_instance.ai_agents
-        assert bot_instance.ai_agents[user_id].mode == 'SINGLE'
-        assert bot_instance.ai_agents[user_id].stage == 'general_info'
+        assert bot_instance.ai_agents[user_id].agent.mode == 'SINGLE'
+        assert bot_instance.ai_agents[user_id].agent.stage == 'general_info'
     
     @pytest.mark.asyncio
     async def test_message_processing(self, bot_instance, mock_update, mock_context):
@@ -86,7 +88,7 @@ class TestConversationFlow:
         
         # Создаем mock агента
         agent = MockLandingAIAgent(user_id, mode='SINGLE')
-        bot_instance.ai_agents[user_id] = agent
+        bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Обрабатываем сообщение
         response = await agent.process_message(mock_update.message.text)
@@ -101,7 +103,7 @@ class TestConversationFlow:
         """Тест: переход между стадиями диалога"""
         user_id = mock_update.effective_user.id
         agent = MockLandingAIAgent(user_id, mode='SINGLE')
-        bot_instance.ai_agents[user_id] = agent
+        bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Начинаем с general_info
         assert agent.stage == 'general_info'
@@ -120,7 +122,7 @@ class TestConversationFlow:
         """Тест: сбор данных в collected_data"""
         user_id = mock_update.effective_user.id
         agent = MockLandingAIAgent(user_id, mode='SINGLE')
-        bot_instance.ai_agents[user_id] = agent
+        bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Собираем данные
         await agent.process_message("Цель - продажа")
@@ -136,7 +138,7 @@ class TestConversationFlow:
         """Тест: сохранение состояния AI-агента"""
         user_id = mock_update.effective_user.id
         agent = MockLandingAIAgent(user_id, mode='SINGLE')
-        bot_instance.ai_agents[user_id] = agent
+        bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Собираем данные
         await agent.process_message("Цель - продажа")
@@ -156,7 +158,7 @@ class TestConversationFlow:
         """Тест: отмена диалога"""
         user_id = mock_update.effective_user.id
         agent = MockLandingAIAgent(user_id, mode='SINGLE')
-        bot_instance.ai_agents[user_id] = agent
+        bot_instance.ai_agents[user_id] = AgentEntry(agent, 0)
         
         # Проверяем наличие агента
         assert user_id in bot_instance.ai_agents
@@ -170,3 +172,102 @@ class TestConversationFlow:
             mock_cancel.assert_called_once()
             assert result == -1
 
+    @pytest.mark.asyncio
+    async def test_media_download_reuses_existing_file(self, bot_instance, tmp_path):
+        """Тест: повторно присланный файл (тот же file_unique_id) не скачивается заново"""
+        file_path = str(tmp_path / "temp_1_abc.jpg")
+        file_obj = Mock(file_id="fid", file_unique_id="abc")
+
+        async def download(path):
+            with open(path, "wb") as f:
+                f.write(b"jpeg")
+
+        tg_file = Mock(download_to_drive=AsyncMock(side_effect=download))
+        bot_instance.app.bot.get_file = AsyncMock(return_value=tg_file)
+
+        await bot_instance._download_media(file_obj, file_path)
+        await bot_instance._download_media(file_obj, file_path)
+
+        bot_instance.app.bot.get_file.assert_awaited_once_with("fid")
+        tg_file.download_to_drive.assert_awaited_once_with(file_path + ".part")
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["temp_1_abc.jpg"]
+
+    @pytest.mark.asyncio
+    async def test_hero_vision_uses_shared_llm_client(self, bot_instance):
+        """Тест: vision-анализ hero-фото идёт через общий LLM-клиент бота, без создания нового"""
+        agent = MockLandingAIAgent(1, mode='SINGLE')
+        style = {'colors': {'primary': '#000'}, 'fonts': ['Inter']}
+        bot_instance.llm_client = Mock(analyze_image_style=AsyncMock(return_value=style))
+
+        with patch('backend.generator.llm_client.LLMClient') as new_client, \
+                patch.object(bot_instance, '_save_ai_agent_state_async', new_callable=AsyncMock):
+            await bot_instance._analyze_hero_image_async(1, 'hero.jpg', 'Товар', 'Описание', agent)
+
+        new_client.assert_not_called()
+        bot_instance.llm_client.analyze_image_style.assert_awaited_once_with('hero.jpg', 'Товар', 'Описание')
+        assert agent.collected_data['vision_style_suggestion'] == style
+
+    @pytest.mark.asyncio
+    async def test_hero_vision_started_once_while_running(self, bot_instance):
+        """Тест: vision-анализ не запускается повторно, пока идёт предыдущий, и разрешён снова после неудачи"""
+        agent = MockLandingAIAgent(1, mode='SINGLE')
+        assert not bot_instance._start_hero_vision(1, agent, 'hero.jpg')  # описания ещё нет
+
+        agent.collected_data['products'] = [{'product_name': 'Товар', 'product_description': 'Описание'}]
+        release = asyncio.Event()
+
+        async def analyze(*args):
+            await release.wait()
+            return None
+
+        bot_instance.llm_client = Mock(analyze_image_style=AsyncMock(side_effect=analyze))
+        assert bot_instance._start_hero_vision(1, agent, 'hero.jpg')
+        assert not bot_instance._start_hero_vision(1, agent, 'hero.jpg')
+
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        bot_instance.llm_client.analyze_image_style.assert_awaited_once_with('hero.jpg', 'Товар', 'Описание')
+        assert 'vision_running' not in agent.ui_flags
+
+    @pytest.mark.asyncio
+    async def test_failed_media_download_and_agent_cleanup_remove_temp_files(self, bot_instance, tmp_path):
+        """Тест: оборванная загрузка не оставляет .part, а очистка агента удаляет его временные файлы"""
+        file_path = str(tmp_path / "media" / "temp_1_abc.jpg")
+
+        async def download(path):
+            with open(path, "wb") as f:
+                f.write(b"jp")
+            raise OSError("connection reset")
+
+        tg_file = Mock(download_to_drive=AsyncMock(side_effect=download))
+        bot_instance.app.bot.get_file = AsyncMock(return_value=tg_file)
+        with pytest.raises(OSError):
+            await bot_instance._download_media(Mock(file_id="fid", file_unique_id="abc"), file_path)
+        assert list((tmp_path / "media").iterdir()) == []
+
+        (tmp_path / "media" / "temp_1_a.jpg").write_bytes(b"jpeg")
+        (tmp_path / "media" / "temp_2_b.jpg").write_bytes(b"jpeg")
+        (tmp_path / "media" / "temp_1_dir").mkdir()
+        with patch('backend.bot.telegram_bot.Config.FILES_DIR', str(tmp_path / "media")):
+            await bot_instance._cleanup_ai_agent_files(1)
+        assert sorted(p.name for p in (tmp_path / "media").iterdir()) == ["temp_1_dir", "temp_2_b.jpg"]
+        # Каталога ещё нет — очищать нечего
+        with patch('backend.bot.telegram_bot.Config.FILES_DIR', str(tmp_path / "absent")):
+            await bot_instance._cleanup_ai_agent_files(1)
+
+    @pytest.mark.asyncio
+    async def test_ai_reply_switches_to_plain_after_parse_error(self, bot_instance):
+        """Тест: после ошибки разметки ответ уходит plain-текстом, и следующий — сразу без HTML"""
+        agent = MockLandingAIAgent(1, mode='SINGLE')
+        message = Mock()
+        message.reply_text = AsyncMock(side_effect=[BadRequest("Can't parse entities: unclosed tag"), None, None])
+
+        await bot_instance._reply_ai_text(message, agent, "<b>Цена</b> *99*")
+        await bot_instance._reply_ai_text(message, agent, "<b>Дальше</b>")
+
+        calls = message.reply_text.await_args_list
+        assert calls[0].kwargs == {'parse_mode': 'HTML'}
+        assert calls[1].args == ("Цена 99",) and calls[1].kwargs == {}
+        assert calls[2].args == ("Дальше",) and calls[2].kwargs == {}
+        assert agent.parse_mode is None
@@ -3,8 +3,10 @@
 """
 import pytest
 from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine, event
 
 from backend.database import database
+from backend.utils.helpers import json_dumps_text, json_loads
 
 
 class TestInitDb:
@@ -44,7 +46,36 @@ class TestGetDb:
 
 
 class TestCloseDb:
-    def test_close_db_calls_remove(self):
-        with patch.object(database.SessionLocal, "remove") as remove:
+    def test_close_db_closes_sessions_and_pool(self):
+        with patch.object(database, "close_all_sessions") as close_all, \
+                patch.object(database, "engine") as engine:
             database.close_db()
-            remove.assert_called_once()
+        close_all.assert_called_once()
+        engine.dispose.assert_called_once()
+
+    def test_session_local_returns_new_session_each_call(self):
+        first, second = database.SessionLocal(), database.SessionLocal()
+        try:
+            assert first is not second
+        finally:
+            first.close()
+            second.close()
+
+
+class TestSqlitePragmas:
+    def test_sqlite_connection_uses_wal(self, tmp_path):
+        if not hasattr(database, "_set_sqlite_pragmas"):
+            pytest.skip("SQLite-only pragmas")
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+        event.listen(engine, "connect", database._set_sqlite_pragmas)
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        engine.dispose()
+
+
+class TestJsonSerializer:
+    def test_engine_uses_fast_json_helpers(self):
+        """Колонки JSON/JSONB (де)сериализуются через helpers (orjson), а не через стандартный json"""
+        assert database.engine.dialect._json_serializer is json_dumps_text
+        assert database.engine.dialect._json_deserializer is json_loads
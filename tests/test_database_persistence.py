@@ -12,7 +12,7 @@ class TestDatabasePersistence:
     def test_user_state_creation(self, test_db_session):
         """Тест: создание записи UserState"""
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data={"test": "data"},
             conversation_type="ai_agent"
@@ -23,11 +23,11 @@ class TestDatabasePersistence:
         
         # Проверяем, что запись создана
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12345"
+            UserState.user_id == 12345
         ).first()
         
         assert retrieved is not None
-        assert retrieved.user_id == "12345"
+        assert retrieved.user_id == 12345
         assert retrieved.state == "AI_CONVERSATION"
         assert retrieved.data == {"test": "data"}
         assert retrieved.conversation_type == "ai_agent"
@@ -36,7 +36,7 @@ class TestDatabasePersistence:
         """Тест: обновление записи UserState"""
         # Создаем запись
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data={"old": "data"},
             conversation_type="ai_agent"
@@ -51,7 +51,7 @@ class TestDatabasePersistence:
         
         # Проверяем обновление
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12345"
+            UserState.user_id == 12345
         ).first()
         
         assert retrieved.data == {"new": "data"}
@@ -62,7 +62,7 @@ class TestDatabasePersistence:
         # Создаем несколько записей
         for i in range(3):
             user_state = UserState(
-                user_id=f"1234{i}",
+                user_id=12340 + i,
                 state="AI_CONVERSATION",
                 data={"user": i},
                 conversation_type="ai_agent"
@@ -72,17 +72,17 @@ class TestDatabasePersistence:
         
         # Получаем конкретную запись
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12342"
+            UserState.user_id == 12342
         ).first()
         
         assert retrieved is not None
-        assert retrieved.user_id == "12342"
+        assert retrieved.user_id == 12342
         assert retrieved.data == {"user": 2}
     
     def test_user_state_with_ai_agent_data(self, test_db_session, sample_ai_agent_state):
         """Тест: сохранение данных AI-агента в UserState"""
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data={
                 "ai_agent_state": sample_ai_agent_state,
@@ -96,7 +96,7 @@ class TestDatabasePersistence:
         
         # Проверяем сохранение
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12345"
+            UserState.user_id == 12345
         ).first()
         
         assert retrieved is not None
@@ -109,7 +109,7 @@ class TestDatabasePersistence:
         """Тест: удаление записи UserState"""
         # Создаем запись
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data={"test": "data"},
             conversation_type="ai_agent"
@@ -123,7 +123,7 @@ class TestDatabasePersistence:
         
         # Проверяем удаление
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12345"
+            UserState.user_id == 12345
         ).first()
         
         assert retrieved is None
@@ -134,7 +134,7 @@ class TestDatabasePersistence:
         states = []
         for i in range(5):
             state = UserState(
-                user_id=f"user_{i}",
+                user_id=1000 + i,
                 state="AI_CONVERSATION",
                 data={"index": i},
                 conversation_type="ai_agent"
@@ -150,7 +150,7 @@ class TestDatabasePersistence:
         # Проверяем каждую запись
         for i in range(5):
             retrieved = test_db_session.query(UserState).filter(
-                UserState.user_id == f"user_{i}"
+                UserState.user_id == 1000 + i
             ).first()
             assert retrieved is not None
             assert retrieved.data["index"] == i
@@ -158,7 +158,7 @@ class TestDatabasePersistence:
     def test_user_state_timestamps(self, test_db_session):
         """Тест: автоматическое обновление timestamps"""
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data={},
             conversation_type="ai_agent"
@@ -167,7 +167,15 @@ class TestDatabasePersistence:
         test_db_session.commit()
         
         created_at = user_state.created_at
-        updated_at = user_state.updated_at
+        assert created_at is not None
+        assert user_state.updated_at is not None
+        
+        # Время ставит БД (точность ограничена часами БД) — сдвигаем метку в прошлое
+        updated_at = datetime(2000, 1, 1)
+        test_db_session.execute(
+            UserState.__table__.update().where(UserState.id == user_state.id).values(updated_at=updated_at)
+        )
+        test_db_session.commit()
         
         # Обновляем запись
         user_state.data = {"updated": True}
@@ -208,7 +216,7 @@ class TestDatabasePersistence:
         }
         
         user_state = UserState(
-            user_id="12345",
+            user_id=12345,
             state="AI_CONVERSATION",
             data=complex_data,
             conversation_type="ai_agent"
@@ -219,7 +227,7 @@ class TestDatabasePersistence:
         
         # Проверяем восстановление
         retrieved = test_db_session.query(UserState).filter(
-            UserState.user_id == "12345"
+            UserState.user_id == 12345
         ).first()
         
         assert retrieved.data == complex_data
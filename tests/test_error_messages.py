@@ -4,7 +4,7 @@
 import pytest
 from unittest.mock import patch, MagicMock
 
-from backend.bot.telegram_bot import LandingBot
+from backend.bot.telegram_bot import LandingBot, ERROR_MESSAGES, GENERIC_ERROR_MESSAGE
 
 
 class TestFormatErrorMessage:
@@ -54,3 +54,15 @@ class TestFormatErrorMessage:
         msg = bot._format_error_message("Some unknown error")
         assert "Ошибка" in msg
         assert "Что делать" in msg
+
+    def test_first_matching_category_wins(self, bot):
+        # «attempts» встречается раньше в тексте, но таймаут стоит выше в таблице
+        timeout_msg = ERROR_MESSAGES[0][1]
+        assert bot._format_error_message("3 attempts failed: Read Timeout") == timeout_msg
+
+    def test_generic_error_is_shared_constant(self, bot):
+        assert bot._format_error_message("Some unknown error") is GENERIC_ERROR_MESSAGE
+
+    def test_keywords_matched_case_insensitively(self, bot):
+        assert bot._format_error_message("СЕТЬ недоступна") == ERROR_MESSAGES[2][1]
+        assert bot._format_error_message("Invalid API KEY") == ERROR_MESSAGES[3][1]
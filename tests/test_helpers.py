@@ -9,7 +9,7 @@ from unittest.mock import patch
 
 import pytest
 
-from backend.utils.helpers import ensure_dir, cleanup_old_files, format_file_size, sanitize_filename
+from backend.utils.helpers import ensure_dir, cleanup_old_files, format_file_size, sanitize_filename, json_loads, json_dumps, json_dumps_text, pack_json, unpack_json, parse_price
 
 
 class TestEnsureDir:
@@ -80,3 +80,59 @@ class TestSanitizeFilename:
     def test_empty_after_removal(self):
         result = sanitize_filename('<>:"/\\|?*')
         assert result == ""
+
+
+class TestParsePrice:
+    """Тесты parse_price"""
+
+    @pytest.mark.parametrize("value,expected", [
+        ("152 BYN", 152.0),
+        ("EUR100", 100.0),
+        ("99,90 €", 99.9),
+        (" 1 000 ₽ ", 1000.0),
+        (250, 250.0),
+    ])
+    def test_parses_number(self, value, expected):
+        assert parse_price(value) == expected
+
+    def test_no_number_raises(self):
+        with pytest.raises(ValueError):
+            parse_price("договорная")
+
+
+class TestJsonLoads:
+    def test_parses_bytes_and_str(self):
+        assert json_loads('{"a": [1, "т"]}'.encode("utf-8")) == {"a": [1, "т"]}
+        assert json_loads('{"b": null}') == {"b": None}
+
+    def test_fallback_without_orjson(self):
+        with patch("backend.utils.helpers.orjson", None):
+            assert json_loads(b'{"a": 1}') == {"a": 1}
+
+
+class TestJsonDumps:
+    def test_round_trip(self):
+        data = {"a": [1, "т"], "b": None}
+        assert json_loads(json_dumps(data)) == data
+
+    def test_fallback_without_orjson(self):
+        with patch("backend.utils.helpers.orjson", None):
+            assert json_dumps({"a": "т"}) == '{"a": "т"}'.encode("utf-8")
+
+    def test_text_for_sqlalchemy(self):
+        assert json_loads(json_dumps_text({"a": "т", 1: [2]})) == {"a": "т", "1": [2]}
+        with patch("backend.utils.helpers.orjson", None):
+            assert json_dumps_text({"a": "т"}) == '{"a": "т"}'
+
+
+class TestPackJson:
+    def test_round_trip(self):
+        data = {"history": ["сообщение"] * 50}
+        blob = pack_json(data)
+        assert len(blob) < len(json_dumps(data))
+        assert unpack_json(blob) == data
+
+    def test_zlib_fallback_without_zstandard(self):
+        with patch("backend.utils.helpers.zstandard", None):
+            blob = pack_json({"a": 1})
+        assert unpack_json(blob) == {"a": 1}
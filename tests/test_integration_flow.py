@@ -74,7 +74,7 @@ class TestIntegrationFlow:
         
         # Проверяем, что в БД нет записей для этого пользователя
         initial_state = test_db_session.query(UserState).filter(
-            UserState.user_id == str(user_id)
+            UserState.user_id == user_id
         ).first()
         assert initial_state is None
         
@@ -100,7 +100,7 @@ class TestIntegrationFlow:
         
         # Подменяем LandingAIAgent на MockLandingAIAgent через monkeypatch
         # Это нужно сделать до вызова start_ai_agent
-        with patch('backend.bot.ai_agent.LandingAIAgent', MockLandingAIAgent):
+        with patch('backend.bot.telegram_bot.LandingAIAgent', MockLandingAIAgent):
             # Вызываем handler выбора режима
             result = await bot_instance.handle_mode_selection(mock_update_with_callback, mock_context)
             
@@ -109,30 +109,34 @@ class TestIntegrationFlow:
             
             # Проверяем, что агент был создан
             assert user_id in bot_instance.ai_agents
-            assert bot_instance.ai_agents[user_id].mode == 'SINGLE'
-            assert bot_instance.ai_agents[user_id].stage == 'general_info'
+            assert bot_instance.ai_agents[user_id].agent.mode == 'SINGLE'
+            assert bot_instance.ai_agents[user_id].agent.stage == 'general_info'
         
         # Шаг 4: Проверяем сохранение в БД после создания агента
         db_state = test_db_session.query(UserState).filter(
-            UserState.user_id == str(user_id)
+            UserState.user_id == user_id
         ).first()
         
         assert db_state is not None, "UserState должен быть создан в БД"
         assert db_state.state == "AI_CONVERSATION"
         assert db_state.conversation_type == "ai_agent"
-        assert "ai_agent_state" in db_state.data
-        assert db_state.data["ai_agent_state"]["mode"] == "SINGLE"
+        # Состояние агента хранится сжатым в agent_blob, а не в data
+        assert "ai_agent_state" not in db_state.data
+        assert LandingBot._row_data(db_state)["ai_agent_state"]["mode"] == "SINGLE"
         
         # Шаг 5: Отправляем сообщение пользователя (например, цель сайта)
         mock_update.message.text = "Цель - продажа товаров"
         
         # Используем MockLandingAIAgent для обработки сообщения
-        agent = bot_instance.ai_agents[user_id]
+        agent = bot_instance.ai_agents[user_id].agent
         mock_update.message.reply_text = AsyncMock()
         
         # Вызываем handler обработки сообщения (используем тот же patch для LandingAIAgent)
-        with patch('backend.bot.ai_agent.LandingAIAgent', MockLandingAIAgent):
+        with patch('backend.bot.telegram_bot.LandingAIAgent', MockLandingAIAgent), \
+                patch('backend.bot.telegram_bot.AI_AGENT_SAVE_DELAY', 0):
             result = await bot_instance.handle_ai_message(mock_update, mock_context)
+            # Состояние пишется в фоне после ответа — дожидаемся записи
+            await bot_instance._flush_ai_agent_saves(user_id)
         
         # Проверяем, что handler вернул AI_CONVERSATION (продолжение диалога)
         assert result == AI_CONVERSATION
@@ -146,14 +150,14 @@ class TestIntegrationFlow:
         
         # Шаг 7: Проверяем обновление данных в БД (запрос заново, без refresh — сессия могла измениться)
         updated_db_state = test_db_session.query(UserState).filter(
-            UserState.user_id == str(user_id)
+            UserState.user_id == user_id
         ).first()
         
         assert updated_db_state is not None
-        assert "ai_agent_state" in updated_db_state.data
+        assert updated_db_state.agent_blob is not None
         
         # Проверяем, что состояние агента обновилось в БД
-        agent_state_in_db = updated_db_state.data["ai_agent_state"]
+        agent_state_in_db = LandingBot._row_data(updated_db_state)["ai_agent_state"]
         assert agent_state_in_db["mode"] == "SINGLE"
         assert "conversation_history" in agent_state_in_db
         assert len(agent_state_in_db["conversation_history"]) > 0
@@ -163,8 +167,10 @@ class TestIntegrationFlow:
         mock_update.message.reply_text = AsyncMock()
         
         # Используем patch для LandingAIAgent при обработке сообщения
-        with patch('backend.bot.ai_agent.LandingAIAgent', MockLandingAIAgent):
+        with patch('backend.bot.telegram_bot.LandingAIAgent', MockLandingAIAgent), \
+                patch('backend.bot.telegram_bot.AI_AGENT_SAVE_DELAY', 0):
             result = await bot_instance.handle_ai_message(mock_update, mock_context)
+            await bot_instance._flush_ai_agent_saves(user_id)
         
         assert result == AI_CONVERSATION
         
@@ -176,11 +182,11 @@ class TestIntegrationFlow:
         
         # Шаг 9: Проверяем финальное состояние в БД
         final_db_state = test_db_session.query(UserState).filter(
-            UserState.user_id == str(user_id)
+            UserState.user_id == user_id
         ).first()
         
         assert final_db_state is not None
-        final_agent_state = final_db_state.data["ai_agent_state"]
+        final_agent_state = LandingBot._row_data(final_db_state)["ai_agent_state"]
         
         # Проверяем, что история диалога обновилась
         assert len(final_agent_state["conversation_history"]) >= 4  # минимум 2 user + 2 assistant
@@ -196,11 +202,10 @@ class TestIntegrationFlow:
         
         # Финальная проверка: все компоненты работают вместе
         assert user_id in bot_instance.ai_agents
-        assert bot_instance.ai_agents[user_id].mode == "SINGLE"
-        assert bot_instance.ai_agents[user_id].stage in ["general_info", "products"]
+        assert bot_instance.ai_agents[user_id].agent.mode == "SINGLE"
+        assert bot_instance.ai_agents[user_id].agent.stage in ["general_info", "products"]
         assert final_db_state.state == "AI_CONVERSATION"
-        assert "ai_agent_state" in final_db_state.data
-        assert final_db_state.data["ai_agent_state"]["mode"] == "SINGLE"
+        assert final_agent_state["mode"] == "SINGLE"
 
 
 # This test validates full integration flow:
@@ -27,6 +27,15 @@ class TestLLMClientInit:
             assert client.provider == "openai"
             MockOpenAI.assert_called_once_with(api_key="sk-key")
 
+    def test_sdk_client_shared_between_instances(self, mock_config):
+        with patch("backend.generator.llm_client.OpenAI", side_effect=lambda api_key: MagicMock()) as MockOpenAI:
+            first = LLMClient(api_key="sk-shared", provider="openai")
+            second = LLMClient(api_key="sk-shared", provider="openai")
+            other = LLMClient(api_key="sk-other", provider="openai")
+        assert first.client is second.client
+        assert other.client is not first.client
+        assert MockOpenAI.call_count == 2
+
     def test_init_unknown_provider_raises(self, mock_config):
         with pytest.raises(ValueError) as exc_info:
             LLMClient(provider="unknown")
@@ -82,6 +91,22 @@ class TestLLMClientGenerateLanding:
         assert "ключ" in str(exc_info.value).lower() or "client" in str(exc_info.value).lower()
 
 
+class TestLLMClientWarmup:
+    async def test_warmup_lists_models(self, mock_config):
+        with patch("backend.generator.llm_client.OpenAI"):
+            client = LLMClient(api_key="sk-warm", provider="openai")
+        assert await client.warmup() is True
+        client.client.models.list.assert_called_once_with()
+
+    async def test_warmup_errors_are_swallowed(self, mock_config):
+        with patch("backend.generator.llm_client.OpenAI"):
+            client = LLMClient(api_key="sk-warm", provider="openai")
+        client.client.models.list.side_effect = RuntimeError("network down")
+        assert await client.warmup() is False
+        client.client = None
+        assert await client.warmup() is False
+
+
 class TestLLMClientTestConnection:
     def test_test_connection_returns_false_when_client_none(self, mock_config):
         with patch("backend.generator.llm_client.OpenAI"):
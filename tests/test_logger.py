@@ -1,6 +1,7 @@
 """
 Тесты для backend.utils.logger
 """
+import json
 import logging
 import os
 import tempfile
@@ -15,6 +16,7 @@ from backend.utils.logger import (
     log_with_context,
     SecretRedactionFilter,
     ContextualFormatter,
+    JsonFormatter,
     setup_logging,
 )
 
@@ -65,6 +67,30 @@ class TestContextualFormatter:
         assert "N/A" in out or "hello" in out
 
 
+class TestJsonFormatter:
+    def test_format_includes_extra_fields(self):
+        clear_request_context()
+        record = logging.LogRecord("n", logging.INFO, "", 0, "done %s", ("ok",), None)
+        record.event = "generation"
+        record.user_id = 42
+        data = json.loads(JsonFormatter().format(record))
+        assert data["message"] == "done ok"
+        assert data["level"] == "INFO"
+        assert data["event"] == "generation"
+        assert data["user_id"] == 42
+        assert "args" not in data and "msg" not in data
+
+    def test_format_uses_request_context(self):
+        set_request_context(request_id="req-7")
+        try:
+            record = logging.LogRecord("n", logging.WARNING, "", 0, "т", (), None)
+            data = json.loads(JsonFormatter().format(record))
+        finally:
+            clear_request_context()
+        assert data["request_id"] == "req-7"
+        assert data["message"] == "т"
+
+
 class TestRequestContext:
     def test_set_and_clear_request_context(self):
         clear_request_context()
@@ -5,6 +5,7 @@ import pytest
 from unittest.mock import MagicMock, patch
 
 from backend.utils.metrics import MetricsCollector
+from backend.database.models import User, UserState
 
 
 class TestMetricsCollector:
@@ -135,3 +136,18 @@ class TestMetricsCollector:
             result = MetricsCollector.get_all_telegram_user_ids()
         assert result == []
         mock_db.close.assert_called_once()
+
+    def test_iter_telegram_user_ids_streams_union(self, test_db_session):
+        test_db_session.add_all([
+            User(telegram_id="123"), User(telegram_id="not_a_number"),
+            UserState(user_id=123, data={}), UserState(user_id=456, data={}),
+        ])
+        test_db_session.commit()
+        with patch("backend.utils.metrics.SessionLocal", return_value=test_db_session), \
+                patch.object(test_db_session, "close", wraps=test_db_session.close) as close:
+            ids = MetricsCollector.iter_telegram_user_ids(chunk_size=1)
+            first = next(ids)
+            # Страница прочитана — сессия уже закрыта, пока вызывающий код обрабатывает id
+            assert close.call_count == 1
+            result = [first, *ids]
+        assert result == [123, 456]
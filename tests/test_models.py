@@ -2,6 +2,7 @@
 Тесты для backend.database.models
 """
 import pytest
+from datetime import datetime, timedelta
 
 from backend.database.models import User, Project, Generation, UserState
 
@@ -65,22 +66,37 @@ class TestGeneration:
         test_db_session.flush()
         assert g.success is False
 
+    def test_created_at_set_by_db_in_utc(self, test_db_session):
+        """Время создания ставит БД (naive UTC) — окно rate limit по datetime.utcnow() его видит"""
+        user = User(telegram_id="ts_user", username="u")
+        test_db_session.add(user)
+        test_db_session.flush()
+        proj = Project(template_id="t", template_name="T", user_id=user.id, user_data={})
+        test_db_session.add(proj)
+        test_db_session.flush()
+        test_db_session.add(Generation(project_id=proj.id, user_id="ts_user", prompt="p"))
+        test_db_session.commit()
+
+        cutoff = datetime.utcnow() - timedelta(minutes=1)
+        assert test_db_session.query(Generation).filter(Generation.created_at >= cutoff).count() == 1
+        assert user.created_at >= cutoff and proj.updated_at >= cutoff
+
 
 class TestUserState:
     def test_repr(self):
-        s = UserState(user_id="111", state="COLLECTING", data={})
+        s = UserState(user_id=111, state="COLLECTING", data={})
         r = repr(s)
         assert "111" in r
         assert "COLLECTING" in r
 
     def test_default_data(self):
-        s = UserState(user_id="222", state="S", data={})
+        s = UserState(user_id=222, state="S", data={})
         assert s.data == {}
 
     def test_persist_and_retrieve(self, test_db_session):
-        s = UserState(user_id="333", state="AI_CONVERSATION", data={"key": "value"})
+        s = UserState(user_id=333, state="AI_CONVERSATION", data={"key": "value"})
         test_db_session.add(s)
         test_db_session.commit()
-        loaded = test_db_session.query(UserState).filter(UserState.user_id == "333").first()
+        loaded = test_db_session.query(UserState).filter(UserState.user_id == 333).first()
         assert loaded is not None
         assert loaded.data == {"key": "value"}
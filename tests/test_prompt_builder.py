@@ -40,6 +40,12 @@ class TestNewPromptBuilder:
         assert "primary" in result["colors"]
         assert result["style"] in ("modern", "elegant")
 
+    def test_analyze_product_cached_across_instances(self, builder):
+        """Подбор стиля по тем же названию и описанию не пересчитывается"""
+        result = builder._analyze_product_and_suggest_style("Матрас", "для сна")
+        assert NewPromptBuilder()._analyze_product_and_suggest_style("Матрас", "для сна") is result
+        assert NewPromptBuilder()._analyze_product_and_suggest_style("Матрас", "") is not result
+
     def test_build_prompt_minimal_user_data(self, builder):
         """Промпт строится при минимальных данных"""
         user_data = {
@@ -1,6 +1,8 @@
 """
 Тесты для backend.utils.rate_limiter (RateLimiter)
 """
+import time
+
 import pytest
 from unittest.mock import MagicMock, patch
 
@@ -110,3 +112,58 @@ class TestRateLimiterDb:
         assert allowed is True
         assert remaining == 3
         mock_db.close.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_db_denial_cached_briefly(self):
+        limiter = RateLimiter(max_requests=1, per_seconds=3600)
+        mock_db = MagicMock()
+        mock_query = MagicMock()
+        mock_query.filter.return_value = mock_query
+        mock_query.count.return_value = 1
+        mock_db.query.return_value = mock_query
+
+        with patch("backend.utils.rate_limiter.SessionLocal", return_value=mock_db):
+            assert await limiter.check_db_rate_limit(7) == (False, 0)
+            assert await limiter.check_db_rate_limit(7) == (False, 0)
+            assert mock_query.count.call_count == 1
+
+            # Отказ истёк — снова проверяем по БД
+            with patch("backend.utils.rate_limiter.time.monotonic", return_value=time.monotonic() + 60):
+                mock_query.count.return_value = 0
+                assert await limiter.check_db_rate_limit(7) == (True, 1)
+            assert mock_query.count.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_db_allowance_spent_locally(self):
+        limiter = RateLimiter(max_requests=3, per_seconds=3600)
+        mock_db = MagicMock()
+        mock_query = MagicMock()
+        mock_query.filter.return_value = mock_query
+        mock_query.count.return_value = 1
+        mock_db.query.return_value = mock_query
+
+        with patch("backend.utils.rate_limiter.SessionLocal", return_value=mock_db):
+            assert await limiter.check_db_rate_limit(7) == (True, 2)
+            assert await limiter.check_db_rate_limit(7) == (True, 1)
+            assert mock_query.count.call_count == 1
+
+            # Остаток исчерпан — решение снова принимает БД
+            mock_query.count.return_value = 3
+            assert await limiter.check_db_rate_limit(7) == (False, 0)
+            assert mock_query.count.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_db_allowance_expires(self):
+        limiter = RateLimiter(max_requests=3, per_seconds=3600)
+        mock_db = MagicMock()
+        mock_query = MagicMock()
+        mock_query.filter.return_value = mock_query
+        mock_query.count.return_value = 0
+        mock_db.query.return_value = mock_query
+
+        with patch("backend.utils.rate_limiter.SessionLocal", return_value=mock_db):
+            await limiter.check_db_rate_limit(7)
+            with patch("backend.utils.rate_limiter.time.monotonic", return_value=time.monotonic() + 120):
+                mock_query.count.return_value = 2
+                assert await limiter.check_db_rate_limit(7) == (True, 1)
+            assert mock_query.count.call_count == 2
@@ -0,0 +1,103 @@
+"""
+Тесты хранилища состояния диалога в Redis (RedisUserStateStore)
+"""
+import pytest
+from unittest.mock import patch
+
+from backend.database.redis_store import RedisUserStateStore, AI_AGENTS_KEY
+from backend.bot.telegram_bot import LandingBot
+from tests.mocks.mock_ai_agent import MockLandingAIAgent
+from tests.mocks.mock_redis import MockRedis
+
+
+@pytest.fixture
+def store():
+    return RedisUserStateStore(MockRedis(), ttl=60)
+
+
+@pytest.fixture
+async def bot(store, mock_application):
+    """Бот, у которого состояние хранится в Redis (БД не должна использоваться)"""
+    with patch("backend.bot.telegram_bot.init_db"):
+        bot = LandingBot()
+    bot._state_store = store
+    with patch.object(bot, "_session", side_effect=AssertionError("DB should not be hit")):
+        yield bot
+
+
+class TestRedisUserStateStore:
+    """Тесты RedisUserStateStore"""
+
+    def test_save_and_load(self, store):
+        store.save(1, {"a": "т"}, state="S", conversation_type="create")
+        assert store.load(1) == {"data": {"a": "т"}, "state": "S", "conversation_type": "create"}
+        assert store.client.ttls["us:1"] == 60
+
+    def test_load_missing_returns_none(self, store):
+        assert store.load(1) is None
+
+    def test_none_state_keeps_saved_values(self, store):
+        store.save(1, {}, state="AI_CONVERSATION", conversation_type="ai_agent")
+        store.save(1, {"b": 2})
+        assert store.load(1)["state"] == "AI_CONVERSATION"
+        assert store.load(1)["conversation_type"] == "ai_agent"
+
+    def test_ai_agents_set_follows_state(self, store):
+        store.save(1, {"x": 1}, state="AI_CONVERSATION", conversation_type="ai_agent")
+        store.save(2, {"x": 2}, state="COLLECTING", conversation_type="create")
+        assert list(store.iter_ai_agents()) == [(1, {"x": 1})]
+
+        store.delete(1)
+        assert store.load(1) is None
+        assert list(store.iter_ai_agents()) == []
+
+    def test_expired_agents_dropped_from_set(self, store):
+        store.save(1, {}, state="AI_CONVERSATION", conversation_type="ai_agent")
+        store.client.delete("us:1")  # ключ истёк по TTL
+        assert list(store.iter_ai_agents()) == []
+        assert store.client.smembers(AI_AGENTS_KEY) == set()
+
+    def test_from_config_without_url(self):
+        with patch("backend.database.redis_store.Config.REDIS_URL", ""):
+            assert RedisUserStateStore.from_config() is None
+
+    def test_from_config_without_redis_package(self):
+        with patch("backend.database.redis_store.Config.REDIS_URL", "redis://localhost:6379/0"):
+            with patch("backend.database.redis_store.redis", None):
+                assert RedisUserStateStore.from_config() is None
+
+
+class TestBotWithRedisStore:
+    """LandingBot с состоянием в Redis"""
+
+    def test_save_update_get_clear(self, bot):
+        bot._save_user_data(1, {"a": 1}, state="COLLECTING", conversation_type="create")
+        bot._update_user_data(1, b=2)
+        bot._user_data_cache.clear()
+        assert bot._get_user_data(1) == {"a": 1, "b": 2}
+        assert bot._state_store.load(1)["state"] == "COLLECTING"
+
+        bot._clear_user_data(1)
+        assert bot._get_user_data(1) == {}
+
+    async def test_ai_agent_saved_and_restored(self, bot):
+        bot._save_ai_agent_state(7, MockLandingAIAgent(7, mode="SINGLE"))
+        assert bot._state_store.load(7)["state"] == "AI_CONVERSATION"
+
+        with patch("backend.bot.telegram_bot.LandingAIAgent", MockLandingAIAgent):
+            await bot._restore_ai_agents_from_db()
+        assert bot.ai_agents[7].chat_id == 7
+        bot.app.bot.send_message.assert_awaited_once()
+
+    async def test_agent_loaded_lazily_from_shared_state(self, bot):
+        """Агент, сохранённый другой репликой, поднимается по первому апдейту пользователя"""
+        bot._save_ai_agent_state(7, MockLandingAIAgent(7, mode="SINGLE"))
+        bot._user_data_cache.clear()
+        bot.ai_agents.clear()
+
+        with patch("backend.bot.telegram_bot.LandingAIAgent", MockLandingAIAgent):
+            entry = await bot._get_ai_agent_entry(7, chat_id=70)
+        assert entry is bot.ai_agents[7]
+        assert entry.agent.mode == "SINGLE"
+        assert entry.chat_id == 70
+        assert await bot._get_ai_agent_entry(8) is None
@@ -0,0 +1,166 @@
+"""
+Тесты подготовки данных для генерации в LandingBot._start_generation
+"""
+import asyncio
+
+import pytest
+from telegram import InputFile
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from backend.bot.telegram_bot import LandingBot, _copy_photo
+from backend.database.models import User, Project, Generation
+
+
+@pytest.fixture
+async def bot(test_db_session, mock_application):
+    with patch("backend.bot.telegram_bot.SessionLocal", return_value=test_db_session):
+        with patch("backend.bot.telegram_bot.init_db"):
+            bot = LandingBot()
+            bot.code_generator = MagicMock()
+            bot.code_generator.generate = AsyncMock(return_value={"success": False, "error": "boom"})
+            yield bot
+
+
+@pytest.mark.asyncio
+async def test_new_structure_fields_and_photos(bot, mock_update, mock_context):
+    user_id = mock_update.effective_user.id
+    bot._save_user_data(user_id, {
+        'landing_type': 'single_product',
+        'product_name': 'Кроссовки',
+        'description_text': 'Удобные',
+        'middle_gallery': [{'path': '/tmp/a.jpg'}, '/tmp/b.jpg'],
+        'description_photos': [{'path': '/tmp/c.jpg'}],
+        'old_price': '200 BYN',
+        'new_price': '100 BYN',
+    })
+
+    await bot._start_generation(mock_update, mock_context, user_id)
+
+    template_id, user_data = bot.code_generator.generate.call_args.args
+    assert template_id == 'single_product'
+    assert user_data['product_name'] == 'Кроссовки'
+    assert user_data['hero_aspect_ratio'] == '3:4'
+    assert user_data['sizes'] == []
+    assert user_data['product_description'] == 'Удобные'
+    assert user_data['photos'] == ['/tmp/a.jpg', '/tmp/b.jpg', '/tmp/c.jpg']
+    assert user_data['discount_percent'] == 50
+    # Данные пользователя очищаются после генерации
+    assert bot._get_user_data(user_id) == {}
+
+
+@pytest.mark.asyncio
+async def test_generation_records_saved_in_one_commit(bot, mock_update, mock_context, test_db_session):
+    user_id = mock_update.effective_user.id
+    bot._save_user_data(user_id, {'landing_type': 'single_product', 'product_name': 'Кроссовки'})
+
+    with patch.object(test_db_session, "commit", wraps=test_db_session.commit) as commit:
+        await bot._start_generation(mock_update, mock_context, user_id)
+
+    # Пользователь, проект и генерация — одна транзакция (плюс очистка данных пользователя)
+    assert commit.call_count <= 2
+    project = test_db_session.query(Project).one()
+    generation = test_db_session.query(Generation).one()
+    assert generation.project_id == project.id
+    assert project.status == 'failed'
+    assert test_db_session.query(User).filter(User.telegram_id == str(user_id)).count() == 1
+
+
+def test_copy_photo_skips_missing_source(tmp_path):
+    src = tmp_path / "a.jpg"
+    src.write_bytes(b"jpeg")
+    assert _copy_photo(str(src), str(tmp_path / "product_1.jpg")) is True
+    assert (tmp_path / "product_1.jpg").read_bytes() == b"jpeg"
+    assert _copy_photo(str(tmp_path / "missing.jpg"), str(tmp_path / "product_2.jpg")) is False
+    assert not (tmp_path / "product_2.jpg").exists()
+
+
+@pytest.mark.asyncio
+async def test_zip_sent_as_streamed_file_handle(bot, mock_update, mock_context, tmp_path):
+    zip_path = tmp_path / "landing.zip"
+    zip_path.write_bytes(b"PK\x03\x04")
+    bot.code_generator.generate = AsyncMock(return_value={
+        "success": True,
+        "files": {"zip_file": str(zip_path), "project_dir": str(tmp_path)},
+    })
+    mock_context.bot.send_document = AsyncMock()
+    user_id = mock_update.effective_user.id
+    bot._save_user_data(user_id, {'landing_type': 'single_product', 'product_name': 'Кроссовки'})
+
+    await bot._start_generation(mock_update, mock_context, user_id)
+
+    document = mock_context.bot.send_document.call_args.kwargs["document"]
+    assert isinstance(document, InputFile)
+    # Содержимое не прочитано в память — передаётся сам файловый объект
+    assert hasattr(document.input_file_content, "read")
+    assert document.filename == "landing_Кроссовки.zip"
+    # Итог генерации — в подписи к архиву, отдельного сообщения нет
+    caption = mock_context.bot.send_document.call_args.kwargs["caption"]
+    assert caption.startswith("✅ *Лендинг успешно создан!*")
+    assert "single\\_product" in caption
+    mock_context.bot.send_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_missing_zip_reported_without_document(bot, mock_update, mock_context, tmp_path):
+    bot.code_generator.generate = AsyncMock(return_value={
+        "success": True,
+        "files": {"zip_file": str(tmp_path / "missing.zip"), "project_dir": str(tmp_path)},
+    })
+    mock_context.bot.send_document = AsyncMock()
+    user_id = mock_update.effective_user.id
+    bot._save_user_data(user_id, {'landing_type': 'single_product', 'product_name': 'Кроссовки'})
+
+    await bot._start_generation(mock_update, mock_context, user_id)
+
+    mock_context.bot.send_document.assert_not_called()
+    assert "проблема с архивом" in mock_context.bot.send_message.call_args.kwargs["text"]
+
+
+@pytest.mark.asyncio
+async def test_send_landing_zip_streams_file_or_reports_missing(bot, tmp_path):
+    zip_path = tmp_path / "landing.zip"
+    zip_path.write_bytes(b"PK\x03\x04")
+    bot.app.bot.send_document = AsyncMock()
+
+    assert await bot._send_landing_zip(1, str(zip_path)) is True
+    document = bot.app.bot.send_document.call_args.kwargs["document"]
+    assert hasattr(document.input_file_content, "read")
+    assert document.filename == "landing.zip"
+
+    assert await bot._send_landing_zip(1, str(tmp_path / "missing.zip")) is False
+    assert await bot._send_landing_zip(1, None) is False
+    bot.app.bot.send_document.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_old_structure_footer_from_data_and_extra_fields(bot, mock_update, mock_context):
+    user_id = mock_update.effective_user.id
+    bot._save_user_data(user_id, {
+        'product_name': 'Курс',
+        'phone': '+375291111111',
+        'extra_fields': {'unp': '123456789', 'phone': '+375292222222', 'color': 'red'},
+    })
+
+    await bot._start_generation(mock_update, mock_context, user_id)
+
+    _, user_data = bot.code_generator.generate.call_args.args
+    # Значение из data приоритетнее extra_fields, посторонние поля в подвал не попадают
+    assert user_data['footer_info'] == {'unp': '123456789', 'phone': '+375291111111'}
+    assert user_data['phone'] == '+375291111111'
+
+
+@pytest.mark.asyncio
+async def test_cleanup_removes_photos_dir_in_background(bot, mock_update, tmp_path):
+    user_id = mock_update.effective_user.id
+    photos_dir = tmp_path / "photos"
+    photos_dir.mkdir()
+    (photos_dir / "a.jpg").write_bytes(b"jpeg")
+    bot._save_user_data(user_id, {'photos_dir': str(photos_dir)})
+
+    await bot._cleanup_user_data(user_id)
+    # Задача удаления удерживается ботом до завершения (может успеть завершиться раньше)
+    await asyncio.gather(*bot._background_tasks)
+    assert not bot._background_tasks
+
+    assert not photos_dir.exists()
+    assert bot._get_user_data(user_id) == {}
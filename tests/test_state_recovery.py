@@ -4,7 +4,7 @@
 import pytest
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from backend.database.models import UserState
-from backend.bot.telegram_bot import LandingBot
+from backend.bot.telegram_bot import LandingBot, AgentEntry
 from tests.mocks.mock_ai_agent import MockLandingAIAgent
 
 
@@ -60,7 +60,7 @@ class TestStateRecovery:
     
     def test_save_ai_agent_state_to_db(self, test_db_session, sample_ai_agent_state):
         """Тест: сохранение состояния AI-агента в БД"""
-        user_id = "12345"
+        user_id = 12345
         
         # Создаем UserState с данными агента
         user_state = UserState(
@@ -87,7 +87,7 @@ class TestStateRecovery:
     
     def test_restore_ai_agent_from_db(self, test_db_session, sample_ai_agent_state):
         """Тест: восстановление AI-агента из БД"""
-        user_id = "12345"
+        user_id = 12345
         
         # Сохраняем состояние в БД
         user_state = UserState(
@@ -111,7 +111,7 @@ class TestStateRecovery:
         agent_state = retrieved_state.data["ai_agent_state"]
         
         # Восстанавливаем агента
-        agent = MockLandingAIAgent.from_serialized_state(agent_state, user_id=int(user_id))
+        agent = MockLandingAIAgent.from_serialized_state(agent_state, user_id=user_id)
         
         # Проверяем восстановление
         assert agent.mode == "SINGLE"
@@ -123,7 +123,7 @@ class TestStateRecovery:
         """Тест: восстановление всех AI-агентов при старте бота"""
         # Создаем несколько записей в БД
         for i in range(3):
-            user_id = f"1234{i}"
+            user_id = 12340 + i
             state_copy = sample_ai_agent_state.copy()
             state_copy['collected_data']['general_info']['goal'] = f'goal_{i}'
             
@@ -148,7 +148,7 @@ class TestStateRecovery:
     
     def test_restore_with_missing_data(self, test_db_session):
         """Тест: восстановление при отсутствии данных агента"""
-        user_id = "12345"
+        user_id = 12345
         
         # Создаем запись без ai_agent_state
         user_state = UserState(
@@ -171,7 +171,7 @@ class TestStateRecovery:
     
     def test_restore_with_invalid_state(self, test_db_session):
         """Тест: восстановление при некорректном состоянии"""
-        user_id = "12345"
+        user_id = 12345
         
         # Создаем запись с некорректными данными
         user_state = UserState(
@@ -203,7 +203,7 @@ class TestStateRecovery:
     
     def test_restore_conversation_history(self, test_db_session, sample_ai_agent_state):
         """Тест: восстановление истории диалога"""
-        user_id = "12345"
+        user_id = 12345
         
         # Добавляем историю диалога
         sample_ai_agent_state['conversation_history'] = [
@@ -239,7 +239,7 @@ class TestStateRecovery:
     
     def test_restore_last_activity(self, test_db_session, sample_ai_agent_state):
         """Тест: восстановление времени последней активности"""
-        user_id = "12345"
+        user_id = 12345
         last_activity = 1234567890.0
         
         user_state = UserState(
@@ -262,3 +262,82 @@ class TestStateRecovery:
         # Проверяем восстановление времени активности
         assert retrieved.data["last_activity"] == last_activity
 
+    @pytest.mark.asyncio
+    async def test_restore_ai_agents_batch(self, bot_instance, test_db_session, sample_ai_agent_state):
+        """Тест: восстановление одним запросом, chat_id берётся из User, уведомления отправлены всем"""
+        from backend.database.models import User
+        for i in range(3):
+            test_db_session.add(UserState(
+                user_id=12340 + i,
+                state="AI_CONVERSATION",
+                data={"ai_agent_state": sample_ai_agent_state, "last_activity": 1234567890.0},
+                conversation_type="ai_agent"
+            ))
+            test_db_session.add(User(telegram_id=12340 + i))
+        test_db_session.commit()
+
+        with patch('backend.bot.telegram_bot.LandingAIAgent', MockLandingAIAgent):
+            await bot_instance._restore_ai_agents_from_db()
+
+        assert set(bot_instance.ai_agents) == {12340, 12341, 12342}
+        assert bot_instance.ai_agents[12341].last_activity == 1234567890.0
+        assert bot_instance.ai_agents[12341].chat_id == 12341
+        chat_ids = {c.kwargs['chat_id'] for c in bot_instance.app.bot.send_message.call_args_list}
+        assert chat_ids == {12340, 12341, 12342}
+
+    def test_registry_unloads_least_active_agents(self, bot_instance):
+        """Тест: при превышении MAX_AI_AGENTS из памяти выгружаются самые давно неактивные агенты (LRU)"""
+        with patch('backend.bot.telegram_bot.Config.MAX_AI_AGENTS', 2):
+            bot_instance._register_ai_agent(1, AgentEntry(MockLandingAIAgent(1, mode='SINGLE'), 100.0))
+            bot_instance._register_ai_agent(2, AgentEntry(MockLandingAIAgent(2, mode='SINGLE'), 50.0))
+            bot_instance._touch_ai_agent(1, bot_instance.ai_agents[1])
+            bot_instance._register_ai_agent(3, AgentEntry(MockLandingAIAgent(3, mode='SINGLE'), 10.0))
+        # Новый агент не вытесняется, даже если его last_activity старше
+        assert list(bot_instance.ai_agents) == [1, 3]
+        assert bot_instance.ai_agents[1].last_activity > 100.0
+
+    def test_expiry_heap_skips_active_and_removed_agents(self, bot_instance):
+        """Тест: куча сроков выдаёт только простаивающих агентов; активных переносит, удалённых отбрасывает"""
+        for user_id in (1, 2, 3):
+            bot_instance._register_ai_agent(user_id, AgentEntry(MockLandingAIAgent(user_id, mode='SINGLE'), 0.0))
+        bot_instance.ai_agents[2].last_activity = 1000.0
+        del bot_instance.ai_agents[3]
+
+        assert bot_instance._pop_expired_ai_agents(1800.0 + 1) == [1]
+        assert bot_instance._expiry_heap == [(2800.0, 2)]
+        assert bot_instance._expiry_tracked == {2}
+        assert bot_instance._pop_expired_ai_agents(2000.0) == []
+
+    async def test_agent_unloaded_on_overflow_still_expires(self, bot_instance):
+        """Тест: агент, выгруженный из переполненного реестра, по истечении простоя теряет файлы и состояние"""
+        with patch('backend.bot.telegram_bot.Config.MAX_AI_AGENTS', 1):
+            for user_id, last_activity in ((1, 0.0), (2, 1000.0)):
+                agent = MockLandingAIAgent(user_id, mode='SINGLE')
+                bot_instance._save_ai_agent_state(user_id, agent)
+                bot_instance._register_ai_agent(user_id, AgentEntry(agent, last_activity))
+        assert list(bot_instance.ai_agents) == [2]
+
+        assert bot_instance._pop_expired_ai_agents(1000.0) == []
+        expired = bot_instance._pop_expired_ai_agents(1800.0 + 1)
+        assert expired == [1]
+        with patch.object(bot_instance, '_cleanup_ai_agent_files') as cleanup:
+            await bot_instance._unload_inactive_ai_agents(expired)
+        cleanup.assert_called_once_with(1)
+        bot_instance._user_data_cache.clear()
+        assert 'ai_agent_state' not in bot_instance._get_user_data(1)
+        assert bot_instance._unloaded_activity == {}
+
+    async def test_inactive_agents_unloaded_with_state_cleared(self, bot_instance):
+        """Тест: выгрузка неактивных агентов удаляет их состояние одной транзакцией, не трогая прочие данные"""
+        for user_id in (1, 2):
+            agent = MockLandingAIAgent(user_id, mode='SINGLE')
+            bot_instance._register_ai_agent(user_id, AgentEntry(agent, 0.0))
+            bot_instance._save_ai_agent_state(user_id, agent)
+            bot_instance._update_user_data(user_id, chat_id=user_id, last_activity=0.0)
+
+        await bot_instance._unload_inactive_ai_agents([1, 2])
+
+        assert bot_instance.ai_agents == {}
+        bot_instance._user_data_cache.clear()
+        for user_id in (1, 2):
+            assert bot_instance._get_user_data(user_id) == {'chat_id': user_id}
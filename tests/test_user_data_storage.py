@@ -0,0 +1,305 @@
+"""
+Тесты хранения данных пользователя (UserState) через методы LandingBot
+"""
+import threading
+from copy import deepcopy
+
+import pytest
+from unittest.mock import patch
+
+from backend.database.models import UserState
+from backend.bot.telegram_bot import LandingBot, AgentEntry
+from backend.bot.ai_agent import LandingAIAgent
+from backend.utils.helpers import json_dumps
+from tests.mocks.mock_ai_agent import MockLandingAIAgent
+
+
+@pytest.fixture
+async def bot(test_db_session, mock_application):
+    """Бот, у которого все сессии БД указывают на in-memory SQLite"""
+    with patch("backend.bot.telegram_bot.SessionLocal", return_value=test_db_session):
+        with patch("backend.bot.telegram_bot.init_db"):
+            yield LandingBot()
+
+
+class TestUserDataStorage:
+    """Тесты _save_user_data / _get_user_data / _update_user_data / _clear_user_data"""
+
+    def test_save_and_get(self, bot):
+        bot._save_user_data(1, {"a": 1}, state="S", conversation_type="ai_agent")
+        assert bot._get_user_data(1) == {"a": 1}
+
+    def test_handler_data_is_a_copy(self, bot):
+        bot._save_user_data(1, {"gallery": [1]})
+        data = bot.hero_handler.get_user_data(1)
+        data["gallery"].append(2)
+        assert bot._get_user_data(1) == {"gallery": [1]}
+
+    def test_get_missing_user_returns_empty(self, bot):
+        assert bot._get_user_data(404) == {}
+
+    def test_update_merges_fields(self, bot, test_db_session):
+        bot._save_user_data(1, {"a": 1}, state="S")
+        bot._update_user_data(1, b=2)
+        assert bot._get_user_data(1) == {"a": 1, "b": 2}
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert row.state == "S"
+
+    def test_update_creates_missing_record(self, bot):
+        bot._update_user_data(2, ai_mode="SINGLE")
+        assert bot._get_user_data(2) == {"ai_mode": "SINGLE"}
+
+    def test_clear(self, bot):
+        bot._save_user_data(1, {"a": 1})
+        bot._clear_user_data(1)
+        assert bot._get_user_data(1) == {}
+
+    def test_session_rolls_back_on_error(self, bot, test_db_session):
+        with patch.object(test_db_session, "rollback", wraps=test_db_session.rollback) as rollback:
+            with pytest.raises(RuntimeError):
+                with bot._session():
+                    raise RuntimeError("boom")
+            rollback.assert_called_once()
+
+    def test_get_served_from_cache_after_save(self, bot):
+        bot._save_user_data(1, {"a": 1})
+        with patch.object(bot, "_session", side_effect=AssertionError("DB should not be hit")):
+            assert bot._get_user_data(1) == {"a": 1}
+
+    def test_cached_data_not_shared_with_caller(self, bot):
+        data = {"nested": {"x": 1}}
+        bot._save_user_data(1, data)
+        data["nested"]["x"] = 2
+        got = bot._get_user_data(1, copy=True)
+        got["nested"]["x"] = 3
+        assert bot._get_user_data(1) == {"nested": {"x": 1}}
+
+    def test_get_copies_unless_opted_out(self, bot):
+        bot._save_user_data(1, {"a": [1]})
+        assert bot._get_user_data(1, copy=False) is bot._get_user_data(1, copy=False)
+        data = bot._get_user_data(1)
+        assert data is not bot._get_user_data(1, copy=False)
+        data["a"].append(2)
+        assert bot._get_user_data(1) == {"a": [1]}
+
+    def test_clear_evicts_cache(self, bot):
+        bot._save_user_data(1, {"a": 1})
+        bot._clear_user_data(1)
+        assert 1 not in bot._user_data_cache
+
+    async def test_async_wrappers_run_off_event_loop_thread(self, bot):
+        threads = []
+        original = bot._save_user_data
+
+        def recording_save(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return original(*args, **kwargs)
+
+        with patch.object(bot, "_save_user_data", side_effect=recording_save):
+            await bot._save_user_data_async(1, {"a": 1})
+        await bot._update_user_data_async(1, b=2)
+        assert await bot._get_user_data_async(1) == {"a": 1, "b": 2}
+        assert threads and threads[0] != threading.get_ident()
+
+        await bot._clear_user_data_async(1)
+        assert await bot._get_user_data_async(1) == {}
+
+    def test_ai_agent_state_stored_compressed(self, bot, test_db_session):
+        bot._save_user_data(1, {"a": 1, "ai_agent_state": {"mode": "SINGLE"}})
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert "ai_agent_state" not in row.data
+        assert row.agent_blob is not None
+
+        bot._user_data_cache.clear()
+        assert bot._get_user_data(1) == {"a": 1, "ai_agent_state": {"mode": "SINGLE"}}
+
+        # Удаление ai_agent_state из данных очищает agent_blob
+        bot._save_user_data(1, {"a": 1})
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert row.agent_blob is None
+
+    def test_legacy_ai_agent_state_in_data_is_readable(self, bot, test_db_session):
+        test_db_session.add(UserState(user_id=1, data={"ai_agent_state": {"mode": "SINGLE"}}))
+        test_db_session.commit()
+        assert bot._get_user_data(1)["ai_agent_state"] == {"mode": "SINGLE"}
+
+    def test_unchanged_save_skips_write(self, bot):
+        bot._save_user_data(1, {"a": 1}, state="S")
+        with patch.object(bot, "_write_user_state") as write:
+            bot._save_user_data(1, {"a": 1})  # совпадает с кэшем — без запроса к БД
+            bot._user_data_cache.clear()
+            bot._save_user_data(1, {"a": 1}, state="S")  # совпадает с записью в БД
+            write.assert_not_called()
+            bot._save_user_data(1, {"a": 1}, state="T")
+            write.assert_called_once()
+
+    def test_unchanged_save_does_not_unpack_agent_blob(self, bot):
+        data = {"a": 1, "ai_agent_state": {"mode": "SINGLE"}}
+        bot._save_user_data(1, data, state="S")
+        with patch.object(bot, "_write_user_state") as write, \
+                patch("backend.bot.telegram_bot.unpack_json", side_effect=AssertionError("blob unpacked")):
+            bot._save_user_data(1, dict(data), state="S")  # состояние агента совпадает с кэшем
+            write.assert_not_called()
+            bot._user_data_cache.clear()
+            bot._save_user_data(1, dict(data), state="S")  # без кэша — перезаписываем, не распаковывая
+            write.assert_called_once()
+
+    def test_unchanged_ai_agent_state_not_rewritten(self, bot):
+        agent = MockLandingAIAgent(1, mode="SINGLE")
+        bot._save_ai_agent_state(1, agent)
+        with patch.object(bot, "_merge_user_data", wraps=bot._merge_user_data) as merge:
+            bot._save_ai_agent_state(1, agent)
+            merge.assert_not_called()
+
+            agent.stage = "products"
+            agent.dirty = True
+            bot._save_ai_agent_state(1, agent)
+            assert merge.call_count == 1
+
+            # Другая запись данных пользователя сбрасывает снимок — следующее сохранение пишет
+            bot._update_user_data(1, b=2)
+            bot._save_ai_agent_state(1, agent)
+            assert merge.call_count == 3
+        assert bot._get_user_data(1)["ai_agent_state"]["stage"] == "products"
+
+    async def test_cached_read_skips_worker_thread(self, bot):
+        bot._save_user_data(1, {"a": [1]})
+        with patch("backend.bot.telegram_bot.asyncio.to_thread", side_effect=AssertionError("no thread hop expected")):
+            data = await bot._get_user_data_async(1)
+            copy = await bot._get_user_data_async(1, copy=True)
+        assert data == copy == {"a": [1]}
+        copy["a"].append(2)
+        assert bot._get_user_data(1) == {"a": [1]}
+
+    def test_update_patches_keys_in_db_without_reading_row(self, bot, test_db_session):
+        bot._save_user_data(1, {"a": {"x": 1}, "b": "т"}, state="S")
+        with patch.object(bot, "_query_user_state", side_effect=AssertionError("row should not be read")):
+            bot._update_user_data(1, a={"y": 2}, c=None, d=[1, "два"])
+        expected = {"a": {"y": 2}, "b": "т", "c": None, "d": [1, "два"]}
+        assert bot._get_user_data(1) == expected
+        test_db_session.expire_all()
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert row.data == expected and row.state == "S"
+
+    def test_clear_ai_agent_state_of_cached_user_without_select(self, bot, test_db_session):
+        agent = MockLandingAIAgent(1, mode="SINGLE")
+        bot._save_ai_agent_state(1, agent)
+        bot._update_user_data(1, chat_id=5, last_activity=1.0)
+        with patch("backend.bot.telegram_bot.select", side_effect=AssertionError("SELECT not expected")):
+            bot._clear_ai_agent_states([1])
+        assert bot._get_user_data(1) == {"chat_id": 5}
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert row.agent_blob is None and row.data == {"chat_id": 5}
+        assert row.state == "AI_CONVERSATION"
+
+    def test_clear_ai_agent_states_of_uncached_users_in_one_update(self, bot, test_db_session):
+        for user_id in (1, 2):
+            bot._save_ai_agent_state(user_id, MockLandingAIAgent(user_id, mode="SINGLE"))
+            bot._update_user_data(user_id, chat_id=user_id, ai_agent_active=True)
+        bot._user_data_cache.clear()
+        with patch("backend.bot.telegram_bot.select", side_effect=AssertionError("SELECT not expected")):
+            bot._clear_ai_agent_states([1, 2, 3])
+        test_db_session.expire_all()
+        rows = test_db_session.query(UserState).order_by(UserState.user_id).all()
+        assert [(row.data, row.agent_blob) for row in rows] == [({"chat_id": 1}, None), ({"chat_id": 2}, None)]
+
+    async def test_clean_ai_agent_not_serialized(self, bot):
+        agent = MockLandingAIAgent(1, mode="SINGLE")
+        bot._save_ai_agent_state(1, agent)
+        assert not agent.dirty
+        with patch.object(agent, "serialize_state", wraps=agent.serialize_state) as serialize:
+            bot._save_ai_agent_state(1, agent)
+            serialize.assert_not_called()
+
+            # Новое сообщение пользователя помечает агента изменённым
+            await agent.process_message("привет")
+            bot._save_ai_agent_state(1, agent)
+            serialize.assert_called_once()
+        assert not agent.dirty
+
+    async def test_background_save_during_turn_does_not_lose_reply(self, bot):
+        """Сохранение, выполненное во время await внутри хода, не мешает записать завершённый ход"""
+        with patch("backend.bot.ai_agent.LLMClient"):
+            agent = LandingAIAgent("SINGLE")
+        bot._save_ai_agent_state(1, agent)
+
+        async def generate_response():
+            bot._save_ai_agent_state(1, agent)  # фоновый save посреди хода
+            return "Ответ"
+
+        with patch.object(agent, "_extract_data", return_value={}), \
+                patch.object(agent, "_generate_response", side_effect=generate_response), \
+                patch.object(agent, "_check_stage_transition"):
+            await agent.process_message("привет", user_id=1)
+        assert agent.dirty
+        bot._save_ai_agent_state(1, agent)
+
+        bot._user_data_cache.clear()
+        history = bot._get_user_data(1)["ai_agent_state"]["conversation_history"]
+        assert history[-1] == {"role": "assistant", "content": "Ответ"}
+
+    async def test_restored_agent_does_not_mutate_cache(self, bot):
+        """Агент, поднятый из сохранённого состояния, меняет свою копию, а не запись в кэше"""
+        with patch("backend.bot.ai_agent.LLMClient"):
+            bot._save_ai_agent_state(1, LandingAIAgent("SINGLE"))
+            cached = deepcopy(bot._get_user_data(1))
+            bot.ai_agents.clear()
+            entry = await bot._get_ai_agent_entry(1)
+        with patch.object(entry.agent, "_extract_data", return_value={"goal": "продажа"}), \
+                patch.object(entry.agent, "_generate_response", return_value="Ответ"), \
+                patch.object(entry.agent, "_check_stage_transition"):
+            await entry.agent.process_message("привет", user_id=1)
+        assert bot._user_data_cache.get(1) == cached
+
+    def test_ai_agent_save_serializes_once_and_skips_old_blob(self, bot):
+        agent = MockLandingAIAgent(1, mode="SINGLE")
+        bot._save_ai_agent_state(1, agent)
+        agent.stage = "products"
+        agent.dirty = True
+        with patch("backend.bot.telegram_bot.unpack_json") as unpack, \
+                patch("backend.bot.telegram_bot.json_dumps", wraps=json_dumps) as dumps, \
+                patch("backend.bot.telegram_bot.pack_json") as pack:
+            bot._save_ai_agent_state(1, agent)
+        unpack.assert_not_called()
+        pack.assert_not_called()
+        assert dumps.call_count == 1
+        # Кэш не ссылается на живой агент
+        cached = bot._get_user_data(1)["ai_agent_state"]
+        assert cached["stage"] == "products" and cached["collected_data"] is not agent.collected_data
+        bot._user_data_cache.clear()
+        assert bot._get_user_data(1)["ai_agent_state"]["stage"] == "products"
+
+    async def test_scheduled_agent_saves_coalesce(self, bot):
+        agent = MockLandingAIAgent(1, mode="SINGLE")
+        with patch("backend.bot.telegram_bot.AI_AGENT_SAVE_DELAY", 0), \
+                patch.object(bot, "_save_ai_agent_state", wraps=bot._save_ai_agent_state) as save:
+            bot._schedule_ai_agent_save(1, agent)
+            agent.stage = "products"
+            bot._schedule_ai_agent_save(1, agent)
+            save.assert_not_called()  # запись не на пути ответа
+            await bot._flush_ai_agent_saves(1)
+        save.assert_called_once_with(1, agent)
+        assert bot._get_user_data(1)["ai_agent_state"]["stage"] == "products"
+        assert not bot._agent_save_tasks
+
+    async def test_discarded_agent_save_not_written(self, bot):
+        with patch("backend.bot.telegram_bot.AI_AGENT_SAVE_DELAY", 0):
+            bot._schedule_ai_agent_save(1, MockLandingAIAgent(1, mode="SINGLE"))
+            await bot._discard_ai_agent_save(1)
+        assert bot._get_user_data(1) == {}
+
+    def test_flush_ai_activity_batches_dirty_timestamps(self, bot, test_db_session):
+        bot._save_user_data(1, {"a": 1})
+        bot._save_user_data(2, {"b": 2})
+        bot.ai_agents[1] = AgentEntry(object(), 100.0)
+        bot.ai_agents[2] = AgentEntry(object(), 200.0, saved_activity=200.0)
+
+        bot._flush_ai_activity()
+        assert bot._get_user_data(1) == {"a": 1, "last_activity": 100.0}
+        assert bot._get_user_data(2) == {"b": 2}
+        row = test_db_session.query(UserState).filter(UserState.user_id == 1).first()
+        assert row.data == {"a": 1, "last_activity": 100.0}
+
+        # Без новых сообщений повторный сброс ничего не пишет
+        with patch.object(bot, "_session", side_effect=AssertionError("DB should not be hit")):
+            bot._flush_ai_activity()